@@ -0,0 +1,500 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# --- Audio Cache Configuration ---
+# The cache lives in a single SQLite file so every gunicorn worker on the node
+# shares it, and it survives worker restarts. Point AUDIO_CACHE_PATH at a
+# mounted volume to keep it across deploys as well.
+DEFAULT_AUDIO_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'read_serene_audio_cache.sqlite3')
+DEFAULT_AUDIO_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+DEFAULT_AUDIO_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+# Entries are filed under a partition (the document they were synthesized for).
+# <prefix>_DOCUMENT_MAX_BYTES caps each partition, so one busy book cannot push
+# every other book's audio out; by default a partition may use the whole budget.
+
+STAT_NAMES = ('hits', 'misses', 'evictions', 'expirations', 'coalesced', 'lease_waits', 'invalidations')
+# A hit only moves an entry's last_access once it is this much out of date, so
+# most reads write nothing; LRU order is kept to this resolution.
+LAST_ACCESS_RESOLUTION_SECONDS = 60
+# Hit/miss counters and last_access updates are written in batches, by the
+# next put or once this many seconds or keys have accumulated.
+PENDING_FLUSH_SECONDS = 5
+PENDING_FLUSH_KEYS = 256
+
+
+def make_cache_key(text_content, voice_name, language_code, audio_config):
+    """
+    Returns a content address for a synthesis request. Everything that changes
+    the audio Google returns must be part of the key.
+    """
+    key_material = json.dumps(
+        {
+            "text": text_content,
+            "voice_name": voice_name,
+            "language_code": language_code,
+            "audio_config": audio_config,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """
+    Content-addressed, byte-budgeted audio cache backed by SQLite.
+
+    Entries are evicted least-recently-used first once the total stored size
+    exceeds max_bytes, and are dropped on read once they are older than
+    ttl_seconds. Hit, miss and eviction counters are stored alongside the
+    entries so they are shared by all workers, as are the short-lived leases
+    workers use to avoid producing the same entry twice.
+
+    The store also records, per document, the last revision whose changes
+    were applied to the cache, so selective invalidation runs once per
+    revision for the whole node (see advance_document_revision).
+
+    Each entry belongs to a partition (a document id, or '' for none). When a
+    put takes its partition over partition_max_bytes, that partition's least
+    recently used entries go first; the global budget is enforced after that.
+    An entry shared by two documents stays in the partition that stored it.
+
+    The stored byte total is kept as a running count (audio_stats 'bytes',
+    and audio_partitions per partition), so a put never sums the table, and
+    the indexes eviction scans carry each entry's size so they are read
+    without touching the audio blobs. Reads take no write lock: counters and
+    LRU touches are buffered per process and written in batches.
+    """
+
+    def __init__(self, path, max_bytes, ttl_seconds, partition_max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.partition_max_bytes = partition_max_bytes or max_bytes
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_counters = {}
+        self._pending_touches = {}
+        self._pending_since = None
+
+    def _connect(self):
+        # sqlite3 connections must not be shared across threads or forked
+        # processes, so keep one per thread and re-open after a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._create_schema(conn)
+                    self._schema_ready = True
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS audio_entries ("
+            " key TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " partition TEXT NOT NULL DEFAULT '')"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(audio_entries)")}
+        if 'partition' not in columns:
+            # Caches created before partitioning keep their entries, filed under ''.
+            conn.execute("ALTER TABLE audio_entries ADD COLUMN partition TEXT NOT NULL DEFAULT ''")
+        # Covering indexes: eviction and expiry read key, size and partition
+        # from them alone, since columns stored after the blob cost a read of
+        # the blob's overflow pages. They replace narrower indexes that did not.
+        conn.execute("DROP INDEX IF EXISTS idx_audio_entries_last_access")
+        conn.execute("DROP INDEX IF EXISTS idx_audio_entries_partition")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audio_entries_lru ON audio_entries (last_access, size, partition, key)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audio_entries_partition_lru"
+            " ON audio_entries (partition, last_access, size, key)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audio_entries_created ON audio_entries (created_at, partition, size)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS audio_leases ("
+            " key TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_revisions ("
+            " document_id TEXT PRIMARY KEY,"
+            " revision_id TEXT NOT NULL,"
+            " chapter_keys TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS audio_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.executemany(
+            "INSERT OR IGNORE INTO audio_stats (name, value) VALUES (?, 0)",
+            [(name,) for name in STAT_NAMES]
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS audio_partitions (partition TEXT PRIMARY KEY, bytes INTEGER NOT NULL)"
+        )
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Caches created before the running totals are counted once.
+            if conn.execute("SELECT 1 FROM audio_stats WHERE name = 'bytes'").fetchone() is None:
+                conn.execute("DELETE FROM audio_partitions")
+                conn.execute(
+                    "INSERT INTO audio_partitions (partition, bytes)"
+                    " SELECT partition, SUM(size) FROM audio_entries GROUP BY partition"
+                )
+                conn.execute(
+                    "INSERT INTO audio_stats (name, value) SELECT 'bytes', COALESCE(SUM(bytes), 0) FROM audio_partitions"
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _increment(self, conn, name, amount=1):
+        conn.execute("UPDATE audio_stats SET value = value + ? WHERE name = ?", (amount, name))
+
+    def _account(self, conn, partition, size_delta):
+        """Moves the running byte totals of the cache and of partition by size_delta."""
+        conn.execute("UPDATE audio_stats SET value = value + ? WHERE name = 'bytes'", (size_delta,))
+        conn.execute(
+            "INSERT INTO audio_partitions (partition, bytes) VALUES (?, ?)"
+            " ON CONFLICT (partition) DO UPDATE SET bytes = bytes + excluded.bytes",
+            (partition, size_delta)
+        )
+
+    def _remove(self, conn, where, params):
+        """Deletes the entries matching where, keeping the byte totals in step. Returns how many were removed."""
+        # Summed here rather than with GROUP BY, which SQLite would answer by
+        # scanning the partition index instead of using the one for where.
+        removed, partition_bytes = 0, {}
+        for partition, size in conn.execute(f"SELECT partition, size FROM audio_entries {where}", params):
+            partition_bytes[partition] = partition_bytes.get(partition, 0) + size
+            removed += 1
+        if not removed:
+            return 0
+        conn.execute(f"DELETE FROM audio_entries {where}", params)
+        for partition, size in partition_bytes.items():
+            self._account(conn, partition, -size)
+        return removed
+
+    def _remove_keys(self, conn, keys):
+        removed = 0
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            removed += self._remove(conn, f"WHERE key IN ({','.join('?' * len(batch))})", batch)
+        return removed
+
+    def _buffer(self, name=None, amount=1, touched_key=None, now=None):
+        """Queues a counter increment and/or a last_access update; returns True once the batch is due."""
+        with self._pending_lock:
+            if name:
+                self._pending_counters[name] = self._pending_counters.get(name, 0) + amount
+            if touched_key:
+                self._pending_touches[touched_key] = now
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            return (len(self._pending_touches) >= PENDING_FLUSH_KEYS
+                    or time.monotonic() - self._pending_since >= PENDING_FLUSH_SECONDS)
+
+    def _write_pending(self, conn):
+        """Writes the buffered counters and touches on conn, inside the caller's transaction."""
+        with self._pending_lock:
+            counters, touches = self._pending_counters, self._pending_touches
+            self._pending_counters, self._pending_touches, self._pending_since = {}, {}, None
+        for name, amount in counters.items():
+            self._increment(conn, name, amount)
+        conn.executemany(
+            "UPDATE audio_entries SET last_access = ? WHERE key = ? AND last_access < ?",
+            [(touched_at, key, touched_at) for key, touched_at in touches.items()]
+        )
+
+    def flush(self):
+        """Writes the counters and LRU touches this process has buffered."""
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_pending(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Audio cache counter update failed: {e}", exc_info=True)
+
+    def record(self, name, amount=1):
+        """Adds to one of the shared counters in STAT_NAMES."""
+        if self._buffer(name, amount):
+            self.flush()
+
+    def get(self, key, record_stats=True):
+        """Returns the cached audio bytes for key, or None on a miss."""
+        try:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT data, created_at, last_access FROM audio_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._remove(conn, "WHERE key = ? AND created_at = ?", (key, row[1])):
+                        self._increment(conn, 'expirations')
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                row = None
+        except sqlite3.Error as e:
+            logger.warning(f"Audio cache read failed for key {key[:12]}: {e}", exc_info=True)
+            return None
+
+        stale = row is not None and now - row[2] > LAST_ACCESS_RESOLUTION_SECONDS
+        if record_stats or stale:
+            due = self._buffer(
+                ('hits' if row is not None else 'misses') if record_stats else None,
+                touched_key=key if stale else None, now=now
+            )
+            if due:
+                self.flush()
+        return bytes(row[0]) if row is not None else None
+
+    def contains(self, key):
+        """True if a live entry exists for key. Does not touch the counters or LRU order."""
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT created_at FROM audio_entries WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Audio cache lookup failed for key {key[:12]}: {e}", exc_info=True)
+            return False
+        return row is not None and not (self.ttl_seconds and time.time() - row[0] > self.ttl_seconds)
+
+    def put(self, key, data, partition=''):
+        """
+        Stores audio bytes under key in partition and evicts cold entries over
+        the partition's and the cache's byte budgets.
+        """
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove(conn, "WHERE key = ?", (key,))
+                conn.execute(
+                    "INSERT INTO audio_entries (key, data, size, created_at, last_access, partition) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(data), len(data), now, now, partition or '')
+                )
+                self._account(conn, partition or '', len(data))
+                self._write_pending(conn)
+                self._evict(conn, now, partition or '')
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Audio cache write failed for key {key[:12]}: {e}", exc_info=True)
+
+    def _delete_keys(self, conn, keys):
+        removed = self._remove_keys(conn, keys)
+        if removed:
+            self._increment(conn, 'invalidations', removed)
+        return removed
+
+    def discard(self, keys):
+        """Deletes the entries for keys, if present, and returns how many were removed."""
+        keys = list(keys)
+        if not keys:
+            return 0
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._delete_keys(conn, keys)
+                conn.execute("COMMIT")
+                return removed
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Audio cache invalidation of {len(keys)} keys failed: {e}", exc_info=True)
+            return 0
+
+    def document_revision(self, document_id):
+        """
+        Returns (revision_id, chapter_keys) last recorded for document_id by
+        advance_document_revision, or (None, {}) if none was.
+        """
+        row = self._connect().execute(
+            "SELECT revision_id, chapter_keys FROM document_revisions WHERE document_id = ?", (document_id,)
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def advance_document_revision(self, document_id, from_revision_id, revision_id, chapter_keys, stale_keys):
+        """
+        Records revision_id (with chapter_keys, the {chapter id: [content hash,
+        cache keys]} of that revision) as document_id's current revision and
+        deletes stale_keys, in one transaction, provided the recorded revision
+        is still from_revision_id (None for none). Returns the number of
+        entries removed, or None if another worker recorded a revision first.
+        """
+        stale_keys = list(stale_keys)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT revision_id FROM document_revisions WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if (row[0] if row else None) != from_revision_id:
+                conn.execute("COMMIT")
+                return None
+            removed = self._delete_keys(conn, stale_keys) if stale_keys else 0
+            conn.execute(
+                "INSERT OR REPLACE INTO document_revisions (document_id, revision_id, chapter_keys, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                (document_id, revision_id, json.dumps(chapter_keys, sort_keys=True), time.time())
+            )
+            conn.execute("COMMIT")
+            return removed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire_lease(self, key, owner, lease_seconds):
+        """
+        Takes the cross-worker lease for producing key. Returns False while
+        another owner holds an unexpired lease; a crashed holder's lease simply
+        runs out after lease_seconds.
+        """
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT owner, expires_at FROM audio_leases WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] != owner and row[1] > now:
+                    conn.execute("COMMIT")
+                    return False
+                conn.execute(
+                    "INSERT OR REPLACE INTO audio_leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                    (key, owner, now + lease_seconds)
+                )
+                conn.execute("COMMIT")
+                return True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # Without the shared store, fall back to producing the entry ourselves.
+            logger.warning(f"Audio cache lease failed for key {key[:12]}: {e}", exc_info=True)
+            return True
+
+    def release_lease(self, key, owner):
+        try:
+            self._connect().execute("DELETE FROM audio_leases WHERE key = ? AND owner = ?", (key, owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Audio cache lease release failed for key {key[:12]}: {e}", exc_info=True)
+
+    def _evict(self, conn, now, partition):
+        if self.ttl_seconds:
+            expired = self._remove(conn, "WHERE created_at < ?", (now - self.ttl_seconds,))
+            if expired:
+                self._increment(conn, 'expirations', expired)
+
+        if self.partition_max_bytes < self.max_bytes:
+            partition_bytes = conn.execute(
+                "SELECT bytes FROM audio_partitions WHERE partition = ?", (partition,)
+            ).fetchone()[0]
+            self._evict_lru(
+                conn, self.partition_max_bytes, partition_bytes, "WHERE partition = ?", (partition,),
+                f"partition '{partition}'"
+            )
+        total_bytes = conn.execute("SELECT value FROM audio_stats WHERE name = 'bytes'").fetchone()[0]
+        self._evict_lru(conn, self.max_bytes, total_bytes, "", (), "the cache")
+
+    def _evict_lru(self, conn, max_bytes, total_bytes, where, params, description):
+        """Deletes the least recently used entries matching where until they total at most max_bytes."""
+        if total_bytes <= max_bytes:
+            return
+
+        victims = []
+        for key, size in conn.execute(f"SELECT key, size FROM audio_entries {where} ORDER BY last_access ASC", params):
+            if total_bytes <= max_bytes:
+                break
+            victims.append(key)
+            total_bytes -= size
+        evicted = self._remove_keys(conn, victims)
+
+        if evicted:
+            self._increment(conn, 'evictions', evicted)
+            logger.info(f"Audio cache evicted {evicted} entries to keep {description} under {max_bytes} bytes.")
+
+    def stats(self):
+        """Returns the shared counters together with the current entry count and byte size."""
+        self.flush()
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM audio_stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM audio_entries").fetchone()[0]
+        total_bytes = counters.get('bytes', 0)
+        return {
+            "hits": counters.get('hits', 0),
+            "misses": counters.get('misses', 0),
+            "evictions": counters.get('evictions', 0),
+            "expirations": counters.get('expirations', 0),
+            "coalesced": counters.get('coalesced', 0),
+            "lease_waits": counters.get('lease_waits', 0),
+            "invalidations": counters.get('invalidations', 0),
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "partition_max_bytes": self.partition_max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+    def partition_stats(self):
+        """Returns {partition: {"entries", "bytes"}} for every partition with stored entries."""
+        rows = self._connect().execute(
+            "SELECT partition, COUNT(*), COALESCE(SUM(size), 0) FROM audio_entries GROUP BY partition"
+        ).fetchall()
+        return {partition: {"entries": entries, "bytes": total_bytes} for partition, entries, total_bytes in rows}
+
+
+def audio_cache_from_env(env_prefix='AUDIO_CACHE', default_path=DEFAULT_AUDIO_CACHE_PATH,
+                         default_max_bytes=DEFAULT_AUDIO_CACHE_MAX_BYTES):
+    """
+    Builds an AudioCache configured through <env_prefix>_PATH, <env_prefix>_MAX_BYTES,
+    <env_prefix>_DOCUMENT_MAX_BYTES and <env_prefix>_TTL_SECONDS environment variables.
+    """
+    max_bytes = int(os.environ.get(f'{env_prefix}_MAX_BYTES', default_max_bytes))
+    return AudioCache(
+        path=os.environ.get(f'{env_prefix}_PATH', default_path),
+        max_bytes=max_bytes,
+        ttl_seconds=int(os.environ.get(f'{env_prefix}_TTL_SECONDS', DEFAULT_AUDIO_CACHE_TTL_SECONDS)),
+        partition_max_bytes=int(os.environ.get(f'{env_prefix}_DOCUMENT_MAX_BYTES', max_bytes)),
+    )
@@ -0,0 +1,62 @@
+"""
+The output encodings clients can ask /synthesize-chapter-audio for, and how
+each one's Text-to-Speech output is parsed, merged into pages and padded with
+silence. Neither path decodes or re-encodes audio:
+
+    MP3       audio/mpeg, 32 kbit/s; merged frame by frame (mp3_frames.py)
+    OGG_OPUS  audio/ogg; codecs=opus, typically well under half the bytes of
+              MP3 for speech; merged packet by packet (ogg_opus.py)
+
+Google's Text-to-Speech API has no bitrate setting. The sample rate is the
+size lever it does offer: a lower sampleRateHertz makes Opus code a narrower
+band, and smaller files.
+"""
+from collections import namedtuple
+
+from mp3_frames import DEFAULT_TTS_MP3_FORMAT, Mp3Concatenator, parse_mp3, silence as mp3_silence
+from ogg_opus import DEFAULT_TTS_OPUS_FORMAT, OggOpusConcatenator, parse_ogg_opus, silence as opus_silence
+
+AudioCodec = namedtuple(
+    'AudioCodec', 'encoding mimetype extension sample_rates parse concatenator silence default_format'
+)
+
+AUDIO_CODECS = {
+    codec.encoding: codec for codec in (
+        AudioCodec(
+            encoding='MP3', mimetype='audio/mpeg', extension='mp3',
+            # MPEG-2 and MPEG-1 Layer III rates; frames of one stream share one rate.
+            sample_rates=(16000, 22050, 24000, 32000, 44100, 48000),
+            parse=parse_mp3, concatenator=Mp3Concatenator, silence=mp3_silence,
+            default_format=DEFAULT_TTS_MP3_FORMAT,
+        ),
+        AudioCodec(
+            encoding='OGG_OPUS', mimetype='audio/ogg; codecs=opus', extension='ogg',
+            sample_rates=(8000, 12000, 16000, 24000, 48000),
+            parse=parse_ogg_opus, concatenator=OggOpusConcatenator, silence=opus_silence,
+            default_format=DEFAULT_TTS_OPUS_FORMAT,
+        ),
+    )
+}
+DEFAULT_AUDIO_ENCODING = 'MP3'
+AUDIO_CODECS_BY_EXTENSION = {codec.extension: codec for codec in AUDIO_CODECS.values()}
+
+
+def make_audio_config(audio_encoding=DEFAULT_AUDIO_ENCODING, sample_rate_hertz=None):
+    """
+    The audio config sent to Text-to-Speech and made part of every cache key.
+    The default is {"audio_encoding": "MP3"}, the same config cache keys were
+    built from before encodings were selectable, so existing entries stay valid.
+    """
+    audio_config = {"audio_encoding": audio_encoding}
+    if sample_rate_hertz:
+        audio_config["sample_rate_hertz"] = sample_rate_hertz
+    return audio_config
+
+
+def codec_for(audio_config):
+    return AUDIO_CODECS[audio_config['audio_encoding']]
+
+
+def codec_for_audio(audio_bytes):
+    """The codec of stored audio, told apart by the Ogg capture pattern."""
+    return AUDIO_CODECS['OGG_OPUS'] if audio_bytes[:4] == b'OggS' else AUDIO_CODECS['MP3']
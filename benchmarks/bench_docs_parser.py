@@ -0,0 +1,66 @@
+"""
+Benchmarks the single-pass Docs-to-chapters parser in main.py against the
+original `+=`-based implementation (legacy_docs_parser.py) on synthetic
+10k- and 100k-paragraph documents, and checks that both produce
+byte-identical JSON.
+
+Usage (from the repository root):
+    python benchmarks/bench_docs_parser.py [--sizes 10000 100000] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import parse_document  # noqa: E402
+from legacy_docs_parser import legacy_parse_document  # noqa: E402
+from synthetic_docs import make_document  # noqa: E402
+
+
+def best_time(function, document, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(document, "synthetic-document")
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--chapters', type=int, default=10, help="chapters per tab (fewer means longer chapters)")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'layout':<10} {'paragraphs':>10} {'legacy (s)':>11} {'single-pass (s)':>16} {'speedup':>8}  identical")
+    all_identical = True
+    for size in args.sizes:
+        for layout, use_tabs, tab_count in (("1 tab", True, 1), ("4 tabs", True, 4), ("body", False, 1)):
+            document = make_document(size, tab_count=tab_count, chapters_per_tab=args.chapters, use_tabs=use_tabs)
+
+            legacy_seconds, legacy_result = best_time(legacy_parse_document, document, args.repeat)
+            new_seconds, new_result = best_time(parse_document, document, args.repeat)
+
+            identical = (
+                json.dumps(legacy_result, ensure_ascii=False).encode('utf-8')
+                == json.dumps(new_result, ensure_ascii=False).encode('utf-8')
+            )
+            all_identical = all_identical and identical
+            print(
+                f"{layout:<10} {size:>10} {legacy_seconds:>11.3f} {new_seconds:>16.3f} "
+                f"{legacy_seconds / new_seconds:>7.1f}x  {'yes' if identical else 'NO'}"
+            )
+
+    if not all_identical:
+        sys.exit("Parser output differs from the legacy implementation.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Checks that a worker's memory stays bounded while it serves many large
+documents. One gunicorn worker is started against fake_google.py with
+--distinct-documents and DOCUMENT_IDS listing --documents ids; each round then
+visits every document in turn (full content, table of contents and a few
+chapters), so every visit past the document cache's limits loads a cold
+document and evicts another.
+
+The worker's RSS is sampled after every round. The first rounds still climb
+while the allocator's arenas fill (the raw Docs JSON of one load is several
+times its parsed size), and RSS after a round swings with where the last load
+left the allocator. So the check compares high-water marks: RSS has levelled
+off when the peak over the last --window rounds is within --tolerance-mb of
+the peak over the --window rounds before them. The plateau is reported
+against the configured document cache budget (DOC_CACHE_MAX_DOCUMENTS,
+DOC_CACHE_MAX_BYTES, DOC_CACHE_DOCUMENT_MAX_BYTES), and the exit status is 1
+if a bounded run did not level off or its cache held more than
+DOC_CACHE_MAX_BYTES. --modes unbounded raises the limits past the number of
+documents for comparison, and grows with every document.
+
+Usage (from the repository root):
+    python benchmarks/bench_document_memory.py [--documents 24] [--rounds 12] [--window 4]
+        [--tolerance-mb 16] [--max-documents 4] [--paragraphs 20000] [--modes bounded unbounded]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from bench_offline import API_KEY, free_port, start_app, start_fake_google, tree_usage  # noqa: E402
+from fake_google import add_arguments as add_fake_google_arguments  # noqa: E402
+
+MODES = ('bounded', 'unbounded')
+CHAPTERS_PER_VISIT = 5
+
+
+def document_ids(count):
+    return [f'bench-document-{index:04d}' for index in range(count)]
+
+
+def visit(session, base_url, document_id):
+    """Loads one document the way a reader opening it would, returning the number of requests made."""
+    params = {'documentId': document_id}
+    requests_made = 0
+    for path in ('/get-doc-content', '/get-doc-toc'):
+        response = session.get(f'{base_url}{path}', params=params, timeout=300)
+        response.raise_for_status()
+        requests_made += 1
+    chapter_ids = [chapter['id'] for book in response.json()['books'] for chapter in book['chapters']]
+    for chapter_id in chapter_ids[:CHAPTERS_PER_VISIT]:
+        session.get(f'{base_url}/get-doc-chapter/{chapter_id}', params=params, timeout=60).raise_for_status()
+        requests_made += 1
+    return requests_made
+
+
+def steady_state(rounds, window):
+    """
+    (RSS range after the last window rounds, their peak RSS, the peak RSS of
+    the window rounds before them), or None with fewer than 2 * window rounds.
+    """
+    if len(rounds) < 2 * window:
+        return None
+    last, previous = rounds[-window:], rounds[-2 * window:-window]
+    rss = [result['rss'] for result in last]
+    return (min(rss), max(rss)), max(result['peak_rss'] for result in last), \
+        max(result['peak_rss'] for result in previous)
+
+
+def report_steady_state(rounds, window, tolerance, idle_rss, budget):
+    """Prints where RSS levelled off relative to the document cache budget; returns whether it did."""
+    state = steady_state(rounds, window)
+    if state is None:
+        print(f"Steady state: needs at least {2 * window} rounds, ran {len(rounds)}")
+        return False
+    (low, high), peak, previous_peak = state
+    first = len(rounds) - window + 1
+    # RSS after a round depends on where the last load left the allocator, so
+    # single samples swing; the high-water mark is what must stop rising.
+    levelled_off = peak - previous_peak <= tolerance
+    print(f"Rounds {first}-{len(rounds)}: RSS {low / 2 ** 20:.1f}-{high / 2 ** 20:.1f} MB, peak "
+          f"{peak / 2 ** 20:.1f} MB against {previous_peak / 2 ** 20:.1f} MB over rounds {first - window}-{first - 1} "
+          f"(tolerance {tolerance / 2 ** 20:.0f} MB)")
+    cache_bytes = max(result['cache_bytes'] for result in rounds[-window:])
+    print(f"{'Levelled off' if levelled_off else 'Still rising'} at {peak / 2 ** 20:.1f} MB: idle "
+          f"{idle_rss / 2 ** 20:.1f} MB + {(peak - idle_rss) / 2 ** 20:.1f} MB, for a document cache budget of "
+          f"{budget['DOC_CACHE_MAX_BYTES'] / 2 ** 20:.0f} MB ({budget['DOC_CACHE_MAX_DOCUMENTS']} documents, "
+          f"chapter bodies within {budget['DOC_CACHE_DOCUMENT_MAX_BYTES'] / 2 ** 20:.0f} MB each) holding at most "
+          f"{cache_bytes / 2 ** 20:.1f} MB")
+    within_budget = cache_bytes <= budget['DOC_CACHE_MAX_BYTES']
+    if not within_budget:
+        print("The document cache held more than DOC_CACHE_MAX_BYTES.")
+    return levelled_off and within_budget
+
+
+def run_mode(args, mode, fake_url):
+    ids = document_ids(args.documents)
+    budget = {
+        'DOC_CACHE_MAX_DOCUMENTS': args.max_documents if mode == 'bounded' else args.documents,
+        'DOC_CACHE_MAX_BYTES': args.max_bytes if mode == 'bounded' else 2 ** 40,
+        'DOC_CACHE_DOCUMENT_MAX_BYTES': args.document_max_bytes,
+    }
+    extra_env = {'DOCUMENT_IDS': ','.join(ids), **{name: str(value) for name, value in budget.items()}}
+    state_dir = tempfile.mkdtemp(prefix='read_serene_bench_')
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    app_process = start_app(args, port, fake_url, state_dir, extra_env)
+    session = requests.Session()
+    session.headers['X-API-Key'] = API_KEY
+    try:
+        idle_rss, _ = tree_usage(app_process.pid)
+        print(f"\n{mode}: {' '.join(f'{name}={value}' for name, value in budget.items())}, "
+              f"idle RSS {idle_rss / 2 ** 20:.1f} MB")
+        print(f"{'round':<8}{'seconds':>9}{'RSS MB':>9}{'peak MB':>9}{'cached':>8}{'cache MB':>10}{'evictions':>11}")
+
+        rounds = []
+        for round_number in range(1, args.rounds + 1):
+            started = time.perf_counter()
+            peak_rss = 0
+            for document_id in ids:
+                visit(session, base_url, document_id)
+                peak_rss = max(peak_rss, tree_usage(app_process.pid)[0])
+            elapsed = time.perf_counter() - started
+            rss, _ = tree_usage(app_process.pid)
+            stats = session.get(f'{base_url}/document-stats', timeout=30).json()
+            cached = sum(1 for document in stats['documents'].values() if document['cached'])
+            cache_stats = stats['document_cache']
+            rounds.append({"round": round_number, "rss": rss, "peak_rss": peak_rss, "cached": cached,
+                           "cache_bytes": cache_stats['bytes'], "evictions": cache_stats['evictions']})
+            print(f"{round_number:<8}{elapsed:>9.1f}{rss / 2 ** 20:>9.1f}{peak_rss / 2 ** 20:>9.1f}{cached:>8}"
+                  f"{cache_stats['bytes'] / 2 ** 20:>10.1f}{cache_stats['evictions']:>11}")
+
+        return report_steady_state(rounds, args.window, args.tolerance_mb * 2 ** 20, idle_rss, budget)
+    finally:
+        # An open keep-alive connection would hold up the gthread worker's graceful shutdown.
+        session.close()
+        app_process.terminate()
+        app_process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=24, help="distinct documents to cycle through")
+    parser.add_argument('--rounds', type=int, default=12, help="passes over every document")
+    parser.add_argument('--window', type=int, default=4, help="rounds compared to decide RSS has levelled off")
+    parser.add_argument('--tolerance-mb', type=float, default=16,
+                        help="rise of the peak RSS between the last two --window rounds still counted as level")
+    parser.add_argument('--max-documents', type=int, default=4, help="DOC_CACHE_MAX_DOCUMENTS in bounded mode")
+    parser.add_argument('--max-bytes', type=int, default=256 * 2 ** 20, help="DOC_CACHE_MAX_BYTES in bounded mode")
+    parser.add_argument('--document-max-bytes', type=int, default=64 * 2 ** 20,
+                        help="DOC_CACHE_DOCUMENT_MAX_BYTES")
+    parser.add_argument('--modes', nargs='+', default=['bounded'], choices=MODES)
+    parser.add_argument('--threads', type=int, default=8, help="threads of the single gthread worker")
+    parser.add_argument('--verbose', action='store_true', help="show gunicorn's log")
+    add_fake_google_arguments(parser)
+    parser.set_defaults(paragraphs=20000, docs_latency_ms=0, docs_revision_latency_ms=0)
+    args = parser.parse_args()
+    args.workers, args.worker_class, args.distinct_documents = 1, 'gthread', True
+
+    fake_port = free_port()
+    fake_url = f'http://127.0.0.1:{fake_port}'
+    fake_process = start_fake_google(args, fake_port)
+    try:
+        levelled_off = [run_mode(args, mode, fake_url) for mode in args.modes]
+    finally:
+        fake_process.terminate()
+        fake_process.wait(timeout=30)
+    # Unbounded runs are expected to keep growing; only bounded ones decide the exit status.
+    return 0 if all(ok for mode, ok in zip(args.modes, levelled_off) if mode == 'bounded') else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,443 @@
+"""
+End-to-end benchmark of the real app (main:app under gunicorn.conf.py) against
+the local Google stand-ins in fake_google.py, so no credentials, quota or
+network are needed and runs are comparable between commits.
+
+Each endpoint is loaded in turn for --seconds at every --concurrency level:
+
+    doc     GET  /get-doc-content (revalidated against the fake Docs API)
+    synth   POST /synthesize-chapter-audio with one page of a real chapter;
+            "cold" adds a unique tag to every paragraph so every segment misses
+            the audio cache, "warm" replays the same pages
+    voices  GET  /get-google-tts-voices, rotating through language filters
+
+For every phase it reports throughput, p50/p95/p99 latency, the peak RSS of the
+gunicorn master and workers together (sampled every 50ms) and the CPU time they
+used. Results are written to benchmarks/results/<time>-<commit>.json; pass
+--compare with an earlier file (or "latest") to print the change against it.
+
+Usage (from the repository root):
+    python benchmarks/bench_offline.py [--endpoints doc synth voices] [--concurrency 1 8 32]
+        [--seconds 15] [--workers 2] [--threads 8] [--synth-cache cold] [--compare latest]
+    Document size, latencies and TTS error rate: see fake_google.py --help; the same options apply.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import datetime
+import tempfile
+import itertools
+import threading
+import subprocess
+
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+API_KEY = 'benchmark-key'
+VOICE_NAME, LANGUAGE_CODE = 'en-US-Wavenet-E', 'en-US'
+VOICE_FILTERS = (
+    {}, {"languageCode": "en"}, {"languageCode": "en", "voiceType": "Chirp"},
+    {"languageCode": "de-DE", "gender": "FEMALE"}, {"voiceType": "Neural2"},
+)
+ENDPOINTS = ('doc', 'synth', 'voices')
+SAMPLE_INTERVAL_SECONDS = 0.05
+
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_google import add_arguments as add_fake_google_arguments  # noqa: E402
+from prewarm import chapter_paragraphs_for_synthesis  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, name, timeout_seconds=60):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not come up at {url}")
+
+
+def fake_service_account(token_uri):
+    """Service account JSON with a throwaway key; the fake token endpoint accepts any assertion."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode('ascii')
+    return json.dumps({
+        "type": "service_account",
+        "project_id": "read-serene-bench",
+        "private_key_id": "bench",
+        "private_key": private_key,
+        "client_email": "bench@read-serene-bench.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": token_uri,
+    })
+
+
+def start_fake_google(args, port):
+    passthrough = [
+        '--paragraphs', str(args.paragraphs), '--tabs', str(args.tabs),
+        '--chapters-per-tab', str(args.chapters_per_tab),
+        '--docs-latency-ms', str(args.docs_latency_ms), '--docs-revision-latency-ms', str(args.docs_revision_latency_ms),
+        '--tts-latency-ms', str(args.tts_latency_ms), '--tts-ms-per-kb', str(args.tts_ms_per_kb),
+        '--ms-per-char', str(args.ms_per_char),
+        '--tts-error-rate', str(args.tts_error_rate), '--tts-error-status', str(args.tts_error_status),
+    ]
+    if args.document:
+        passthrough += ['--document', args.document]
+    if args.distinct_documents:
+        passthrough.append('--distinct-documents')
+    if args.seed is not None:
+        passthrough += ['--seed', str(args.seed)]
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, 'fake_google.py'), '--port', str(port)] + passthrough,
+        stdout=subprocess.DEVNULL,
+    )
+    wait_until_up(f'http://127.0.0.1:{port}/stats', process, "fake_google.py")
+    return process
+
+
+def start_app(args, port, fake_url, state_dir, extra_env=None):
+    env = dict(
+        os.environ,
+        RAILWAY_APP_API_KEY=API_KEY,
+        GOOGLE_APPLICATION_CREDENTIALS_JSON=fake_service_account(f'{fake_url}/token'),
+        DOCS_API_ENDPOINT=fake_url,
+        TTS_API_ENDPOINT=fake_url,
+        TTS_TRANSPORT='rest',
+        TTS_VOICES_URL=f'{fake_url}/v1/voices',
+        google_api='benchmark-google-api-key',
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        AUDIO_CACHE_PATH=os.path.join(state_dir, 'audio.sqlite3'),
+        PAGE_AUDIO_CACHE_PATH=os.path.join(state_dir, 'page_audio.sqlite3'),
+        PREWARM_STATE_PATH=os.path.join(state_dir, 'prewarm.sqlite3'),
+        SYNTHESIS_JOBS_PATH=os.path.join(state_dir, 'synthesis_jobs.sqlite3'),
+        METRICS_DIR=os.path.join(state_dir, 'metrics'),
+        **(extra_env or {}),
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+         '--chdir', REPO_ROOT, '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    wait_until_up(f'http://127.0.0.1:{port}/healthz', process, "gunicorn")
+    return process
+
+
+# --- Process tree accounting (Linux /proc) ---
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def _stat_fields(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        # The command name may contain spaces; everything after the last ')' is positional.
+        return f.read().rsplit(')', 1)[1].split()
+
+
+def process_tree(root_pid):
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            children.setdefault(int(_stat_fields(name)[1]), []).append(int(name))
+        except (OSError, IndexError):
+            continue
+    tree, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def tree_usage(root_pid):
+    """(RSS bytes, CPU seconds) summed over the process and its descendants."""
+    rss = cpu = 0
+    for pid in process_tree(root_pid):
+        try:
+            fields = _stat_fields(pid)
+            with open(f'/proc/{pid}/statm') as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError):
+            continue
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat; fields[0] here is field 3.
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return rss, cpu
+
+
+class ResourceSampler:
+    """Tracks the peak RSS and the CPU time used by a process tree while active."""
+
+    def __init__(self, root_pid):
+        self.root_pid = root_pid
+        self.peak_rss = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak_rss, self._cpu_started = tree_usage(self.root_pid)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL_SECONDS):
+            self.peak_rss = max(self.peak_rss, tree_usage(self.root_pid)[0])
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        rss, cpu = tree_usage(self.root_pid)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.cpu_seconds = cpu - self._cpu_started
+
+
+# --- Load generation ---
+def synthesis_pages(base_url, paragraphs_per_page):
+    """Splits every chapter of the served document into page-sized chapterParagraphs payloads."""
+    response = requests.get(f'{base_url}/get-doc-content', headers={'X-API-Key': API_KEY}, timeout=120)
+    response.raise_for_status()
+    pages = []
+    for book in response.json()['books']:
+        for chapter in book['chapters']:
+            paragraphs = chapter_paragraphs_for_synthesis(chapter['content'])
+            for start in range(0, len(paragraphs), paragraphs_per_page):
+                page = [dict(p, pageNumber=1) for p in paragraphs[start:start + paragraphs_per_page]]
+                if page:
+                    pages.append(page)
+    if not pages:
+        raise RuntimeError("The served document has no paragraphs to synthesize.")
+    return pages
+
+
+def request_factory(endpoint, base_url, pages, synth_cache):
+    """Returns send(session, request_number) for one endpoint."""
+    run_tag = uuid.uuid4().hex[:8]
+
+    def send_doc(session, request_number):
+        return session.get(f'{base_url}/get-doc-content', timeout=120)
+
+    def send_synth(session, request_number):
+        page = pages[request_number % len(pages)]
+        if synth_cache == 'cold':
+            page = [dict(p, text=f"{p['text']} ({run_tag}-{request_number})") for p in page]
+        return session.post(f'{base_url}/synthesize-chapter-audio', timeout=300, json={
+            "voiceName": VOICE_NAME, "languageCode": LANGUAGE_CODE, "chapterParagraphs": page,
+        })
+
+    def send_voices(session, request_number):
+        return session.get(f'{base_url}/get-google-tts-voices',
+                           params=VOICE_FILTERS[request_number % len(VOICE_FILTERS)], timeout=60)
+
+    return {'doc': send_doc, 'synth': send_synth, 'voices': send_voices}[endpoint]
+
+
+def run_phase(send, concurrency, seconds):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    counter = itertools.count()
+    stop_at = time.monotonic() + seconds
+
+    def client():
+        session = requests.Session()
+        session.headers['X-API-Key'] = API_KEY
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = send(session, next(counter))
+                response.content
+                status = response.status_code
+            except requests.RequestException:
+                status = 'exception'
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.monotonic() - started
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(latencies, statuses, elapsed, sampler):
+    completed = len(latencies)
+    return {
+        "requests": sum(statuses.values()),
+        "ok": completed,
+        "errors": sum(count for status, count in statuses.items() if status != 200),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2),
+        "p50_ms": _ms(percentile(latencies, 0.50)),
+        "p95_ms": _ms(percentile(latencies, 0.95)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+        "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+        "cpu_seconds": round(sampler.cpu_seconds, 3),
+        "cpu_ms_per_request": round(sampler.cpu_seconds * 1000 / completed, 2) if completed else None,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+# --- Results ---
+REPORT_COLUMNS = (
+    ('throughput_rps', 'req/s', 8), ('p50_ms', 'p50 ms', 8), ('p95_ms', 'p95 ms', 8), ('p99_ms', 'p99 ms', 8),
+    ('peak_rss_mb', 'RSS MB', 8), ('cpu_seconds', 'CPU s', 7), ('cpu_ms_per_request', 'CPU ms/req', 10),
+    ('errors', 'errors', 6),
+)
+
+
+def print_header():
+    print(f"{'phase':<12}" + ''.join(f" {title:>{width}}" for _, title, width in REPORT_COLUMNS))
+
+
+def print_row(phase, result, baseline=None):
+    cells = []
+    for key, _, width in REPORT_COLUMNS:
+        value = result.get(key)
+        cells.append(f" {'-' if value is None else value:>{width}}")
+    print(f"{phase:<12}" + ''.join(cells))
+    if baseline:
+        deltas = []
+        for key, _, width in REPORT_COLUMNS:
+            old, new = baseline.get(key), result.get(key)
+            if old and new is not None and key != 'errors':
+                deltas.append(f" {f'{(new - old) / old * 100:+.0f}%':>{width}}")
+            else:
+                deltas.append(f" {'':>{width}}")
+        print(f"{'  vs base':<12}" + ''.join(deltas))
+
+
+def git_revision():
+    def git(*git_args):
+        return subprocess.run(['git', *git_args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    return git('rev-parse', '--short', 'HEAD') or 'unknown', bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def load_baseline(path):
+    if path == 'latest':
+        files = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith('.json')) if os.path.isdir(RESULTS_DIR) else []
+        if not files:
+            print("No earlier results to compare against.")
+            return None
+        path = os.path.join(RESULTS_DIR, files[-1])
+    with open(path) as f:
+        baseline = json.load(f)
+    print(f"Comparing against {path} (commit {baseline['commit']}{' dirty' if baseline['dirty'] else ''})")
+    return baseline
+
+
+def save_results(results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{results['commit']}{'-dirty' if results['dirty'] else ''}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[8], help="concurrent clients per phase")
+    parser.add_argument('--seconds', type=float, default=15, help="duration of each phase")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="threads per gthread worker")
+    parser.add_argument('--worker-class', default='gthread', choices=['gthread', 'sync'])
+    parser.add_argument('--synth-cache', default='cold', choices=['cold', 'warm'])
+    parser.add_argument('--paragraphs-per-page', type=int, default=10)
+    parser.add_argument('--compare', help="earlier results file, or 'latest'")
+    parser.add_argument('--no-save', action='store_true', help="do not write a results file")
+    parser.add_argument('--verbose', action='store_true', help="show gunicorn's log")
+    add_fake_google_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    commit, dirty = git_revision()
+    state_dir = tempfile.mkdtemp(prefix='read_serene_bench_')
+    fake_port, app_port = free_port(), free_port()
+    fake_url, base_url = f'http://127.0.0.1:{fake_port}', f'http://127.0.0.1:{app_port}'
+
+    fake_process = start_fake_google(args, fake_port)
+    app_process = None
+    try:
+        app_process = start_app(args, app_port, fake_url, state_dir)
+        # Also loads the document into the cache, so 'doc' measures revalidated requests.
+        pages = synthesis_pages(base_url, args.paragraphs_per_page)
+        idle_rss, _ = tree_usage(app_process.pid)
+        print(f"commit {commit}{' (dirty)' if dirty else ''}: {args.workers} {args.worker_class} workers x "
+              f"{args.threads} threads, idle RSS {idle_rss / 2 ** 20:.1f} MB, {len(pages)} synthesis pages")
+        print_header()
+
+        phases = {}
+        for endpoint in args.endpoints:
+            send = request_factory(endpoint, base_url, pages, args.synth_cache)
+            for concurrency in args.concurrency:
+                phase = f'{endpoint}@{concurrency}'
+                with ResourceSampler(app_process.pid) as sampler:
+                    latencies, statuses, elapsed = run_phase(send, concurrency, args.seconds)
+                phases[phase] = summarize(latencies, statuses, elapsed, sampler)
+                print_row(phase, phases[phase], (baseline or {}).get('phases', {}).get(phase))
+
+        upstream_calls = requests.get(f'{fake_url}/stats', timeout=5).json()
+        print(f"upstream calls: {upstream_calls}")
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        fake_process.terminate()
+        fake_process.wait(timeout=30)
+
+    if not args.no_save:
+        config = {name: value for name, value in vars(args).items() if name not in ('compare', 'no_save', 'verbose')}
+        path = save_results({
+            "commit": commit,
+            "dirty": dirty,
+            "created_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "config": config,
+            "idle_rss_mb": round(idle_rss / 2 ** 20, 1),
+            "upstream_calls": upstream_calls,
+            "phases": phases,
+        })
+        print(f"results written to {os.path.relpath(path, REPO_ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
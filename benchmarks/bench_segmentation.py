@@ -0,0 +1,124 @@
+"""
+Compares the byte-limit-aware segmenter in main.py with the original
+768-character packer (legacy_segmentation.py) on sample chapters: how many
+Text-to-Speech calls each chapter needs, the largest request in UTF-8 bytes
+(Google rejects anything over 5000) and the wall-clock synthesis time through
+the real segment thread pool with a simulated TTS latency.
+
+The simulated latency is FIXED_MS + PER_KB_MS * kilobytes per call, scaled by
+--time-scale to keep runs short; reported times are scaled back up.
+
+Usage (from the repository root):
+    python benchmarks/bench_segmentation.py [--fixed-ms 250] [--per-kb-ms 600] [--time-scale 0.05]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('AUDIO_CACHE_PATH', os.path.join(tempfile.mkdtemp(prefix='read_serene_bench_'), 'audio.sqlite3'))
+
+import main  # noqa: E402
+from prewarm import chapter_paragraphs_for_synthesis  # noqa: E402
+from legacy_segmentation import legacy_process_paragraphs_for_synthesis  # noqa: E402
+from mp3_frames import DEFAULT_TTS_MP3_FORMAT, silence as mp3_silence  # noqa: E402
+from synthetic_docs import WORDS, make_document  # noqa: E402
+
+
+def paragraph_records(texts_and_types):
+    return [
+        {"pageNumber": 1, "paragraphIndexOnPage": i, "paragraphType": paragraph_type, "text": text}
+        for i, (paragraph_type, text) in enumerate(texts_and_types)
+    ]
+
+
+def sentence(rng, min_words=6, max_words=30):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+
+
+def sample_chapters():
+    """Returns [(name, paragraph records)]."""
+    chapters = []
+
+    document = make_document(3000, tab_count=1, chapters_per_tab=6)
+    parsed = main.parse_document(document, "synthetic-document")
+    for chapter in parsed['books'][0]['chapters'][1:4]:
+        chapters.append((f"synthetic {chapter['title'][:12]}", chapter_paragraphs_for_synthesis(chapter['content'])))
+
+    rng = random.Random(7)
+    long_paragraphs = []
+    for i in range(60):
+        roll = rng.random()
+        if roll < 0.2:
+            long_paragraphs.append(('dialogue', f'"{sentence(rng, 4, 12)}" she said.'))
+        elif roll < 0.3:
+            long_paragraphs.append(('italicised', sentence(rng, 4, 12)))
+        elif i % 15 == 7:
+            long_paragraphs.append(('narration', " ".join(sentence(rng) for _ in range(80))))
+        else:
+            long_paragraphs.append(('narration', " ".join(sentence(rng) for _ in range(rng.randint(1, 4)))))
+    chapters.append(("long paragraphs", paragraph_records(long_paragraphs)))
+
+    accented = "Élodie s'arrêta près du moulin où brûlaient les lanternes. Été comme hiver, à l'aube, rien ne change. "
+    japanese = "川は彼女の声を運んだ。灯りは低く燃えていた。「本当に？」と彼は言った。"
+    chapters.append(("accented", paragraph_records([('narration', accented * rng.randint(2, 9)) for _ in range(40)])))
+    chapters.append(("japanese", paragraph_records([('narration', japanese * rng.randint(3, 12)) for _ in range(40)])))
+    return chapters
+
+
+def timed_synthesis(segments, fixed_ms, per_kb_ms, time_scale):
+    """Runs the segments through the real thread pool with a sleeping fake TTS; returns unscaled seconds."""
+    silent_audio, _ = mp3_silence(DEFAULT_TTS_MP3_FORMAT, 1000)
+
+    def fake_synthesize(text_content, voice_name, language_code, audio_config=None, part_texts=None):
+        time.sleep((fixed_ms + per_kb_ms * main.utf8_length(text_content) / 1000) / 1000 * time_scale)
+        return silent_audio
+
+    original = main._synthesize_speech_cached
+    main._synthesize_speech_cached = fake_synthesize
+    try:
+        started = time.perf_counter()
+        main.synthesize_segments_concurrently(segments, "en-US-Wavenet-E", "en-US")
+        return (time.perf_counter() - started) / time_scale
+    finally:
+        main._synthesize_speech_cached = original
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixed-ms', type=float, default=250, help="simulated per-call overhead")
+    parser.add_argument('--per-kb-ms', type=float, default=600, help="simulated synthesis time per KB of text")
+    parser.add_argument('--time-scale', type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"pool: {main.SYNTHESIS_MAX_WORKERS} workers, segment limit {main.SEGMENT_MAX_BYTES} bytes")
+    print(f"{'chapter':<22} {'paras':>5} {'KB':>6} {'calls old/new':>14} {'max bytes old/new':>18} "
+          f"{'over limit':>10} {'synth s old/new':>16}")
+    totals = [0, 0, 0.0, 0.0]
+    for name, paragraphs in sample_chapters():
+        segmenters = (legacy_process_paragraphs_for_synthesis, main.process_paragraphs_for_synthesis)
+        results = []
+        for segment in segmenters:
+            segments = [s for s in segment(paragraphs) if s['type'] != 'horizontal_rule' and s['text'].strip()]
+            sizes = [main.utf8_length(s['text']) for s in segments]
+            seconds = timed_synthesis(segments, args.fixed_ms, args.per_kb_ms, args.time_scale)
+            results.append((len(segments), max(sizes), sum(size > main.TTS_MAX_INPUT_BYTES for size in sizes), seconds))
+        (old_calls, old_max, old_over, old_s), (new_calls, new_max, new_over, new_s) = results
+        kilobytes = sum(main.utf8_length(p['text']) for p in paragraphs) / 1024
+        print(f"{name:<22} {len(paragraphs):>5} {kilobytes:>6.1f} {f'{old_calls}/{new_calls}':>14} "
+              f"{f'{old_max}/{new_max}':>18} {f'{old_over}/{new_over}':>10} {f'{old_s:.1f}/{new_s:.1f}':>16}")
+        totals[0] += old_calls
+        totals[1] += new_calls
+        totals[2] += old_s
+        totals[3] += new_s
+    print(f"{'total':<22} {'':>5} {'':>6} {f'{totals[0]}/{totals[1]}':>14} {'':>18} {'':>10} "
+          f"{f'{totals[2]:.1f}/{totals[3]:.1f}':>16}")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,151 @@
+"""
+Load-tests gunicorn worker modes against latency_app.py (main.py with Docs and
+Text-to-Speech replaced by sleeps) and reports requests per second per worker
+process and latency percentiles for each endpoint.
+
+Clients alternate between /get-doc-content (revalidated against the fake Docs
+API on every request) and single-page /synthesize-chapter-audio requests with
+unique text, so every synthesis misses the audio cache.
+
+Usage (from the repository root):
+    python benchmarks/bench_worker_concurrency.py [--modes sync gthread] [--clients 16] [--seconds 15]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import itertools
+import threading
+import subprocess
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+API_KEY = 'benchmark-key'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(worker_class, workers, threads, port):
+    state_dir = tempfile.mkdtemp(prefix='read_serene_bench_')
+    env = dict(
+        os.environ,
+        RAILWAY_APP_API_KEY=API_KEY,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_THREADS=str(threads),
+        DOC_CACHE_MAX_STALE_SECONDS='0',
+        AUDIO_CACHE_PATH=os.path.join(state_dir, 'audio.sqlite3'),
+        PAGE_AUDIO_CACHE_PATH=os.path.join(state_dir, 'page_audio.sqlite3'),
+        PREWARM_STATE_PATH=os.path.join(state_dir, 'prewarm.sqlite3'),
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+         '--chdir', BENCHMARKS_DIR, '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+         'latency_app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/healthz', timeout=1)
+            # Load the document once so the run measures revalidation, not the first parse.
+            requests.get(f'http://127.0.0.1:{port}/get-doc-content', headers={'X-API-Key': API_KEY}, timeout=30)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start on port {port}")
+
+
+def run_load(port, clients, seconds):
+    base_url = f'http://127.0.0.1:{port}'
+    latencies = {'doc': [], 'synth': []}
+    errors = [0]
+    counter = itertools.count()
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def client(client_index):
+        session = requests.Session()
+        session.headers['X-API-Key'] = API_KEY
+        for turn in itertools.count(client_index):
+            if time.monotonic() >= stop_at:
+                return
+            started = time.perf_counter()
+            if turn % 2:
+                kind = 'doc'
+                response = session.get(f'{base_url}/get-doc-content', timeout=120)
+            else:
+                kind = 'synth'
+                request_number = next(counter)
+                response = session.post(f'{base_url}/synthesize-chapter-audio', timeout=120, json={
+                    "voiceName": "en-US-Wavenet-E",
+                    "languageCode": "en-US",
+                    "chapterParagraphs": [
+                        {"pageNumber": 1, "paragraphIndexOnPage": i, "paragraphType": "narration",
+                         "text": f"Request {request_number}, paragraph {i}."}
+                        for i in range(2)
+                    ],
+                })
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code == 200:
+                    latencies[kind].append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.monotonic() - started
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gthread'], choices=['sync', 'gthread'])
+    parser.add_argument('--workers', type=int, default=1, help="worker processes per run")
+    parser.add_argument('--threads', type=int, default=8, help="threads per worker for gthread")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--seconds', type=float, default=15)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'workers':>7} {'threads':>7} {'req/s':>7} {'req/s/worker':>12} "
+          f"{'doc p50/p95 (ms)':>17} {'synth p50/p95 (ms)':>19} {'errors':>6}")
+    for mode in args.modes:
+        threads = args.threads if mode == 'gthread' else 1
+        port = free_port()
+        process = start_server(mode, args.workers, threads, port)
+        try:
+            latencies, errors, elapsed = run_load(port, args.clients, args.seconds)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+        completed = len(latencies['doc']) + len(latencies['synth'])
+        rps = completed / elapsed
+        doc = f"{percentile(latencies['doc'], 0.5) * 1000:.0f}/{percentile(latencies['doc'], 0.95) * 1000:.0f}"
+        synth = f"{percentile(latencies['synth'], 0.5) * 1000:.0f}/{percentile(latencies['synth'], 0.95) * 1000:.0f}"
+        print(f"{mode:<8} {args.workers:>7} {threads:>7} {rps:>7.1f} {rps / args.workers:>12.1f} "
+              f"{doc:>17} {synth:>19} {errors:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Local stand-ins for the Google APIs main.py talks to, so the real app can be
+load-tested through gunicorn without credentials, quota or network.
+
+    python benchmarks/fake_google.py --port 8090 [--paragraphs 3000] [--tabs 2]
+
+Endpoints:
+    POST /token                 OAuth 2.0 token exchange; any service-account assertion is accepted
+    GET  /v1/documents/<id>     Docs documents.get: a synthetic document (synthetic_docs.py) or a
+                                recorded response (--document); honours fields=revisionId. With
+                                --distinct-documents every id gets its own synthetic document
+    POST /v1/text:synthesize    Text-to-Speech REST: silent MP3 (or Ogg Opus, for audioEncoding
+                                OGG_OPUS) lasting --ms-per-char per character,
+                                after --tts-latency-ms plus --tts-ms-per-kb per KB of text, failing
+                                with --tts-error-status for a --tts-error-rate fraction of calls
+    GET  /v1/voices             Text-to-Speech voice list of realistic size
+    GET  /stats                 calls served per endpoint, for checking cache behaviour
+
+Point main.py at it with DOCS_API_ENDPOINT, TTS_API_ENDPOINT (with TTS_TRANSPORT=rest),
+TTS_VOICES_URL and a service account whose token_uri is http://<host>:<port>/token;
+bench_offline.py does all of this.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import zlib
+import functools
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mp3_frames import DEFAULT_TTS_MP3_FORMAT, silence  # noqa: E402
+from ogg_opus import (  # noqa: E402
+    DEFAULT_TTS_OPUS_FORMAT, OPUS_SAMPLES_PER_MS, SILENT_PACKET, SILENT_PACKET_SAMPLES, write_ogg_opus
+)
+from synthetic_docs import make_document  # noqa: E402
+
+VOICE_LANGUAGES = (
+    "en-US", "en-GB", "en-AU", "en-IN", "de-DE", "fr-FR", "fr-CA", "es-ES", "es-US", "it-IT", "ja-JP",
+    "ko-KR", "cmn-CN", "pt-BR", "pt-PT", "nl-NL", "pl-PL", "ru-RU", "sv-SE", "tr-TR", "hi-IN", "ar-XA",
+)
+VOICE_TYPES = ("Standard", "Wavenet", "Neural2", "Studio", "Chirp-HD", "Chirp3-HD")
+ERROR_STATUS_NAMES = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+
+def make_voices(voices_per_type=14):
+    """A v1/voices response shaped like Google's: every type in every language, alternating genders."""
+    voices = []
+    for language_code in VOICE_LANGUAGES:
+        for voice_type in VOICE_TYPES:
+            for i in range(voices_per_type):
+                voices.append({
+                    "languageCodes": [language_code],
+                    "name": f"{language_code}-{voice_type}-{chr(ord('A') + i)}",
+                    "ssmlGender": ("FEMALE", "MALE", "NEUTRAL")[i % 3],
+                    "naturalSampleRateHertz": 24000,
+                })
+    return {"voices": voices}
+
+
+class FakeGoogle:
+    """Configuration and canned responses shared by every request handler thread."""
+
+    def __init__(self, document, docs_latency_ms, docs_revision_latency_ms, tts_latency_ms, tts_ms_per_kb,
+                 ms_per_char, tts_error_rate, tts_error_status, seed=None, document_for=None):
+        self.default_document_body = json.dumps(document).encode('utf-8')
+        self.default_revision_body = json.dumps({"revisionId": document.get("revisionId")}).encode('utf-8')
+        # document_for(document_id), if set, builds a different document per id.
+        self.document_for = document_for
+        self.voices_body = json.dumps(make_voices()).encode('utf-8')
+        self.docs_latency_ms = docs_latency_ms
+        self.docs_revision_latency_ms = docs_revision_latency_ms
+        self.tts_latency_ms = tts_latency_ms
+        self.tts_ms_per_kb = tts_ms_per_kb
+        self.ms_per_char = ms_per_char
+        self.tts_error_rate = tts_error_rate
+        self.tts_error_status = tts_error_status
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.counts = {"token": 0, "documents": 0, "revisions": 0, "synthesize": 0, "synthesize_errors": 0, "voices": 0}
+        self._counts_lock = threading.Lock()
+
+    def count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def should_fail(self):
+        if self.tts_error_rate <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.tts_error_rate
+
+    @functools.lru_cache(maxsize=8)
+    def _distinct_document(self, document_id):
+        document = self.document_for(document_id)
+        return (
+            json.dumps(document).encode('utf-8'),
+            json.dumps({"revisionId": document.get("revisionId")}).encode('utf-8'),
+        )
+
+    def document_body(self, document_id):
+        return self._distinct_document(document_id)[0] if self.document_for else self.default_document_body
+
+    def revision_body(self, document_id):
+        return self._distinct_document(document_id)[1] if self.document_for else self.default_revision_body
+
+    @functools.lru_cache(maxsize=512)
+    def audio_content(self, duration_ms, audio_encoding='MP3'):
+        """
+        Base64 audio of the given length; synthesize() rounds lengths to 100ms so
+        encodings are reused. Ogg Opus output carries the encoder's pre-skip, as
+        Text-to-Speech's does.
+        """
+        if audio_encoding == 'OGG_OPUS':
+            packet_count = -(-(duration_ms * OPUS_SAMPLES_PER_MS + DEFAULT_TTS_OPUS_FORMAT.pre_skip)
+                             // SILENT_PACKET_SAMPLES)
+            audio = write_ogg_opus(DEFAULT_TTS_OPUS_FORMAT, [SILENT_PACKET] * packet_count)
+        else:
+            audio, _ = silence(DEFAULT_TTS_MP3_FORMAT, duration_ms)
+        return base64.b64encode(audio).decode('ascii')
+
+    def synthesize(self, request_json):
+        text = request_json.get("input", {}).get("text") or request_json.get("input", {}).get("ssml") or ""
+        text_kb = len(text.encode('utf-8')) / 1024
+        time.sleep((self.tts_latency_ms + self.tts_ms_per_kb * text_kb) / 1000)
+        duration_ms = max(100, round(len(text) * self.ms_per_char / 100) * 100)
+        audio_config = request_json.get("audioConfig", {})
+        audio_encoding = audio_config.get("audioEncoding") or audio_config.get("audio_encoding") or 'MP3'
+        return {"audioContent": self.audio_content(duration_ms, audio_encoding)}
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None  # FakeGoogle, set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_error_status(self, status, message):
+        self._send_json(status, {"error": {
+            "code": status, "message": message, "status": ERROR_STATUS_NAMES.get(status, "UNKNOWN"),
+        }})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/v1/documents/'):
+            document_id = unquote(url.path[len('/v1/documents/'):])
+            if query.get('fields') == ['revisionId']:
+                self.fake.count('revisions')
+                time.sleep(self.fake.docs_revision_latency_ms / 1000)
+                return self._send_json(200, self.fake.revision_body(document_id))
+            self.fake.count('documents')
+            time.sleep(self.fake.docs_latency_ms / 1000)
+            return self._send_json(200, self.fake.document_body(document_id))
+        if url.path == '/v1/voices':
+            self.fake.count('voices')
+            return self._send_json(200, self.fake.voices_body)
+        if url.path == '/stats':
+            return self._send_json(200, self.fake.counts)
+        self._send_error_status(404, f"No fake for GET {url.path}")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self._read_body()
+        if url.path == '/token':
+            self.fake.count('token')
+            return self._send_json(200, {"access_token": "fake-access-token", "expires_in": 3600, "token_type": "Bearer"})
+        if url.path == '/v1/text:synthesize':
+            self.fake.count('synthesize')
+            if self.fake.should_fail():
+                self.fake.count('synthesize_errors')
+                time.sleep(self.fake.tts_latency_ms / 1000)
+                return self._send_error_status(self.fake.tts_error_status, "Injected failure.")
+            return self._send_json(200, self.fake.synthesize(json.loads(body or b'{}')))
+        self._send_error_status(404, f"No fake for POST {url.path}")
+
+
+def serve(fake, host, port):
+    """Serves the fake APIs until the process is stopped."""
+    handler = type('BoundFakeGoogleHandler', (FakeGoogleHandler,), {'fake': fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"Fake Google APIs listening on http://{host}:{server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+def add_arguments(parser):
+    """Options shared with bench_offline.py, which passes them through."""
+    parser.add_argument('--paragraphs', type=int, default=3000, help="body paragraphs in the synthetic document")
+    parser.add_argument('--tabs', type=int, default=2, help="tabs (books) in the synthetic document")
+    parser.add_argument('--chapters-per-tab', type=int, default=10)
+    parser.add_argument('--document', help="serve this recorded documents.get JSON instead of a synthetic one")
+    parser.add_argument('--distinct-documents', action='store_true',
+                        help="serve a different synthetic document (content and revision) for every document id")
+    parser.add_argument('--docs-latency-ms', type=float, default=400, help="latency of a full documents.get")
+    parser.add_argument('--docs-revision-latency-ms', type=float, default=80, help="latency of a fields=revisionId get")
+    parser.add_argument('--tts-latency-ms', type=float, default=250, help="fixed latency per synthesize call")
+    parser.add_argument('--tts-ms-per-kb', type=float, default=600, help="extra synthesize latency per KB of text")
+    parser.add_argument('--ms-per-char', type=float, default=65, help="audio duration per character of text")
+    parser.add_argument('--tts-error-rate', type=float, default=0.0, help="fraction of synthesize calls that fail")
+    parser.add_argument('--tts-error-status', type=int, default=503, choices=sorted(ERROR_STATUS_NAMES))
+    parser.add_argument('--seed', type=int, default=None, help="seed for injected failures")
+
+
+def distinct_document(args, document_id):
+    """The synthetic document served for document_id with --distinct-documents: its own content and revision."""
+    return dict(
+        make_document(
+            args.paragraphs, tab_count=args.tabs, chapters_per_tab=args.chapters_per_tab,
+            seed=zlib.crc32(document_id.encode('utf-8')), revision_id=f"rev-{document_id}",
+        ),
+        title=f"Synthetic Manuscript {document_id}", documentId=document_id,
+    )
+
+
+def fake_from_args(args):
+    if args.document:
+        with open(args.document) as f:
+            document = json.load(f)
+    else:
+        document = make_document(args.paragraphs, tab_count=args.tabs, chapters_per_tab=args.chapters_per_tab)
+
+    return FakeGoogle(
+        document,
+        docs_latency_ms=args.docs_latency_ms,
+        docs_revision_latency_ms=args.docs_revision_latency_ms,
+        tts_latency_ms=args.tts_latency_ms,
+        tts_ms_per_kb=args.tts_ms_per_kb,
+        ms_per_char=args.ms_per_char,
+        tts_error_rate=args.tts_error_rate,
+        tts_error_status=args.tts_error_status,
+        seed=args.seed,
+        document_for=functools.partial(distinct_document, args) if args.distinct_documents else None,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args()
+    serve(fake_from_args(args), args.host, args.port)
@@ -0,0 +1,52 @@
+"""
+WSGI entry point for load tests: the real Flask app from main.py with the
+Google Docs and Text-to-Speech calls replaced by sleeps of realistic length,
+so gunicorn worker settings can be compared without credentials or quota.
+
+    gunicorn --chdir benchmarks latency_app:app
+
+Latencies (milliseconds) come from FAKE_DOCS_REVISION_MS, FAKE_DOCS_DOCUMENT_MS
+and FAKE_TTS_MS.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main  # noqa: E402
+from audio_codecs import AUDIO_CODECS, codec_for  # noqa: E402
+from synthetic_docs import make_document  # noqa: E402
+
+FAKE_DOCS_REVISION_MS = float(os.environ.get('FAKE_DOCS_REVISION_MS', 80))
+FAKE_DOCS_DOCUMENT_MS = float(os.environ.get('FAKE_DOCS_DOCUMENT_MS', 400))
+FAKE_TTS_MS = float(os.environ.get('FAKE_TTS_MS', 400))
+
+FAKE_DOCUMENT = make_document(2000, tab_count=2, chapters_per_tab=5, revision_id='rev-1')
+# 1.5 s of silence in each output encoding.
+FAKE_SEGMENT_AUDIO = {
+    encoding: codec.silence(codec.default_format, 1500)[0] for encoding, codec in AUDIO_CODECS.items()
+}
+
+
+def fake_fetch_revision(document_id):
+    time.sleep(FAKE_DOCS_REVISION_MS / 1000)
+    return FAKE_DOCUMENT['revisionId']
+
+
+def fake_fetch_document(document_id):
+    time.sleep(FAKE_DOCS_DOCUMENT_MS / 1000)
+    return FAKE_DOCUMENT
+
+
+def fake_synthesize_speech(text_content, voice_name, language_code, audio_config=main.TTS_AUDIO_CONFIG):
+    time.sleep(FAKE_TTS_MS / 1000)
+    return FAKE_SEGMENT_AUDIO[codec_for(audio_config).encoding]
+
+
+main.document_cache.fetch_revision = fake_fetch_revision
+main.document_cache.fetch_document = fake_fetch_document
+main._synthesize_speech = fake_synthesize_speech
+
+app = main.app
@@ -0,0 +1,209 @@
+"""
+Frozen copy of the Docs-to-chapters parser as it was before the single-pass
+rewrite in main.py. bench_docs_parser.py uses it as the reference output and
+the baseline timing; do not change it.
+"""
+import re
+
+
+def legacy_extract_formatted_html_from_elements(elements):
+    html_content = ""
+    if not elements:
+        return html_content
+
+    for element in elements:
+        if 'paragraph' in element:
+            paragraph_html_parts = []
+            for text_run in element['paragraph']['elements']:
+                if 'textRun' in text_run:
+                    content = text_run['textRun']['content']
+                    text_style = text_run['textRun'].get('textStyle', {})
+
+                    processed_content = content.replace('\x0b', '<br>') \
+                                             .replace('\x85', '<br>') \
+                                             .replace('\n', '<br>') 
+
+                    if text_style.get('bold'):
+                        processed_content = f"<strong>{processed_content}</strong>"
+                    if text_style.get('italic'):
+                        processed_content = f"<em>{processed_content}</em>"
+                    if text_style.get('underline'):
+                        processed_content = f"<u>{processed_content}</u>"
+                    
+                    paragraph_html_parts.append(processed_content)
+
+                elif 'horizontalRule' in text_run:
+                    paragraph_html_parts.append("<hr>")
+            
+            full_paragraph_content = "".join(paragraph_html_parts)
+
+            temp_stripped_content = re.sub(r'<[^>]*>', '', full_paragraph_content).strip()
+
+            if temp_stripped_content == "":
+                if '<br>' in full_paragraph_content or '<hr>' in full_paragraph_content:
+                    html_content += f"<p>{full_paragraph_content}</p>"
+                else:
+                    html_content += "<p></p>"
+            else:
+                html_content += f"<p>{full_paragraph_content.strip()}</p>" 
+
+        elif 'table' in element:
+            table_html = "<table>"
+            for row in element['table']['tableRows']:
+                table_html += "<tr>"
+                for cell in row['tableCells']:
+                    table_html += f"<td>{legacy_extract_formatted_html_from_elements(cell['content'])}</td>"
+                table_html += "</tr>"
+            table_html += "</table>"
+            html_content += table_html + "\n"
+            
+    return html_content
+
+def legacy_parse_document(document, document_id):
+    """The original per-element, `+=`-based chapter splitter."""
+    parsed_data = {
+        "title": document.get('title', 'Untitled Document'),
+        "document_id": document_id,
+        "books": []
+    }
+
+    if 'tabs' in document and document['tabs']:
+        for i, tab_data in enumerate(document['tabs']):
+            tab_properties = tab_data.get('tabProperties', {})
+            document_tab = tab_data.get('documentTab', {})
+            tab_body = document_tab.get('body', {})
+            tab_content_elements = tab_body.get('content', [])
+
+            book_entry = {
+                "title": tab_properties.get('title', f"Tab {i+1}"),
+                "id": f"tab-{tab_properties.get('tabId', f'tab_{i+1}').replace('.', '_')}",
+                "chapters": []
+            }
+
+            current_chapter = None
+            chapter_counter = 0
+
+            for element in tab_content_elements:
+                named_style_type = None
+                if 'paragraph' in element:
+                    named_style_type = element['paragraph'].get('paragraphStyle', {}).get('namedStyleType')
+
+                element_html_content = legacy_extract_formatted_html_from_elements([element])
+
+                if named_style_type == 'HEADING_1':
+                    if current_chapter:
+                        book_entry['chapters'].append(current_chapter)
+                    chapter_counter += 1
+                    chapter_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
+
+                    current_chapter = {
+                        "number": chapter_text_content,
+                        "title": "",
+                        "content": "",
+                        "id": f"chapter-{book_entry['id']}-{chapter_counter}"
+                    }
+                elif named_style_type == 'SUBTITLE':
+                    subtitle_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
+
+                    if current_chapter and not current_chapter['title']:
+                        current_chapter['title'] = subtitle_text_content
+                    else:
+                        if current_chapter:
+                            current_chapter['content'] += element_html_content
+                        else:
+                            if not book_entry['chapters'] and not current_chapter:
+                                chapter_counter += 1
+                                current_chapter = {
+                                    "number": "0", "title": "Introduction", "content": "",
+                                    "id": f"chapter-{book_entry['id']}-{chapter_counter}"
+                                }
+                                book_entry['chapters'].append(current_chapter)
+                            if current_chapter:
+                                current_chapter['content'] += element_html_content
+                else:
+                    if current_chapter:
+                        current_chapter['content'] += element_html_content
+                    else:
+                        if not book_entry['chapters'] and not current_chapter:
+                            chapter_counter += 1
+                            current_chapter = {
+                                "number": "0", "title": "Introduction", "content": "",
+                                "id": f"chapter-{book_entry['id']}-{chapter_counter}"
+                            }
+                            book_entry['chapters'].append(current_chapter)
+                        if current_chapter:
+                            current_chapter['content'] += element_html_content
+
+            if current_chapter:
+                book_entry['chapters'].append(current_chapter)
+
+            parsed_data['books'].append(book_entry)
+    else:
+        main_body_content_elements = document.get('body', {}).get('content', [])
+        
+        single_book_entry = {
+            "title": document.get('title', 'Main Document'),
+            "id": "book-main",
+            "chapters": []
+        }
+
+        current_chapter = None
+        chapter_counter = 0
+
+        for element in main_body_content_elements:
+            named_style_type = None
+            if 'paragraph' in element:
+                named_style_type = element['paragraph'].get('paragraphStyle', {}).get('namedStyleType')
+                
+            element_html_content = legacy_extract_formatted_html_from_elements([element])
+
+            if named_style_type == 'HEADING_1':
+                if current_chapter:
+                    single_book_entry['chapters'].append(current_chapter)
+                chapter_counter += 1
+                chapter_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
+                current_chapter = {
+                    "number": chapter_text_content,
+                    "title": "",
+                    "content": "",
+                    "id": f"chapter-main-{chapter_counter}"
+                }
+            elif named_style_type == 'SUBTITLE':
+                subtitle_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
+                if current_chapter and not current_chapter['title']:
+                    current_chapter['title'] = subtitle_text_content
+                else:
+                    if current_chapter:
+                        current_chapter['content'] += element_html_content
+                    else:
+                        if not single_book_entry['chapters'] and not current_chapter:
+                            chapter_counter += 1
+                            current_chapter = {
+                                "number": "0", "title": "Introduction", "content": "",
+                                "id": f"chapter-main-{chapter_counter}"
+                            }
+                            single_book_entry['chapters'].append(current_chapter)
+                        if current_chapter:
+                            current_chapter['content'] += element_html_content
+            else:
+                if current_chapter:
+                    current_chapter['content'] += element_html_content
+                else:
+                    if not single_book_entry['chapters'] and not current_chapter:
+                        chapter_counter += 1
+                        current_chapter = {
+                            "number": "0", "title": "Introduction", "content": "",
+                            "id": f"chapter-main-{chapter_counter}"
+                        }
+                        single_book_entry['chapters'].append(current_chapter)
+                    if current_chapter:
+                        current_chapter['content'] += element_html_content
+
+        if current_chapter:
+            single_book_entry['chapters'].append(current_chapter)
+
+        parsed_data['books'].append(single_book_entry)
+
+    parsed_data['books'] = [book for book in parsed_data['books'] if book['chapters']]
+
+    return parsed_data
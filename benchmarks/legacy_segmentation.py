@@ -0,0 +1,95 @@
+"""
+Frozen copy of process_paragraphs_for_synthesis as it was before byte-limit
+packing and sentence splitting. bench_segmentation.py uses it as the
+baseline; do not change it.
+"""
+
+MAX_CHAR_COUNT_FOR_NARRATION = 768
+
+
+def legacy_process_paragraphs_for_synthesis(paragraphs_data):
+    """
+    Processes the incoming paragraphs (from frontend JSON) to create a new list of segments
+    optimized for speech synthesis, applying concatenation rules based on paragraph type.
+    Each segment will also include the original paragraph indices it covers.
+    """
+    synthesis_segments = []
+    current_narration_buffer = []
+    current_narration_char_count = 0
+    current_narration_original_indices = []
+
+    for paragraph in paragraphs_data:
+        text = paragraph.get('text', '').strip()
+        paragraph_type = paragraph.get('paragraphType', 'narration')
+        original_page_number = paragraph.get('pageNumber')
+        original_paragraph_index_on_page = paragraph.get('paragraphIndexOnPage')
+
+        if not text and paragraph_type != 'horizontal_rule': # Don't skip horizontal_rule even if text is empty
+            continue
+
+        original_paragraph_meta = {
+            "pageNumber": original_page_number,
+            "paragraphIndexOnPage": original_paragraph_index_on_page,
+            "text": text,
+            "paragraphType": paragraph_type # Include paragraphType in meta
+        }
+
+        if paragraph_type == 'horizontal_rule':
+            # If there's an active narration buffer, finalize it before adding horizontal_rule
+            if current_narration_buffer:
+                synthesis_segments.append({
+                    "text": " ".join(current_narration_buffer),
+                    "type": "narration",
+                    "original_paragraphs_meta": current_narration_original_indices
+                })
+                current_narration_buffer = []
+                current_narration_char_count = 0
+                current_narration_original_indices = []
+            
+            # Add horizontal_rule as its own segment
+            synthesis_segments.append({
+                "text": "", # No text to synthesize for horizontal rule
+                "type": "horizontal_rule",
+                "original_paragraphs_meta": [original_paragraph_meta]
+            })
+        elif paragraph_type == 'narration':
+            potential_new_char_count = current_narration_char_count + len(text) + (1 if current_narration_buffer else 0)
+            
+            if current_narration_buffer and potential_new_char_count > MAX_CHAR_COUNT_FOR_NARRATION:
+                synthesis_segments.append({
+                    "text": " ".join(current_narration_buffer),
+                    "type": "narration",
+                    "original_paragraphs_meta": current_narration_original_indices
+                })
+                current_narration_buffer = [text]
+                current_narration_char_count = len(text)
+                current_narration_original_indices = [original_paragraph_meta]
+            else:
+                current_narration_buffer.append(text)
+                current_narration_char_count = potential_new_char_count
+                current_narration_original_indices.append(original_paragraph_meta)
+
+        else: # Dialogue or Italicized type
+            if current_narration_buffer:
+                synthesis_segments.append({
+                    "text": " ".join(current_narration_buffer),
+                    "type": "narration",
+                    "original_paragraphs_meta": current_narration_original_indices
+                })
+                current_narration_buffer = []
+                current_narration_char_count = 0
+                current_narration_original_indices = []
+            
+            synthesis_segments.append({
+                "text": text,
+                "type": paragraph_type,
+                "original_paragraphs_meta": [original_paragraph_meta]
+            })
+
+    if current_narration_buffer:
+        synthesis_segments.append({
+            "text": " ".join(current_narration_buffer),
+            "type": "narration",
+            "original_paragraphs_meta": current_narration_original_indices
+        })
+    return synthesis_segments
@@ -0,0 +1,116 @@
+"""
+Builds synthetic Google Docs API `documents.get` responses for benchmarks.
+
+The documents exercise every branch of the chapter splitter: section breaks,
+HEADING_1 / SUBTITLE paragraphs, styled text runs, vertical tabs and line
+breaks, horizontal rules, empty paragraphs, tables, and text containing
+literal angle brackets.
+"""
+import random
+
+WORDS = (
+    "the quiet river carried her voice past the mill where lanterns burned "
+    "low and the old ferryman counted coins beneath a sky of slow grey clouds"
+).split()
+
+
+def _text_run(content, **text_style):
+    return {"textRun": {"content": content, "textStyle": text_style}}
+
+
+def _paragraph(elements, named_style_type='NORMAL_TEXT'):
+    return {"paragraph": {"paragraphStyle": {"namedStyleType": named_style_type}, "elements": elements}}
+
+
+def _sentence(rng, min_words=6, max_words=40):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def _body_paragraph(rng):
+    roll = rng.random()
+    if roll < 0.03:
+        return _paragraph([_text_run("\n")])
+    if roll < 0.05:
+        return _paragraph([{"horizontalRule": {}}, _text_run("\n")])
+    if roll < 0.06:
+        return _paragraph([_text_run(f"He wrote <{rng.choice(WORDS)}> on the wall & left.\n")])
+    if roll < 0.07:
+        return _paragraph([_text_run("   \x0b  \n")])
+
+    runs = []
+    for _ in range(rng.randint(1, 4)):
+        style = {}
+        style_roll = rng.random()
+        if style_roll < 0.15:
+            style["italic"] = True
+        elif style_roll < 0.22:
+            style["bold"] = True
+        elif style_roll < 0.25:
+            style.update(bold=True, italic=True, underline=True)
+        text = _sentence(rng) + " "
+        if rng.random() < 0.05:
+            text += "\x0b"
+        runs.append(_text_run(text, **style))
+    runs.append(_text_run("\n"))
+    return _paragraph(runs)
+
+
+def _table(rng):
+    return {
+        "table": {
+            "tableRows": [
+                {"tableCells": [{"content": [_body_paragraph(rng)]} for _ in range(3)]}
+                for _ in range(2)
+            ]
+        }
+    }
+
+
+def _content_elements(rng, paragraph_count, chapter_count):
+    elements = [{"sectionBreak": {}}]
+    paragraphs_per_chapter = max(1, paragraph_count // max(1, chapter_count))
+
+    # A few paragraphs before the first heading end up in the Introduction.
+    for _ in range(3):
+        elements.append(_body_paragraph(rng))
+
+    for chapter_index in range(chapter_count):
+        elements.append(_paragraph([_text_run(f"Chapter {chapter_index + 1}\n")], 'HEADING_1'))
+        elements.append(_paragraph([_text_run(_sentence(rng, 2, 5) + "\n")], 'SUBTITLE'))
+        for paragraph_index in range(paragraphs_per_chapter):
+            if paragraph_index % 400 == 399:
+                elements.append(_table(rng))
+            elif paragraph_index % 250 == 249:
+                elements.append(_paragraph([_text_run(_sentence(rng, 2, 5) + "\n")], 'SUBTITLE'))
+            else:
+                elements.append(_body_paragraph(rng))
+    return elements
+
+
+def make_document(paragraph_count, tab_count=1, chapters_per_tab=20, use_tabs=True, seed=1234, revision_id="rev-1"):
+    """
+    Returns a synthetic documents.get response with roughly `paragraph_count`
+    body paragraphs split evenly over `tab_count` tabs (or a single body when
+    use_tabs is False).
+    """
+    rng = random.Random(seed)
+    document = {
+        "title": "Synthetic Manuscript",
+        "documentId": "synthetic-document",
+        "revisionId": revision_id,
+    }
+
+    if not use_tabs:
+        document["body"] = {"content": _content_elements(rng, paragraph_count, chapters_per_tab)}
+        return document
+
+    paragraphs_per_tab = max(1, paragraph_count // tab_count)
+    document["tabs"] = [
+        {
+            "tabProperties": {"tabId": f"t.{tab_index}", "title": f"Book {tab_index + 1}"},
+            "documentTab": {"body": {"content": _content_elements(rng, paragraphs_per_tab, chapters_per_tab)}},
+        }
+        for tab_index in range(tab_count)
+    ]
+    return document
@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from response_encoding import EncodedBody
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# --- Document Cache Configuration ---
+# After DOC_CACHE_REVALIDATE_SECONDS a cached document is still served, but a
+# background revision check is started (stale-while-revalidate). After
+# DOC_CACHE_MAX_STALE_SECONDS the revision check runs before responding.
+DEFAULT_DOC_CACHE_REVALIDATE_SECONDS = 30
+DEFAULT_DOC_CACHE_MAX_STALE_SECONDS = 60 * 60
+# Chapter hashes of this many recent revisions are kept per document so clients
+# can ask for only what changed since the revision they hold.
+DEFAULT_DOC_REVISION_HISTORY = 16
+# Parsed documents are kept least-recently-used first within both limits; the
+# estimate covers the parsed structure and every serialized variant. Each
+# document's chapter bodies, built on demand, are kept within
+# DOC_CACHE_DOCUMENT_MAX_BYTES for that document.
+DEFAULT_DOC_CACHE_MAX_DOCUMENTS = 8
+DEFAULT_DOC_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_DOC_CACHE_DOCUMENT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+
+def chapter_content_hash(chapter):
+    """Hash of everything a client renders for a chapter: number, title and HTML content."""
+    return hashlib.sha256(
+        json.dumps([chapter['number'], chapter['title'], chapter['content']], ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+
+
+def estimate_object_bytes(*objects):
+    """
+    Approximate memory held by nested dicts, lists and strings, counting objects
+    reachable more than once (the chapter index shares the parsed strings) once.
+    """
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
+
+class CachedDocument:
+    """
+    A parsed document together with the revision it was parsed from, plus a
+    table of contents and a chapter index so single chapters can be served
+    without re-serializing the whole document. The document, the table of
+    contents and each chapter are serialized and compressed once, as
+    EncodedBody objects.
+
+    Chapter bodies are built on first request and kept least-recently-used
+    first while the document's estimated memory stays within max_bytes; the
+    parsed document and its full body are always kept, since every response
+    is served from them.
+    """
+
+    def __init__(self, document_id, revision_id, parsed, paragraph_hashes=None, max_bytes=None, on_resize=None):
+        self.document_id = document_id
+        self.revision_id = revision_id
+        self.parsed = parsed
+        self.body = EncodedBody.from_json(parsed)
+        self.etag = self.body.etag
+        self.checked_at = time.monotonic()
+
+        toc_books = []
+        self.chapters = {}
+        for book in parsed.get('books', []):
+            toc_chapters = []
+            for chapter in book['chapters']:
+                content_hash = chapter_content_hash(chapter)
+                toc_chapters.append({
+                    "id": chapter['id'],
+                    "number": chapter['number'],
+                    "title": chapter['title'],
+                    "contentBytes": len(chapter['content'].encode('utf-8')),
+                    "contentHash": content_hash,
+                })
+                # The parser can list a chapter twice (the Introduction); both copies are identical.
+                self.chapters.setdefault(chapter['id'], dict(
+                    chapter,
+                    bookId=book['id'],
+                    contentHash=content_hash,
+                    paragraphHashes=(paragraph_hashes or {}).get(chapter['id'], []),
+                ))
+            toc_books.append({"title": book['title'], "id": book['id'], "chapters": toc_chapters})
+
+        self.toc = {
+            "title": parsed.get('title'),
+            "document_id": parsed.get('document_id'),
+            "revision_id": revision_id,
+            "books": toc_books,
+        }
+        self.toc_body = EncodedBody.from_json(self.toc)
+        self.chapter_hashes = {chapter_id: chapter['contentHash'] for chapter_id, chapter in self.chapters.items()}
+
+        self.max_bytes = max_bytes
+        self.on_resize = on_resize
+        self.parsed_bytes = estimate_object_bytes(parsed, self.chapters, self.toc, self.chapter_hashes)
+        self.base_bytes = self.parsed_bytes + self.body.size + self.toc_body.size
+        self._chapter_bodies = OrderedDict()
+        self._chapter_body_bytes = 0
+        self._lock = threading.Lock()
+        if max_bytes and self.base_bytes > max_bytes:
+            logger.warning(
+                f"Document {document_id} needs about {self.base_bytes} bytes, over its {max_bytes} byte quota; "
+                f"chapter bodies will not be kept."
+            )
+
+    @property
+    def memory_bytes(self):
+        """Estimated bytes held: parsed structure, document and TOC bodies, and kept chapter bodies."""
+        return self.base_bytes + self._chapter_body_bytes
+
+    def chapter_body(self, chapter_id):
+        """
+        Returns the EncodedBody for one chapter, with its contentHash as ETag,
+        or None if the document has no such chapter.
+        """
+        with self._lock:
+            body = self._chapter_bodies.get(chapter_id)
+            if body is not None:
+                self._chapter_bodies.move_to_end(chapter_id)
+                return body
+
+        chapter = self.chapters.get(chapter_id)
+        if chapter is None:
+            return None
+        body = EncodedBody.from_json(chapter, etag=chapter['contentHash'])
+
+        with self._lock:
+            if chapter_id in self._chapter_bodies:
+                return self._chapter_bodies[chapter_id]
+            self._chapter_bodies[chapter_id] = body
+            self._chapter_body_bytes += body.size
+            while self.max_bytes and self.memory_bytes > self.max_bytes and self._chapter_bodies:
+                _, evicted = self._chapter_bodies.popitem(last=False)
+                self._chapter_body_bytes -= evicted.size
+        if self.on_resize:
+            self.on_resize(self)
+        return body
+
+    def memory_stats(self):
+        with self._lock:
+            return {
+                "revision_id": self.revision_id,
+                "bytes": self.memory_bytes,
+                "max_bytes": self.max_bytes,
+                "parsed_bytes": self.parsed_bytes,
+                "body_bytes": self.body.size,
+                "toc_bytes": self.toc_body.size,
+                "chapter_bodies": len(self._chapter_bodies),
+                "chapter_body_bytes": self._chapter_body_bytes,
+                "checked_seconds_ago": round(time.monotonic() - self.checked_at, 1),
+            }
+
+
+def diff_chapter_hashes(old_hashes, new_hashes):
+    """
+    Compares two {chapter id: content hash} maps and returns
+    (added, changed, removed) lists of chapter ids.
+    """
+    added = [chapter_id for chapter_id in new_hashes if chapter_id not in old_hashes]
+    changed = [
+        chapter_id for chapter_id, content_hash in new_hashes.items()
+        if chapter_id in old_hashes and old_hashes[chapter_id] != content_hash
+    ]
+    removed = [chapter_id for chapter_id in old_hashes if chapter_id not in new_hashes]
+    return added, changed, removed
+
+
+class DocumentCache:
+    """
+    Per-worker cache of parsed documents keyed by the Docs revisionId.
+
+    fetch_revision(document_id) must return the document's current revisionId
+    with a cheap partial request; fetch_document(document_id) must return the
+    full document JSON; parse(document, document_id) returns (parsed,
+    paragraph_hashes), the served structure and chapter id -> paragraph hashes.
+    Documents are only re-downloaded and re-parsed when the revisionId changes.
+    on_load(entry), if set, is called with every freshly parsed entry, on the
+    thread that loaded it: after a revision change, but also on a worker's
+    first load and when an evicted document is loaded again, so a change made
+    while no worker held the document is still noticed.
+
+    At most max_documents documents, and max_bytes of estimated memory, are
+    kept; the least recently used documents are dropped first and simply
+    loaded again when next requested. Concurrent loads of the same document
+    share one download and parse. Revision history outlives eviction, so
+    ?since= deltas still work for a document that was reloaded. metrics (a
+    metrics.Metrics, optional) receives per-document memory gauges.
+    """
+
+    def __init__(self, fetch_revision, fetch_document, parse, revalidate_after_seconds, max_stale_seconds,
+                 history_size=DEFAULT_DOC_REVISION_HISTORY, on_load=None,
+                 max_documents=DEFAULT_DOC_CACHE_MAX_DOCUMENTS, max_bytes=DEFAULT_DOC_CACHE_MAX_BYTES,
+                 document_max_bytes=DEFAULT_DOC_CACHE_DOCUMENT_MAX_BYTES, metrics=None):
+        self.fetch_revision = fetch_revision
+        self.fetch_document = fetch_document
+        self.parse = parse
+        self.revalidate_after_seconds = revalidate_after_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.history_size = history_size
+        self.on_load = on_load
+        self.max_documents = max(1, max_documents)
+        self.max_bytes = max_bytes
+        self.document_max_bytes = document_max_bytes
+        self.metrics = metrics
+        self._entries = OrderedDict()
+        self._history = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._loads = SingleFlight()
+        self.evictions = 0
+
+    def get(self, document_id):
+        """
+        Returns the CachedDocument for document_id. Only the first request, or a
+        request after max_stale_seconds, waits on the Docs API; otherwise a stale
+        entry is returned immediately while it is revalidated in the background.
+        """
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is not None:
+                self._entries.move_to_end(document_id)
+        if entry is None:
+            return self._load(document_id)
+
+        age = time.monotonic() - entry.checked_at
+        if age > self.max_stale_seconds:
+            return self._revalidate(document_id, entry)
+        if age > self.revalidate_after_seconds:
+            self._revalidate_in_background(document_id, entry)
+        return entry
+
+    def _load(self, document_id):
+        entry, _ = self._loads.do(document_id, lambda: self._load_uncoalesced(document_id))
+        return entry
+
+    def _load_uncoalesced(self, document_id):
+        document = self.fetch_document(document_id)
+        revision_id = document.get('revisionId')
+        parsed, paragraph_hashes = self.parse(document, document_id)
+        del document  # The raw Docs JSON is several times the parsed size; let it go before building bodies.
+        entry = CachedDocument(
+            document_id, revision_id, parsed, paragraph_hashes,
+            max_bytes=self.document_max_bytes, on_resize=self._publish_memory
+        )
+        evicted = []
+        with self._lock:
+            self._entries[document_id] = entry
+            self._entries.move_to_end(document_id)
+            history = self._history.setdefault(document_id, OrderedDict())
+            history[entry.revision_id] = entry.chapter_hashes
+            history.move_to_end(entry.revision_id)
+            while len(history) > self.history_size:
+                history.popitem(last=False)
+
+            total_bytes = sum(cached.memory_bytes for cached in self._entries.values())
+            while len(self._entries) > 1 and (len(self._entries) > self.max_documents or total_bytes > self.max_bytes):
+                _, cold = self._entries.popitem(last=False)
+                total_bytes -= cold.memory_bytes
+                evicted.append(cold)
+            self.evictions += len(evicted)
+
+        logger.info(f"Cached document {document_id} at revision {entry.revision_id} ({entry.memory_bytes} bytes).")
+        self._publish_memory(entry)
+        for cold in evicted:
+            logger.info(f"Evicted document {cold.document_id} ({cold.memory_bytes} bytes) from the document cache.")
+            self._gauge_set('document_cache_bytes', 0, document=cold.document_id)
+            if self.metrics is not None:
+                self.metrics.inc('document_cache_evictions_total')
+        if self.on_load:
+            try:
+                self.on_load(entry)
+            except Exception as e:
+                logger.error(f"Load handler failed for document {document_id}: {e}", exc_info=True)
+        return entry
+
+    def _revalidate(self, document_id, entry):
+        revision_id = self.fetch_revision(document_id)
+        if revision_id and revision_id == entry.revision_id:
+            entry.checked_at = time.monotonic()
+            return entry
+        logger.info(f"Document {document_id} changed from revision {entry.revision_id} to {revision_id}; re-parsing.")
+        return self._load(document_id)
+
+    def chapter_hashes_at(self, document_id, revision_id):
+        """Returns {chapter id: content hash} for a recent revision seen by this worker, or None."""
+        with self._lock:
+            return self._history.get(document_id, {}).get(revision_id)
+
+    def _revalidate_in_background(self, document_id, entry):
+        with self._lock:
+            if document_id in self._refreshing:
+                return
+            self._refreshing.add(document_id)
+
+        def refresh():
+            try:
+                self._revalidate(document_id, entry)
+            except Exception as e:
+                # Keep serving the stale entry; the next request retries.
+                logger.error(f"Background revalidation of document {document_id} failed: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(document_id)
+
+        threading.Thread(target=refresh, name=f'doc-revalidate-{document_id[:8]}', daemon=True).start()
+
+    def invalidate(self, document_id):
+        with self._lock:
+            entry = self._entries.pop(document_id, None)
+        if entry is not None:
+            self._gauge_set('document_cache_bytes', 0, document=document_id)
+
+    def _publish_memory(self, entry):
+        with self._lock:
+            cached = self._entries.get(entry.document_id) is entry
+        if cached:
+            self._gauge_set('document_cache_bytes', entry.memory_bytes, document=entry.document_id)
+
+    def _gauge_set(self, name, value, **labels):
+        if self.metrics is not None:
+            self.metrics.gauge_set(name, value, **labels)
+
+    def stats(self):
+        """Memory use of every document cached by this worker, least recently used first, and the limits."""
+        with self._lock:
+            entries = list(self._entries.values())
+            evictions = self.evictions
+        documents = {entry.document_id: entry.memory_stats() for entry in entries}
+        return {
+            "documents": documents,
+            "bytes": sum(document['bytes'] for document in documents.values()),
+            "max_bytes": self.max_bytes,
+            "max_documents": self.max_documents,
+            "document_max_bytes": self.document_max_bytes,
+            "evictions": evictions,
+            "loads": self._loads.stats(),
+        }
+
+
+def document_cache_from_env(fetch_revision, fetch_document, parse, on_load=None, metrics=None):
+    """Builds the DocumentCache configured through DOC_CACHE_* environment variables."""
+    return DocumentCache(
+        fetch_revision=fetch_revision,
+        fetch_document=fetch_document,
+        parse=parse,
+        revalidate_after_seconds=int(os.environ.get('DOC_CACHE_REVALIDATE_SECONDS', DEFAULT_DOC_CACHE_REVALIDATE_SECONDS)),
+        max_stale_seconds=int(os.environ.get('DOC_CACHE_MAX_STALE_SECONDS', DEFAULT_DOC_CACHE_MAX_STALE_SECONDS)),
+        history_size=int(os.environ.get('DOC_CACHE_REVISION_HISTORY', DEFAULT_DOC_REVISION_HISTORY)),
+        on_load=on_load,
+        max_documents=int(os.environ.get('DOC_CACHE_MAX_DOCUMENTS', DEFAULT_DOC_CACHE_MAX_DOCUMENTS)),
+        max_bytes=int(os.environ.get('DOC_CACHE_MAX_BYTES', DEFAULT_DOC_CACHE_MAX_BYTES)),
+        document_max_bytes=int(os.environ.get('DOC_CACHE_DOCUMENT_MAX_BYTES', DEFAULT_DOC_CACHE_DOCUMENT_MAX_BYTES)),
+        metrics=metrics,
+    )
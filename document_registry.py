@@ -0,0 +1,76 @@
+"""
+The documents this deployment serves, and which one the current request is for.
+
+DOCUMENT_IDS is a comma-separated allow-list of Google Docs ids; the first one
+is the default for requests that do not name a document, so single-book
+clients keep working unchanged. Ids outside the list are rejected before any
+Docs API call is made.
+
+document_scope() marks the document a block of work belongs to. The audio
+caches file what is synthesized inside it under that document, so each book
+has its own byte quota; Metrics.submit() and the pre-warm thread carry the
+scope over to the threads they start.
+"""
+import os
+import re
+import contextvars
+from contextlib import contextmanager
+
+# --- Document Registry Configuration ---
+DEFAULT_DOCUMENT_IDS = '1ubt637f0K87_Och3Pin9GbJM7w6wzf3M2RCmHbmHgYI'
+# Google Docs ids are URL-safe base64-ish strings.
+DOCUMENT_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{10,128}')
+
+_current_document = contextvars.ContextVar('read_serene_document', default='')
+
+
+@contextmanager
+def document_scope(document_id):
+    """Runs a block, and any work it hands to a pool with Metrics.submit(), on behalf of document_id."""
+    token = _current_document.set(document_id or '')
+    try:
+        yield
+    finally:
+        _current_document.reset(token)
+
+
+def current_document_id():
+    """The document of the enclosing document_scope(), or '' outside one."""
+    return _current_document.get()
+
+
+class DocumentRegistry:
+    """The allow-list of servable document ids, in configuration order."""
+
+    def __init__(self, document_ids):
+        self.document_ids = tuple(dict.fromkeys(document_ids))
+        if not self.document_ids:
+            raise ValueError("At least one document id must be configured in DOCUMENT_IDS.")
+        invalid = [document_id for document_id in self.document_ids if not DOCUMENT_ID_PATTERN.fullmatch(document_id)]
+        if invalid:
+            raise ValueError(f"Invalid document ids in DOCUMENT_IDS: {', '.join(invalid)}")
+        self.default_document_id = self.document_ids[0]
+
+    def __contains__(self, document_id):
+        return document_id in self.document_ids
+
+    def __iter__(self):
+        return iter(self.document_ids)
+
+    def __len__(self):
+        return len(self.document_ids)
+
+    def resolve(self, requested_document_id):
+        """
+        Returns the document id to serve for a requested id: the default when
+        none was given, the id itself when it is allowed, else None.
+        """
+        if not requested_document_id:
+            return self.default_document_id
+        return requested_document_id if requested_document_id in self.document_ids else None
+
+
+def document_registry_from_env():
+    """Builds the DocumentRegistry from the DOCUMENT_IDS environment variable."""
+    spec = os.environ.get('DOCUMENT_IDS', DEFAULT_DOCUMENT_IDS)
+    return DocumentRegistry([document_id.strip() for document_id in spec.split(',') if document_id.strip()])
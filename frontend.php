@@ -296,7 +296,11 @@ require_once("ato4_kot/dtcol.php");  //database structure assistance, not needed
          */
         async function fetchGoogleVoices() {
             try {
-                const response = await fetch(RAILWAY_VOICES_API_URL, {
+                // Only English Chirp voices are offered; let the server filter the catalogue.
+                const voicesUrl = new URL(RAILWAY_VOICES_API_URL);
+                voicesUrl.searchParams.set('languageCode', 'en');
+                voicesUrl.searchParams.set('voiceType', 'Chirp');
+                const response = await fetch(voicesUrl.href, {
                     method: 'GET',
                     headers: {
                         'X-API-Key': RAILWAY_APP_API_KEY, 
@@ -1025,6 +1029,10 @@ require_once("ato4_kot/dtcol.php");  //database structure assistance, not needed
                         languageCode: activeLanguageCode,
                         chapterParagraphs: chapterTextData // This JSON contains per-page info
                     };
+                    // Ogg Opus is a fraction of MP3's size for speech; ask for it where the browser can play it
+                    if (audioPlayer.canPlayType('audio/ogg; codecs=opus')) {
+                        payloadToSend.audioEncoding = 'OGG_OPUS';
+                    }
 
                     console.log("Sending synthesis request with payload:", payloadToSend);
 
@@ -1052,23 +1060,11 @@ require_once("ato4_kot/dtcol.php");  //database structure assistance, not needed
                         let cumulativeTimeMs = 0; // For accumulating timestamps across pages
 
                         for (const pageResponse of data.pageAudioResponses) {
-                            if (pageResponse.audioContent && pageResponse.format) {
-                                const audioUrl = `data:${pageResponse.format};base64,${pageResponse.audioContent}`;
-                                
-                                // Create a temporary audio element to get duration
-                                const pageAudioTemp = new Audio(audioUrl);
-                                await new Promise(resolve => {
-                                    pageAudioTemp.onloadedmetadata = () => {
-                                        pageAudioTemp.durationMs = pageAudioTemp.duration * 1000; // Store duration in ms
-                                        resolve();
-                                    };
-                                    pageAudioTemp.onerror = () => {
-                                        console.error("Error loading page audio for duration calculation. Defaulting to 0.");
-                                        pageAudioTemp.durationMs = 0; // Default to 0 on error
-                                        resolve();
-                                    };
-                                });
-                                
+                            if (pageResponse.audioUrl && pageResponse.format) {
+                                // Page audio is served as a cacheable binary URL relative to the backend
+                                const audioUrl = new URL(pageResponse.audioUrl, RAILWAY_TTS_API_URL).href;
+                                const pageDurationMs = pageResponse.durationMs || 0; // Duration comes from the backend
+
                                 const pageTimestamps = pageResponse.timestamps || [];
                                 const adjustedTimestamps = pageTimestamps.map(ts => ({
                                     markName: ts.markName,
@@ -1078,14 +1074,14 @@ require_once("ato4_kot/dtcol.php");  //database structure assistance, not needed
                                 chapterAudioCache[chapterId].pages.push({
                                     audioUrl: audioUrl,
                                     timestamps: pageTimestamps, // Original timestamps relative to page start
-                                    durationMs: pageAudioTemp.durationMs // Duration of this specific page's audio
+                                    durationMs: pageDurationMs // Duration of this specific page's audio
                                 });
                                 
                                 chapterOverallTimestamps = chapterOverallTimestamps.concat(adjustedTimestamps);
-                                cumulativeTimeMs += pageAudioTemp.durationMs; // Add this page's duration to cumulative
+                                cumulativeTimeMs += pageDurationMs; // Add this page's duration to cumulative
 
                             } else {
-                                console.warn("Missing audioContent or format in a pageAudioResponse.");
+                                console.warn("Missing audioUrl or format in a pageAudioResponse.");
                             }
                         }
 
@@ -1254,8 +1250,13 @@ require_once("ato4_kot/dtcol.php");  //database structure assistance, not needed
             updatePlaybackControlVisibility(false, false);
 
             try {
-                // Fetch main document content from Railway API
-                const response = await fetch(RAILWAY_API_URL, {
+                // Fetch main document content from Railway API. Other books are opened
+                // as ?documentId=<id>; without it the server's default document is used.
+                const requestedDocId = new URLSearchParams(window.location.search).get('documentId');
+                const documentUrl = requestedDocId
+                    ? `${RAILWAY_API_URL}?documentId=${encodeURIComponent(requestedDocId)}`
+                    : RAILWAY_API_URL;
+                const response = await fetch(documentUrl, {
                     method: 'GET',
                     headers: {
                         'X-API-Key': RAILWAY_APP_API_KEY,
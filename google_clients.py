@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import logging
+import threading
+
+import grpc
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from google.cloud import texttospeech
+
+logger = logging.getLogger(__name__)
+
+DOCS_HTTP_TIMEOUT_SECONDS = int(os.environ.get('DOCS_HTTP_TIMEOUT_SECONDS', 60))
+WARM_UP_TIMEOUT_SECONDS = int(os.environ.get('GOOGLE_CLIENT_WARM_UP_TIMEOUT_SECONDS', 10))
+# Endpoint overrides, e.g. to point the clients at the local stand-ins in
+# benchmarks/fake_google.py. A plain http:// TTS endpoint needs the REST transport.
+DOCS_API_ENDPOINT = os.environ.get('DOCS_API_ENDPOINT')
+TTS_API_ENDPOINT = os.environ.get('TTS_API_ENDPOINT')
+TTS_TRANSPORT = os.environ.get('TTS_TRANSPORT', 'grpc')
+
+
+class GoogleClientRegistry:
+    """
+    Per-worker registry of long-lived Google API clients.
+
+    Credentials are parsed once. The Text-to-Speech client (gRPC, thread-safe)
+    is shared by every thread of the worker. The Docs API resource is built once
+    and shared, while each thread gets its own authorized httplib2 connection,
+    since httplib2 is not thread-safe. Everything is reset after a fork so no
+    gRPC channel or socket is ever shared between processes.
+
+    The clients count as warm once both have been built, whether by warm()
+    in gunicorn's post_fork hook or by the first requests that needed them
+    (flask run, tests).
+    """
+
+    def __init__(self, docs_scopes):
+        self.docs_scopes = docs_scopes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._credentials = None
+        self._docs_credentials = None
+        self._docs_service = None
+        self._tts_client = None
+        self._tts_channel_ready = False
+        self._warmed_at = None
+        self._warm_error = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+                    self._local = threading.local()
+
+    def credentials(self):
+        """Returns the service account credentials, parsing them on first use."""
+        self._check_pid()
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    creds_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+                    if not creds_json:
+                        raise ValueError("GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set.")
+                    info = json.loads(creds_json)
+                    self._credentials = service_account.Credentials.from_service_account_info(info)
+        return self._credentials
+
+    def docs_credentials(self):
+        """Returns the credentials scoped for the Docs API, shared by every thread's transport."""
+        self._check_pid()
+        if self._docs_credentials is None:
+            credentials = self.credentials()
+            with self._lock:
+                if self._docs_credentials is None:
+                    self._docs_credentials = credentials.with_scopes(self.docs_scopes)
+        return self._docs_credentials
+
+    def docs_service(self):
+        """Returns the shared Google Docs API resource."""
+        self._check_pid()
+        if self._docs_service is None:
+            credentials = self.docs_credentials()
+            with self._lock:
+                if self._docs_service is None:
+                    # The docs v1 discovery document ships with the client library,
+                    # so building does not hit the network.
+                    self._docs_service = build(
+                        'docs', 'v1', credentials=credentials, cache_discovery=False, static_discovery=True,
+                        client_options={'api_endpoint': DOCS_API_ENDPOINT} if DOCS_API_ENDPOINT else None,
+                    )
+                    logger.info("Google Docs service initialized successfully.")
+                    self._note_built()
+        return self._docs_service
+
+    def docs_http(self):
+        """Returns this thread's authorized, connection-reusing Docs API transport."""
+        self._check_pid()
+        http = getattr(self._local, 'docs_http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(
+                self.docs_credentials(), http=httplib2.Http(timeout=DOCS_HTTP_TIMEOUT_SECONDS)
+            )
+            self._local.docs_http = http
+        return http
+
+    def tts_client(self):
+        """Returns the shared Text-to-Speech client."""
+        self._check_pid()
+        if self._tts_client is None:
+            credentials = self.credentials()
+            with self._lock:
+                if self._tts_client is None:
+                    self._tts_client = texttospeech.TextToSpeechClient(
+                        credentials=credentials,
+                        transport=TTS_TRANSPORT,
+                        client_options={'api_endpoint': TTS_API_ENDPOINT} if TTS_API_ENDPOINT else None,
+                    )
+                    logger.info("Google Text-to-Speech client initialized successfully.")
+                    self._note_built()
+        return self._tts_client
+
+    def _note_built(self):
+        # Called under self._lock once a client is built.
+        if self._warmed_at is None and self._docs_service is not None and self._tts_client is not None:
+            self._warmed_at = time.time()
+
+    def warm(self):
+        """
+        Builds every client and opens their connections ahead of the first request:
+        fetches an OAuth token, builds the Docs resource and this thread's transport,
+        and waits for the TTS gRPC channel to finish its TLS handshake.
+        Failures are logged and recorded, never raised, so a worker still boots.
+        """
+        started = time.monotonic()
+        try:
+            docs_credentials = self.docs_credentials()
+            if not docs_credentials.valid:
+                docs_credentials.refresh(GoogleAuthRequest())
+            self.docs_service()
+            self.docs_http()
+
+            client = self.tts_client()
+            if TTS_TRANSPORT == 'grpc':
+                grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=WARM_UP_TIMEOUT_SECONDS)
+                self._tts_channel_ready = True
+
+            self._warmed_at = time.time()
+            self._warm_error = None
+            logger.info(f"Google clients warmed in {(time.monotonic() - started) * 1000:.0f}ms (pid {os.getpid()}).")
+        except Exception as e:
+            self._warm_error = str(e)
+            logger.error(f"Warming Google clients failed: {e}", exc_info=True)
+
+    def status(self):
+        """Reports which clients are built and warm in this worker."""
+        self._check_pid()
+        return {
+            "pid": self._pid,
+            "credentials_loaded": self._credentials is not None,
+            "docs_service_ready": self._docs_service is not None,
+            "tts_client_ready": self._tts_client is not None,
+            "tts_channel_ready": self._tts_channel_ready,
+            "warm": self._warmed_at is not None and self._warm_error is None,
+            "warmed_at": self._warmed_at,
+            "warm_error": self._warm_error,
+        }
@@ -0,0 +1,60 @@
+# Gunicorn picks this file up automatically from the working directory.
+# Command-line flags in the procfile (e.g. --bind) still take precedence.
+import os
+import sys
+
+# The hooks import the app's modules, also when gunicorn runs with --chdir
+# elsewhere (as the benchmarks do).
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# --- Concurrency ---
+# Requests spend nearly all their time waiting on Google Docs and Text-to-Speech,
+# so each worker process serves several requests at once on a thread pool
+# (gthread) instead of one at a time (sync). The Google clients are thread-safe
+# as used here: each thread gets its own Docs HTTP transport, the TTS gRPC
+# client is shared, and the SQLite caches keep one connection per thread.
+# gevent is not supported: gRPC would need its gevent integration enabled first.
+#
+#   WEB_CONCURRENCY        worker processes (default 2)
+#   GUNICORN_THREADS       request threads per worker (default 8)
+#   GUNICORN_WORKER_CLASS  "gthread" (default), or "sync" for the old behaviour
+#   GUNICORN_TIMEOUT       seconds a worker may go without a heartbeat (default 120)
+#
+# Concurrent requests per worker = GUNICORN_THREADS. Upstream TTS calls per
+# worker are bounded separately by SYNTHESIS_MAX_WORKERS, CHAPTER_PAGE_MAX_WORKERS
+# and, for background chapter jobs, SYNTHESIS_JOB_PAGE_MAX_WORKERS.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+
+def on_starting(server):
+    """Drops per-worker metrics files left by a previous run of the server."""
+    from metrics import DEFAULT_METRICS_DIR, clear_metrics_dir
+
+    clear_metrics_dir(os.environ.get('METRICS_DIR', DEFAULT_METRICS_DIR))
+
+
+def post_fork(server, worker):
+    """
+    Builds and connects the Google Docs and Text-to-Speech clients in each new
+    worker, after the fork, so no gRPC channel or socket is shared with the
+    master and the first request does not pay discovery and TLS setup costs.
+    Also starts the worker's synthesis job threads, so jobs left by a worker
+    that died are resumed without waiting for a request.
+    """
+    import main
+
+    main.warm_google_clients()
+    server.log.info(f"Worker {worker.pid} Google clients: {main.google_clients.status()}")
+    main.synthesis_jobs.start_workers()
+
+
+def worker_exit(server, worker):
+    """Writes the exiting worker's final metrics and buffered audio cache counters so they keep their counts."""
+    import main
+
+    main.metrics.flush()
+    main.audio_cache.flush()
+    main.page_audio_store.flush()
@@ -1,9 +1,11 @@
 import os
 import json
-from flask import Flask, request, jsonify
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from flask import Flask, Response, g, request, jsonify, send_file
 from googleapiclient.errors import HttpError
+from google_clients import GoogleClientRegistry
+from document_cache import diff_chapter_hashes, document_cache_from_env
+from document_registry import current_document_id, document_registry_from_env, document_scope
+from voice_catalogue import voice_catalogue_from_env
 from flask_cors import CORS
 import re
 import requests
@@ -12,97 +14,356 @@ from bs4 import BeautifulSoup
 # NEW IMPORTS FOR TEXT-TO-SPEECH
 from google.cloud import texttospeech
 import base64
-from functools import lru_cache
-
-# NEW IMPORT for pydub
-from pydub import AudioSegment
+import hashlib
 import io
 import tempfile
-import shutil
+from audio_cache import audio_cache_from_env, make_cache_key
+from single_flight import SingleFlight
+from metrics import metrics_from_env
+from response_encoding import FastJSONProvider, compress_bytes, negotiate_encoding
+from synthesis_jobs import synthesis_job_queue_from_env
+from tts_scheduler import (
+    PRIORITIES_BY_NAME, PRIORITY_BACKGROUND, PRIORITY_CURRENT, PRIORITY_UPCOMING, tts_priority, tts_scheduler_from_env
+)
+from google.api_core.exceptions import ServiceUnavailable, TooManyRequests
+
 import math
+import itertools
+import time
+import threading
+from prewarm import (
+    DEFAULT_PREWARM_AUDIO_ENCODINGS, DEFAULT_PREWARM_VOICES, chapter_paragraphs_for_synthesis,
+    parse_audio_encodings, parse_voices, prewarm_job_from_env
+)
+from audio_codecs import (
+    AUDIO_CODECS, AUDIO_CODECS_BY_EXTENSION, DEFAULT_AUDIO_ENCODING, codec_for, codec_for_audio, make_audio_config
+)
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
+# jsonify() encodes with orjson when it is installed; see response_encoding.py.
+app.json = FastJSONProvider(app)
 CORS(app)
 
+# --- Metrics ---
+# Per-worker counters and latency histograms, merged across workers on
+# /metrics (Prometheus text format). Each response also gets a Server-Timing
+# header summarizing the stages recorded while serving it. See metrics.py.
+metrics = metrics_from_env()
+metrics.describe('stage_seconds', 'histogram', "Time spent in each processing stage (docs_fetch, docs_revision, doc_parse, tts_queue, tts, decode, merge, encode, serialize, compress).")
+metrics.describe('request_seconds', 'histogram', "HTTP request latency by endpoint, until the response is returned (streamed bodies excluded).")
+metrics.describe('requests_total', 'counter', "HTTP requests by endpoint and status code.")
+metrics.describe('requests_in_flight', 'gauge', "HTTP requests currently being handled, per worker.")
+metrics.describe('tts_requests_total', 'counter', "Text-to-Speech API calls by outcome.")
+metrics.describe('tts_queue_wait_seconds', 'histogram', "Time Text-to-Speech calls waited for a slot and a rate-limit token, by priority.")
+metrics.describe('tts_queue_depth', 'gauge', "Text-to-Speech calls waiting to start, by priority, per worker.")
+metrics.describe('tts_concurrency_limit', 'gauge', "Current adaptive limit on concurrent Text-to-Speech calls, per worker.")
+metrics.describe('tts_throttled_total', 'counter', "Text-to-Speech calls answered with 429 or 503, by priority.")
+metrics.describe('synthesis_jobs', 'gauge', "Asynchronous chapter synthesis jobs by state, for the whole node.")
+metrics.describe('tts_retries_total', 'counter', "Text-to-Speech calls retried after throttling, by priority.")
+metrics.describe('tts_segments_assembled_total', 'counter', "Packed segments served by joining cached per-paragraph audio instead of calling Text-to-Speech.")
+metrics.describe('document_cache_bytes', 'gauge', "Estimated memory held by each cached document, per worker.")
+metrics.describe('document_cache_evictions_total', 'counter', "Documents dropped from the parsed-document cache to stay within its limits.")
+metrics.describe('audio_cache_document_bytes', 'gauge', "Bytes of stored audio filed under each document, for the whole node.")
+metrics.describe('audio_cache_document_entries', 'gauge', "Stored audio entries filed under each document, for the whole node.")
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_flusher()
+    g.request_timings, g.request_timings_token = metrics.start_request()
+    metrics.gauge_add('requests_in_flight', 1)
+
+@app.after_request
+def finish_request_metrics(response):
+    timings = getattr(g, 'request_timings', None)
+    if timings is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('request_seconds', time.perf_counter() - timings.started, endpoint=endpoint)
+        metrics.inc('requests_total', endpoint=endpoint, status=response.status_code)
+        response.headers['Server-Timing'] = timings.header_value()
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    token = getattr(g, 'request_timings_token', None)
+    if token is not None:
+        metrics.gauge_add('requests_in_flight', -1)
+        metrics.end_request(token)
+
 # --- Google Docs API Configuration ---
 SCOPES = ['https://www.googleapis.com/auth/documents.readonly']
 
+# Long-lived, per-worker Google clients. Warmed in the gunicorn post_fork hook
+# (see gunicorn.conf.py) so the first request does not pay client setup costs.
+google_clients = GoogleClientRegistry(docs_scopes=SCOPES)
+
 def get_google_cloud_credentials():
     try:
-        creds_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
-        if not creds_json:
-            app.logger.error("GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set.")
-            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set.")
-
-        info = json.loads(creds_json)
-        return service_account.Credentials.from_service_account_info(info)
+        return google_clients.credentials()
     except Exception as e:
         app.logger.error(f"Error loading Google Cloud credentials: {e}", exc_info=True)
         raise
 
 def get_docs_service():
-    """Initializes and returns a Google Docs API service client."""
+    """Returns the shared Google Docs API service client."""
     try:
-        credentials = get_google_cloud_credentials()
-        service = build('docs', 'v1', credentials=credentials)
-        app.logger.info("Google Docs service initialized successfully.")
-        return service
+        return google_clients.docs_service()
     except Exception as e:
         app.logger.error(f"Error initializing Google Docs service: {e}", exc_info=True)
         raise
 
+def warm_google_clients():
+    """Builds and connects the Google clients for this worker ahead of the first request."""
+    google_clients.warm()
+
+HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+def paragraph_html_and_text(paragraph):
+    """
+    Renders one Docs paragraph as HTML in a single pass over its text runs and
+    also returns its plain text (what stripping the tags from that HTML gives).
+    Emptiness is decided from the raw text runs, so the tag-stripping regex only
+    runs for the rare paragraph whose text itself contains a '<'.
+    """
+    html_parts = []
+    text_parts = []
+    for text_run in paragraph['elements']:
+        if 'textRun' in text_run:
+            content = text_run['textRun']['content']
+            text_style = text_run['textRun'].get('textStyle', {})
+
+            processed_content = content.replace('\x0b', '<br>') \
+                                       .replace('\x85', '<br>') \
+                                       .replace('\n', '<br>')
+
+            if text_style.get('bold'):
+                processed_content = f"<strong>{processed_content}</strong>"
+            if text_style.get('italic'):
+                processed_content = f"<em>{processed_content}</em>"
+            if text_style.get('underline'):
+                processed_content = f"<u>{processed_content}</u>"
+
+            html_parts.append(processed_content)
+            text_parts.append(content)
+
+        elif 'horizontalRule' in text_run:
+            html_parts.append("<hr>")
+
+    full_paragraph_content = "".join(html_parts)
+    raw_text = "".join(text_parts)
+
+    # A literal '<' in the text can pair with a tag's '>' under the regex, so
+    # only then fall back to stripping the rendered HTML.
+    text_has_angle_bracket = '<' in raw_text
+    if text_has_angle_bracket:
+        plain_text = HTML_TAG_PATTERN.sub('', full_paragraph_content).strip()
+    else:
+        plain_text = raw_text.replace('\x0b', '').replace('\x85', '').replace('\n', '').strip()
+
+    if plain_text == "":
+        if '<br>' in full_paragraph_content or '<hr>' in full_paragraph_content:
+            paragraph_html = f"<p>{full_paragraph_content}</p>"
+        else:
+            paragraph_html = "<p></p>"
+    else:
+        paragraph_html = f"<p>{full_paragraph_content.strip()}</p>"
+
+    if text_has_angle_bracket:
+        plain_text = HTML_TAG_PATTERN.sub('', paragraph_html).strip()
+
+    return paragraph_html, plain_text
+
+def table_html(table):
+    """Renders a Docs table, recursing into each cell's content."""
+    html_parts = ["<table>"]
+    for row in table['tableRows']:
+        html_parts.append("<tr>")
+        for cell in row['tableCells']:
+            html_parts.append("<td>")
+            html_parts.append(extract_formatted_html_from_elements(cell['content']))
+            html_parts.append("</td>")
+        html_parts.append("</tr>")
+    html_parts.append("</table>\n")
+    return "".join(html_parts)
+
 def extract_formatted_html_from_elements(elements):
-    html_content = ""
     if not elements:
-        return html_content
+        return ""
 
+    html_parts = []
     for element in elements:
         if 'paragraph' in element:
-            paragraph_html_parts = []
-            for text_run in element['paragraph']['elements']:
-                if 'textRun' in text_run:
-                    content = text_run['textRun']['content']
-                    text_style = text_run['textRun'].get('textStyle', {})
-
-                    processed_content = content.replace('\x0b', '<br>') \
-                                             .replace('\x85', '<br>') \
-                                             .replace('\n', '<br>') 
-
-                    if text_style.get('bold'):
-                        processed_content = f"<strong>{processed_content}</strong>"
-                    if text_style.get('italic'):
-                        processed_content = f"<em>{processed_content}</em>"
-                    if text_style.get('underline'):
-                        processed_content = f"<u>{processed_content}</u>"
-                    
-                    paragraph_html_parts.append(processed_content)
-
-                elif 'horizontalRule' in text_run:
-                    paragraph_html_parts.append("<hr>")
-            
-            full_paragraph_content = "".join(paragraph_html_parts)
-
-            temp_stripped_content = re.sub(r'<[^>]*>', '', full_paragraph_content).strip()
+            html_parts.append(paragraph_html_and_text(element['paragraph'])[0])
+        elif 'table' in element:
+            html_parts.append(table_html(element['table']))
+    return "".join(html_parts)
 
-            if temp_stripped_content == "":
-                if '<br>' in full_paragraph_content or '<hr>' in full_paragraph_content:
-                    html_content += f"<p>{full_paragraph_content}</p>"
-                else:
-                    html_content += "<p></p>"
-            else:
-                html_content += f"<p>{full_paragraph_content.strip()}</p>" 
+def paragraph_hash(block_html):
+    """Short content hash of one top-level block (paragraph or table) of chapter HTML."""
+    return hashlib.sha256(block_html.encode('utf-8')).hexdigest()[:16]
 
+def split_elements_into_chapters(content_elements, chapter_id_prefix, paragraph_hashes=None):
+    """
+    Streams a tab's (or the body's) structural elements into chapters: every
+    HEADING_1 opens a chapter, the first SUBTITLE after it becomes its title, and
+    everything else is appended to the open chapter's content. Content before
+    the first heading goes into an "Introduction" chapter. Chapter content is
+    collected in a list and joined once when the chapter closes.
+
+    If paragraph_hashes is a dict, it receives chapter id -> list of
+    paragraph_hash() values, one per block of that chapter's content, in order.
+    The returned chapters are the same either way.
+    """
+    chapters = []
+    current_chapter = None
+    content_parts = []
+    chapter_counter = 0
+
+    for element in content_elements:
+        named_style_type = None
+        element_text = ""
+        if 'paragraph' in element:
+            named_style_type = element['paragraph'].get('paragraphStyle', {}).get('namedStyleType')
+            element_html_content, element_text = paragraph_html_and_text(element['paragraph'])
         elif 'table' in element:
-            table_html = "<table>"
-            for row in element['table']['tableRows']:
-                table_html += "<tr>"
-                for cell in row['tableCells']:
-                    table_html += f"<td>{extract_formatted_html_from_elements(cell['content'])}</td>"
-                table_html += "</tr>"
-            table_html += "</table>"
-            html_content += table_html + "\n"
-            
-    return html_content
+            element_html_content = table_html(element['table'])
+        else:
+            element_html_content = ""
+
+        if named_style_type == 'HEADING_1':
+            if current_chapter:
+                current_chapter['content'] = "".join(content_parts)
+                chapters.append(current_chapter)
+            chapter_counter += 1
+            current_chapter = {
+                "number": element_text,
+                "title": "",
+                "content": "",
+                "id": f"{chapter_id_prefix}-{chapter_counter}"
+            }
+            content_parts = []
+        elif named_style_type == 'SUBTITLE' and current_chapter and not current_chapter['title']:
+            current_chapter['title'] = element_text
+        else:
+            if not current_chapter:
+                chapter_counter += 1
+                current_chapter = {
+                    "number": "0", "title": "Introduction", "content": "",
+                    "id": f"{chapter_id_prefix}-{chapter_counter}"
+                }
+                # The introduction is listed when it opens and again when it
+                # closes; clients already rely on that output shape.
+                chapters.append(current_chapter)
+            content_parts.append(element_html_content)
+            if paragraph_hashes is not None and element_html_content:
+                paragraph_hashes.setdefault(current_chapter['id'], []).append(paragraph_hash(element_html_content))
+
+    if current_chapter:
+        current_chapter['content'] = "".join(content_parts)
+        chapters.append(current_chapter)
+
+    return chapters
+
+def parse_document(document, document_id, paragraph_hashes=None):
+    """
+    Parses a Google Docs API document (fetched with includeTabsContent=True)
+    into the books/chapters structure served by /get-doc-content.
+    paragraph_hashes is passed through to split_elements_into_chapters.
+    """
+    parsed_data = {
+        "title": document.get('title', 'Untitled Document'),
+        "document_id": document_id,
+        "books": []
+    }
+
+    if 'tabs' in document and document['tabs']:
+        for i, tab_data in enumerate(document['tabs']):
+            tab_properties = tab_data.get('tabProperties', {})
+            document_tab = tab_data.get('documentTab', {})
+            tab_body = document_tab.get('body', {})
+            tab_content_elements = tab_body.get('content', [])
+
+            book_entry = {
+                "title": tab_properties.get('title', f"Tab {i+1}"),
+                "id": f"tab-{tab_properties.get('tabId', f'tab_{i+1}').replace('.', '_')}",
+                "chapters": []
+            }
+            book_entry['chapters'] = split_elements_into_chapters(
+                tab_content_elements, f"chapter-{book_entry['id']}", paragraph_hashes
+            )
+            parsed_data['books'].append(book_entry)
+    else:
+        app.logger.warning("No 'tabs' found in document response. Assuming single main body.")
+        main_body_content_elements = document.get('body', {}).get('content', [])
+
+        single_book_entry = {
+            "title": document.get('title', 'Main Document'),
+            "id": "book-main",
+            "chapters": []
+        }
+        single_book_entry['chapters'] = split_elements_into_chapters(
+            main_body_content_elements, "chapter-main", paragraph_hashes
+        )
+        parsed_data['books'].append(single_book_entry)
+
+    parsed_data['books'] = [book for book in parsed_data['books'] if book['chapters']]
+
+    return parsed_data
+
+def parse_document_with_hashes(document, document_id):
+    """parse_document plus the per-paragraph hashes of every chapter, as (parsed, paragraph_hashes)."""
+    paragraph_hashes = {}
+    with metrics.stage('doc_parse'):
+        parsed = parse_document(document, document_id, paragraph_hashes)
+    return parsed, paragraph_hashes
+
+# --- Document registry ---
+# The documents this deployment serves come from DOCUMENT_IDS (see
+# document_registry.py). Document routes take ?documentId=<id> and fall back to
+# the first configured document; ids outside the list get a 404.
+document_registry = document_registry_from_env()
+
+def requested_document_id(requested_id=None):
+    """The allowed document id a request names (?documentId= by default), the default if none, else None."""
+    if requested_id is None:
+        requested_id = request.args.get('documentId')
+    return document_registry.resolve(requested_id)
+
+def unknown_document_response(requested_id=None):
+    if requested_id is None:
+        requested_id = request.args.get('documentId')
+    app.logger.warning(f"Request for a document that is not configured: '{requested_id}'")
+    return jsonify({"error": f"Document '{requested_id}' is not available."}), 404
+
+# --- Revision-aware document cache ---
+
+def fetch_document(document_id):
+    """Downloads the full document, including every tab, from the Docs API."""
+    service = get_docs_service()
+    app.logger.info(f"Fetching document structure with ID: {document_id}")
+
+    with metrics.stage('docs_fetch'):
+        document = service.documents().get(documentId=document_id, includeTabsContent=True).execute(
+            http=google_clients.docs_http()
+        )
+
+    app.logger.info(f"Document structure fetched. Top-level keys: {list(document.keys())}")
+    return document
+
+def fetch_document_revision(document_id):
+    """Returns the document's current revisionId using a partial (fields-only) request."""
+    service = get_docs_service()
+    with metrics.stage('docs_revision'):
+        document = service.documents().get(documentId=document_id, fields='revisionId').execute(
+            http=google_clients.docs_http()
+        )
+    return document.get('revisionId')
+
+# Parsed documents are kept per worker, least recently used first, within the
+# DOC_CACHE_MAX_DOCUMENTS / DOC_CACHE_MAX_BYTES limits; see document_cache.py.
+document_cache = document_cache_from_env(
+    fetch_document_revision, fetch_document, parse_document_with_hashes, metrics=metrics
+)
 
 # --- API Endpoint to Fetch Document Content ---
 @app.route('/get-doc-content', methods=['GET'])
@@ -120,185 +381,192 @@ def get_document_content():
         return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
     # --- END AUTHENTICATION CHECK ---
 
-    document_id = '1ubt637f0K87_Och3Pin9GbJM7w6wzf3M2RCmHbmHgYI' # Confirmed correct ID
+    document_id = requested_document_id()
+    if document_id is None:
+        return unknown_document_response()
 
     try:
-        service = get_docs_service()
-        app.logger.info(f"Fetching document structure with ID: {document_id}")
-        
-        document = service.documents().get(documentId=document_id, includeTabsContent=True).execute()
+        cached_document = document_cache.get(document_id)
+
+        since_revision = request.args.get('since')
+        if since_revision:
+            delta = document_delta(cached_document, since_revision)
+            if delta is not None:
+                with metrics.stage('serialize'):
+                    response = jsonify(delta)
+                response.headers['Cache-Control'] = 'no-cache'
+                response.headers['X-Document-Revision'] = cached_document.revision_id or ''
+                return response
+            app.logger.info(f"Revision {since_revision} is not known to this worker; sending the full document.")
+
+        response = encoded_response(cached_document.body)
+        response.headers['X-Document-Revision'] = cached_document.revision_id or ''
+        return response
 
-        app.logger.info(f"Document structure fetched. Top-level keys: {list(document.keys())}")
-
-        parsed_data = {
-            "title": document.get('title', 'Untitled Document'),
-            "document_id": document_id,
-            "books": []
-        }
-
-        if 'tabs' in document and document['tabs']:
-            for i, tab_data in enumerate(document['tabs']):
-                tab_properties = tab_data.get('tabProperties', {})
-                document_tab = tab_data.get('documentTab', {})
-                tab_body = document_tab.get('body', {})
-                tab_content_elements = tab_body.get('content', [])
-
-                book_entry = {
-                    "title": tab_properties.get('title', f"Tab {i+1}"),
-                    "id": f"tab-{tab_properties.get('tabId', f'tab_{i+1}').replace('.', '_')}",
-                    "chapters": []
-                }
+    except Exception as e:
+        return document_error_response(e)
 
-                current_chapter = None
-                chapter_counter = 0
+def document_delta(cached_document, since_revision):
+    """
+    Builds the ?since=<revision> response: the current table of contents plus
+    the full added and changed chapters and the ids of removed ones. Returns
+    None when this worker no longer remembers since_revision.
+    """
+    old_hashes = document_cache.chapter_hashes_at(cached_document.document_id, since_revision)
+    if old_hashes is None:
+        return None
+
+    added, changed, removed = diff_chapter_hashes(old_hashes, cached_document.chapter_hashes)
+    return {
+        "delta": True,
+        "since": since_revision,
+        "revision_id": cached_document.revision_id,
+        "toc": cached_document.toc,
+        "added": [cached_document.chapters[chapter_id] for chapter_id in added],
+        "changed": [cached_document.chapters[chapter_id] for chapter_id in changed],
+        "removed": removed,
+    }
+
+def document_error_response(e):
+    """Logs a failure to load or parse the document and returns the matching error response."""
+    if isinstance(e, HttpError):
+        app.logger.error(f"Google API Error: {e.status_code} - {e.reason}", exc_info=True)
+        return jsonify({"error": f"Google API Error: {e.reason}", "code": e.status_code}), e.status_code
+    if isinstance(e, ValueError):
+        app.logger.error(f"Configuration Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    if isinstance(e, KeyError):
+        app.logger.error(f"Data parsing error: Missing expected key {e} in Google Doc response. Check document permissions or structure.", exc_info=True)
+        return jsonify({"error": f"Data parsing error: Missing expected key {e} in Google Doc response. Possible permissions issue or empty document."}), 500
+    app.logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+    return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
 
-                for element in tab_content_elements:
-                    named_style_type = None
-                    if 'paragraph' in element:
-                        named_style_type = element['paragraph'].get('paragraphStyle', {}).get('namedStyleType')
+def encoded_response(encoded, cache_control='no-cache'):
+    """
+    Serves a pre-serialized EncodedBody in the best encoding the client
+    accepts, with that variant's ETag, answering 304 when the client already
+    has it. No serialization or compression happens here.
+    """
+    encoding, body, etag = encoded.variant(request.headers.get('Accept-Encoding'))
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype=encoded.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+# --- Table of contents and single chapters ---
+# Lets a reader paint the chapter list first and load chapters on demand. Both
+# come from the same parsed-document cache as /get-doc-content. A chapter's
+# ETag is its contentHash from the table of contents, so clients can tell which
+# prefetched chapters are stale without downloading them.
+@app.route('/get-doc-toc', methods=['GET'])
+def get_document_toc():
+    """Returns books and chapter ids, numbers, titles, content sizes and content hashes, without content."""
+    # --- AUTHENTICATION CHECK ---
+    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
+    incoming_api_key = request.headers.get('X-API-Key')
 
-                    element_html_content = extract_formatted_html_from_elements([element])
+    if not expected_api_key:
+        app.logger.critical("RAILWAY_APP_API_KEY environment variable is not set in Railway!")
+        return jsonify({"error": "Server configuration error: API key not set."}), 500
 
-                    if named_style_type == 'HEADING_1':
-                        if current_chapter:
-                            book_entry['chapters'].append(current_chapter)
-                        chapter_counter += 1
-                        chapter_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
+    if not incoming_api_key or incoming_api_key != expected_api_key:
+        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
+        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
+    # --- END AUTHENTICATION CHECK ---
 
-                        current_chapter = {
-                            "number": chapter_text_content,
-                            "title": "",
-                            "content": "",
-                            "id": f"chapter-{book_entry['id']}-{chapter_counter}"
-                        }
-                    elif named_style_type == 'SUBTITLE':
-                        subtitle_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
-
-                        if current_chapter and not current_chapter['title']:
-                            current_chapter['title'] = subtitle_text_content
-                        else:
-                            if current_chapter:
-                                current_chapter['content'] += element_html_content
-                            else:
-                                if not book_entry['chapters'] and not current_chapter:
-                                    chapter_counter += 1
-                                    current_chapter = {
-                                        "number": "0", "title": "Introduction", "content": "",
-                                        "id": f"chapter-{book_entry['id']}-{chapter_counter}"
-                                    }
-                                    book_entry['chapters'].append(current_chapter)
-                                if current_chapter:
-                                    current_chapter['content'] += element_html_content
-                    else:
-                        if current_chapter:
-                            current_chapter['content'] += element_html_content
-                        else:
-                            if not book_entry['chapters'] and not current_chapter:
-                                chapter_counter += 1
-                                current_chapter = {
-                                    "number": "0", "title": "Introduction", "content": "",
-                                    "id": f"chapter-{book_entry['id']}-{chapter_counter}"
-                                }
-                                book_entry['chapters'].append(current_chapter)
-                            if current_chapter:
-                                current_chapter['content'] += element_html_content
-
-                if current_chapter:
-                    book_entry['chapters'].append(current_chapter)
-
-                parsed_data['books'].append(book_entry)
-        else:
-            app.logger.warning("No 'tabs' found in document response. Assuming single main body.")
-            main_body_content_elements = document.get('body', {}).get('content', [])
-            
-            single_book_entry = {
-                "title": document.get('title', 'Main Document'),
-                "id": "book-main",
-                "chapters": []
-            }
+    document_id = requested_document_id()
+    if document_id is None:
+        return unknown_document_response()
 
-            current_chapter = None
-            chapter_counter = 0
-
-            for element in main_body_content_elements:
-                named_style_type = None
-                if 'paragraph' in element:
-                    named_style_type = element['paragraph'].get('paragraphStyle', {}).get('namedStyleType')
-                    
-                element_html_content = extract_formatted_html_from_elements([element])
-
-                if named_style_type == 'HEADING_1':
-                    if current_chapter:
-                        single_book_entry['chapters'].append(current_chapter)
-                    chapter_counter += 1
-                    chapter_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
-                    current_chapter = {
-                        "number": chapter_text_content,
-                        "title": "",
-                        "content": "",
-                        "id": f"chapter-main-{chapter_counter}"
-                    }
-                elif named_style_type == 'SUBTITLE':
-                    subtitle_text_content = re.sub(r'<[^>]*>', '', element_html_content).strip()
-                    if current_chapter and not current_chapter['title']:
-                        current_chapter['title'] = subtitle_text_content
-                    else:
-                        if current_chapter:
-                            current_chapter['content'] += element_html_content
-                        else:
-                            if not single_book_entry['chapters'] and not current_chapter:
-                                chapter_counter += 1
-                                current_chapter = {
-                                    "number": "0", "title": "Introduction", "content": "",
-                                    "id": f"chapter-main-{chapter_counter}"
-                                }
-                                single_book_entry['chapters'].append(current_chapter)
-                            if current_chapter:
-                                current_chapter['content'] += element_html_content
-                else:
-                    if current_chapter:
-                        current_chapter['content'] += element_html_content
-                    else:
-                        if not single_book_entry['chapters'] and not current_chapter:
-                            chapter_counter += 1
-                            current_chapter = {
-                                "number": "0", "title": "Introduction", "content": "",
-                                "id": f"chapter-main-{chapter_counter}"
-                            }
-                            single_book_entry['chapters'].append(current_chapter)
-                        if current_chapter:
-                            current_chapter['content'] += element_html_content
+    try:
+        cached_document = document_cache.get(document_id)
+        return encoded_response(cached_document.toc_body)
+    except Exception as e:
+        return document_error_response(e)
 
-            if current_chapter:
-                single_book_entry['chapters'].append(current_chapter)
+@app.route('/get-doc-chapter/<chapter_id>', methods=['GET'])
+def get_document_chapter(chapter_id):
+    """Returns one chapter (bookId, id, number, title, content, contentHash)."""
+    # --- AUTHENTICATION CHECK ---
+    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
+    incoming_api_key = request.headers.get('X-API-Key')
 
-            parsed_data['books'].append(single_book_entry)
+    if not expected_api_key:
+        app.logger.critical("RAILWAY_APP_API_KEY environment variable is not set in Railway!")
+        return jsonify({"error": "Server configuration error: API key not set."}), 500
 
-        parsed_data['books'] = [book for book in parsed_data['books'] if book['chapters']]
+    if not incoming_api_key or incoming_api_key != expected_api_key:
+        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
+        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
+    # --- END AUTHENTICATION CHECK ---
 
-        return jsonify(parsed_data)
+    document_id = requested_document_id()
+    if document_id is None:
+        return unknown_document_response()
 
-    except HttpError as e:
-        app.logger.error(f"Google API Error: {e.status_code} - {e.reason}", exc_info=True)
-        return jsonify({"error": f"Google API Error: {e.reason}", "code": e.status_code}), e.status_code
-    except ValueError as e:
-        app.logger.error(f"Configuration Error: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
-    except KeyError as e:
-        app.logger.error(f"Data parsing error: Missing expected key {e} in Google Doc response. Check document permissions or structure.", exc_info=True)
-        return jsonify({"error": f"Data parsing error: Missing expected key {e} in Google Doc response. Possible permissions issue or empty document."}), 500
+    try:
+        cached_document = document_cache.get(document_id)
+        body = cached_document.chapter_body(chapter_id)
+        if body is None:
+            return jsonify({"error": f"Chapter '{chapter_id}' not found."}), 404
+        return encoded_response(body)
     except Exception as e:
-        app.logger.error(f"An unexpected error occurred: {e}", exc_info=True)
-        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
-
-
-# Use lru_cache to cache the synthesis results. Max size can be adjusted.
-@lru_cache(maxsize=128)
-def _synthesize_speech_cached(text_content, voice_name, language_code):
-    """Internal helper to synthesize speech with caching and word timings."""
+        return document_error_response(e)
+
+
+# --- Text-to-Speech Audio Cache ---
+# Shared on-disk cache so every worker on the node reuses synthesized audio,
+# including after restarts. Configured through AUDIO_CACHE_* env variables.
+# Audio is filed under the document it was synthesized for (the request's
+# document_scope), and AUDIO_CACHE_DOCUMENT_MAX_BYTES caps each document.
+audio_cache = audio_cache_from_env()
+
+# Merged page audio, stored under the SHA-256 of its bytes and served by
+# /audio/<hash>.mp3 (or .ogg for Ogg Opus). Configured through
+# PAGE_AUDIO_CACHE_* env variables.
+page_audio_store = audio_cache_from_env(
+    env_prefix='PAGE_AUDIO_CACHE',
+    default_path=os.path.join(tempfile.gettempdir(), 'read_serene_page_audio.sqlite3'),
+    default_max_bytes=1024 * 1024 * 1024
+)
+PAGE_AUDIO_MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+
+def page_audio_url(audio_hash, extension='mp3'):
+    """Path of the /audio route for a stored page; built by hand since it runs outside request context."""
+    return f"/audio/{audio_hash}.{extension}"
+
+def store_page_audio(audio_bytes):
+    """Stores merged page audio under its content hash and returns the hash."""
+    audio_hash = hashlib.sha256(audio_bytes).hexdigest()
+    page_audio_store.put(audio_hash, audio_bytes, partition=current_document_id())
+    return audio_hash
+
+# The audio config of requests that do not pick an encoding; see audio_codecs.py.
+# Every cache key, job dedupe key and merged page is specific to its config.
+TTS_AUDIO_CONFIG = make_audio_config()
+
+# --- Text-to-Speech scheduling ---
+# Every upstream call goes through tts_scheduler: a token bucket sized to this
+# worker's share of TTS_QUOTA_PER_MINUTE, an adaptive concurrency limit, and
+# jittered retries of 429/503. Waiting calls start in priority order: the page
+# a listener is waiting on, then later pages, then the pre-warm job. See
+# tts_scheduler.py.
+def is_tts_throttling_error(e):
+    """Quota (429 / RESOURCE_EXHAUSTED) and overload (503 / UNAVAILABLE) errors."""
+    return isinstance(e, (TooManyRequests, ServiceUnavailable))
+
+tts_scheduler = tts_scheduler_from_env(is_tts_throttling_error, metrics)
+
+def _synthesize_speech(text_content, voice_name, language_code, audio_config=TTS_AUDIO_CONFIG):
+    """Calls Google Text-to-Speech and returns the raw audio bytes, encoded as audio_config asks."""
     app.logger.info(f"Synthesizing speech for text: '{text_content[:50]}...' with voice: {voice_name}, lang: {language_code}")
-    credentials = get_google_cloud_credentials()
-    client = texttospeech.TextToSpeechClient(credentials=credentials)
+    client = google_clients.tts_client()
 
     synthesis_input = texttospeech.SynthesisInput(text=text_content) 
 
@@ -307,31 +575,285 @@ def _synthesize_speech_cached(text_content, voice_name, language_code):
         name=voice_name,
     )
 
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
+    tts_audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding[audio_config['audio_encoding']],
+        sample_rate_hertz=audio_config.get('sample_rate_hertz', 0)
     )
 
-    response = client.synthesize_speech(
-        input=synthesis_input, voice=voice_params, audio_config=audio_config
-    )
+    def call_tts():
+        try:
+            with metrics.stage('tts'):
+                response = client.synthesize_speech(
+                    input=synthesis_input, voice=voice_params, audio_config=tts_audio_config
+                )
+        except Exception as e:
+            metrics.inc('tts_requests_total', outcome='throttled' if is_tts_throttling_error(e) else 'error')
+            raise
+        metrics.inc('tts_requests_total', outcome='ok')
+        return response
+
+    return tts_scheduler.call(call_tts).audio_content
+
+def tts_cache_key(text_content, voice_name, language_code, audio_config=TTS_AUDIO_CONFIG):
+    """Audio cache key for one synthesis request; each audio config has its own entries."""
+    return make_cache_key(text_content, voice_name, language_code, audio_config)
+
+# --- Single-flight synthesis ---
+# Identical segments requested at the same time (two readers on the same page,
+# or a reader racing the pre-warm job) are synthesized once. Within a worker,
+# callers wait on the first caller's result; across workers, the first one to
+# take a lease in the shared audio cache synthesizes while the others poll the
+# cache for its result. A crashed holder's lease expires after
+# SYNTHESIS_LEASE_SECONDS and the next waiter takes over.
+SYNTHESIS_LEASE_SECONDS = float(os.environ.get('SYNTHESIS_LEASE_SECONDS', 30))
+SYNTHESIS_LEASE_POLL_SECONDS = float(os.environ.get('SYNTHESIS_LEASE_POLL_SECONDS', 0.1))
+synthesis_flights = SingleFlight()
+
+def _synthesize_under_lease(cache_key, text_content, voice_name, language_code, audio_config):
+    """Synthesizes and caches one request, unless another worker is already doing so."""
+    lease_owner = f"{os.getpid()}:{threading.get_ident()}"
+    give_up_at = time.monotonic() + SYNTHESIS_LEASE_SECONDS * 2
+    waiting = False
+
+    while time.monotonic() < give_up_at:
+        if audio_cache.acquire_lease(cache_key, lease_owner, SYNTHESIS_LEASE_SECONDS):
+            try:
+                # The previous holder may have finished between our miss and the lease.
+                audio_content = audio_cache.get(cache_key, record_stats=False)
+                if audio_content is None:
+                    audio_content = _synthesize_speech(text_content, voice_name, language_code, audio_config)
+                    audio_cache.put(cache_key, audio_content, partition=current_document_id())
+                return audio_content
+            finally:
+                audio_cache.release_lease(cache_key, lease_owner)
+
+        if not waiting:
+            waiting = True
+            audio_cache.record('lease_waits')
+            app.logger.info(f"Waiting on another worker's synthesis for text: '{text_content[:50]}...'")
+        time.sleep(SYNTHESIS_LEASE_POLL_SECONDS)
+
+        audio_content = audio_cache.get(cache_key, record_stats=False)
+        if audio_content is not None:
+            audio_cache.record('coalesced')
+            return audio_content
+
+    app.logger.warning(f"Gave up waiting on another worker's synthesis for text: '{text_content[:50]}...'")
+    audio_content = _synthesize_speech(text_content, voice_name, language_code, audio_config)
+    audio_cache.put(cache_key, audio_content, partition=current_document_id())
+    return audio_content
+
+# --- Per-paragraph audio ---
+# Segment packing depends on where the reader's screen breaks pages, so a
+# packed segment's text is rarely known ahead of time. Its parts are: each
+# paragraph, or each part of a paragraph too long for one request, on its
+# own. Pre-warm fills the cache at that granularity, and a packed segment
+# whose parts are all cached is joined from them frame by frame (or packet by
+# packet) instead of being synthesized.
+def segment_part_texts(segment):
+    """The texts a segment was packed from, as process_paragraphs_for_synthesis records them."""
+    if segment['type'] == 'horizontal_rule':
+        return []
+    return [meta['text'] for meta in segment['original_paragraphs_meta'] if meta['text'].strip()]
+
+def paragraph_part_texts(paragraphs_data):
+    """Every part text of paragraphs_data, in order and without repeats; pre-warm synthesizes these."""
+    return list(dict.fromkeys(
+        part_text
+        for segment in process_paragraphs_for_synthesis(paragraphs_data)
+        for part_text in segment_part_texts(segment)
+    ))
+
+def _assemble_cached_parts(part_texts, voice_name, language_code, audio_config):
+    """Joins the cached audio of every part into one clip, or returns None if any part is not cached."""
+    codec = codec_for(audio_config)
+    parts_audio = []
+    for part_text in part_texts:
+        part_key = tts_cache_key(part_text, voice_name, language_code, audio_config)
+        audio_content = audio_cache.get(part_key, record_stats=False)
+        if audio_content is None:
+            return None
+        parts_audio.append(audio_content)
+
+    merged = codec.concatenator()
+    try:
+        for audio_content in parts_audio:
+            merged.append_stream(codec.parse(audio_content))
+    except ValueError as e:
+        app.logger.warning(f"Cached paragraph audio could not be joined; synthesizing the segment instead: {e}")
+        return None
+    metrics.inc('tts_segments_assembled_total')
+    return merged.getvalue()
 
-    return base64.b64encode(response.audio_content).decode('utf-8'), []
+def _synthesize_speech_cached(text_content, voice_name, language_code, audio_config=TTS_AUDIO_CONFIG, part_texts=None):
+    """
+    Internal helper to synthesize speech through the shared audio cache. Returns the audio bytes.
+    On a miss, a segment packed from several part_texts is joined from their cached audio when
+    every part is cached.
+    """
+    cache_key = tts_cache_key(text_content, voice_name, language_code, audio_config)
+
+    audio_content = audio_cache.get(cache_key)
+    if audio_content is None and part_texts and len(part_texts) > 1:
+        audio_content = _assemble_cached_parts(part_texts, voice_name, language_code, audio_config)
+        if audio_content is not None:
+            app.logger.info(f"Joined {len(part_texts)} cached paragraphs for text: '{text_content[:50]}...'")
+            return audio_content
+    if audio_content is None:
+        audio_content, shared = synthesis_flights.do(
+            cache_key,
+            lambda: _synthesize_under_lease(cache_key, text_content, voice_name, language_code, audio_config)
+        )
+        if shared:
+            audio_cache.record('coalesced')
+    else:
+        app.logger.info(f"Audio cache hit for text: '{text_content[:50]}...' with voice: {voice_name}, lang: {language_code}")
+
+    return audio_content
+
+# --- Concurrent segment synthesis ---
+# Segments of a page are synthesized through a bounded per-worker thread pool so
+# page latency tracks the slowest segment rather than the sum of all of them.
+# Upstream concurrency is limited by tts_scheduler, not by this pool: the pool
+# is larger so queued segments wait in the scheduler's priority order instead
+# of this pool's first-come, first-served queue.
+SYNTHESIS_MAX_WORKERS = int(os.environ.get('SYNTHESIS_MAX_WORKERS', 32))
+segment_synthesis_executor = ThreadPoolExecutor(
+    max_workers=SYNTHESIS_MAX_WORKERS, thread_name_prefix='tts-segment'
+)
+
+def _synthesize_segment_audio(segment_index, segment_text, voice_name, language_code, audio_config, part_texts=None):
+    """
+    Synthesizes one segment and returns its audio bytes and parsed MP3 frames
+    or Opus packets, or the error that stopped it.
+    """
+    try:
+        audio_bytes = _synthesize_speech_cached(segment_text, voice_name, language_code, audio_config, part_texts)
+        with metrics.stage('decode'):
+            stream = codec_for(audio_config).parse(audio_bytes)
+        return {"audio": audio_bytes, "stream": stream, "error": None}
+    except Exception as e:
+        app.logger.error(f"Synthesis failed for segment {segment_index}: {e}", exc_info=True)
+        return {"audio": None, "stream": None, "error": str(e)}
+
+def submit_segment_synthesis(segments, voice_name, language_code, audio_config=TTS_AUDIO_CONFIG):
+    """
+    Submits every text segment to the shared thread pool and returns a list of
+    futures aligned with `segments`; entries for segments without text
+    (horizontal rules, empty text) are None.
+    """
+    futures = []
+    for i, segment in enumerate(segments):
+        if segment['type'] == 'horizontal_rule' or not segment['text'].strip():
+            futures.append(None)
+        else:
+            futures.append(metrics.submit(
+                segment_synthesis_executor, _synthesize_segment_audio, i, segment['text'], voice_name, language_code,
+                audio_config, segment_part_texts(segment)
+            ))
+    return futures
+
+def synthesize_segments_concurrently(segments, voice_name, language_code, audio_config=TTS_AUDIO_CONFIG):
+    """
+    Synthesizes every text segment through the shared thread pool.
+    Returns a list aligned with `segments`; entries for segments without text
+    (horizontal rules, empty text) are None.
+    """
+    futures = submit_segment_synthesis(segments, voice_name, language_code, audio_config)
+    return [future.result() if future is not None else None for future in futures]
 
 # --- NEW LOGIC FOR SPEECH SYNTHESIS INTEGRATION ---
 
-MAX_CHAR_COUNT_FOR_NARRATION = 768
+# Google Text-to-Speech rejects requests whose input text exceeds 5000 bytes
+# (UTF-8). Narration is packed up to SEGMENT_MAX_BYTES per request and longer
+# paragraphs are split on sentence boundaries to fit.
+TTS_MAX_INPUT_BYTES = 5000
+SEGMENT_MAX_BYTES = min(int(os.environ.get('SEGMENT_MAX_BYTES', TTS_MAX_INPUT_BYTES)), TTS_MAX_INPUT_BYTES)
+HORIZONTAL_RULE_SILENCE_MS = 800  # 0.8 seconds for each horizontal rule
+SEGMENT_GAP_SILENCE_MS = 500  # 0.5 seconds between consecutive segments
+
+# A sentence ends at . ! ? or … plus any closing quotes or brackets and whitespace,
+# or at a CJK full stop, exclamation or question mark plus any closing brackets.
+SENTENCE_BOUNDARY_PATTERN = re.compile(
+    r'(?<=[.!?\u2026])["\'\u201d\u2019)\]]*\s+|(?<=[\u3002\uff01\uff1f])[\u300d\u300f]*'
+)
+
+def utf8_length(text):
+    return len(text.encode('utf-8'))
 
-def process_paragraphs_for_synthesis(paragraphs_data):
+def _split_to_byte_limit(text, max_bytes, pattern):
+    """
+    Splits text after each match of pattern and greedily re-joins the pieces
+    into chunks of at most max_bytes. A piece that is too long on its own is
+    returned as its own oversized chunk.
+    """
+    chunks = []
+    current = ""
+    position = 0
+    for match in itertools.chain(pattern.finditer(text), [None]):
+        piece = text[position:match.end() if match else len(text)]
+        position = match.end() if match else len(text)
+        if not piece:
+            continue
+        if current and utf8_length(current + piece) > max_bytes:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+def split_text_to_byte_limit(text, max_bytes=SEGMENT_MAX_BYTES):
+    """
+    Splits text into chunks of at most max_bytes UTF-8 bytes, on sentence
+    boundaries where possible, then on whitespace, and as a last resort
+    between characters.
+    """
+    if utf8_length(text) <= max_bytes:
+        return [text]
+
+    chunks = []
+    for sentence_chunk in _split_to_byte_limit(text, max_bytes, SENTENCE_BOUNDARY_PATTERN):
+        if utf8_length(sentence_chunk) <= max_bytes:
+            chunks.append(sentence_chunk)
+            continue
+        for word_chunk in _split_to_byte_limit(sentence_chunk, max_bytes, re.compile(r'\s+')):
+            while utf8_length(word_chunk) > max_bytes:
+                cut = len(word_chunk.encode('utf-8')[:max_bytes].decode('utf-8', 'ignore'))
+                chunks.append(word_chunk[:cut])
+                word_chunk = word_chunk[cut:]
+            if word_chunk:
+                chunks.append(word_chunk)
+    return chunks
+
+def process_paragraphs_for_synthesis(paragraphs_data, max_segment_bytes=SEGMENT_MAX_BYTES):
     """
     Processes the incoming paragraphs (from frontend JSON) to create a new list of segments
     optimized for speech synthesis, applying concatenation rules based on paragraph type.
     Each segment will also include the original paragraph indices it covers.
+
+    Consecutive narration is packed into segments of up to max_segment_bytes
+    UTF-8 bytes. Dialogue and italicised paragraphs stay in segments of their
+    own. A paragraph longer than the limit is split on sentence boundaries;
+    each part's meta carries splitIndex and splitCount.
     """
     synthesis_segments = []
     current_narration_buffer = []
-    current_narration_char_count = 0
+    current_narration_byte_count = 0
     current_narration_original_indices = []
 
+    def flush_narration():
+        nonlocal current_narration_buffer, current_narration_byte_count, current_narration_original_indices
+        if current_narration_buffer:
+            synthesis_segments.append({
+                "text": " ".join(current_narration_buffer),
+                "type": "narration",
+                "original_paragraphs_meta": current_narration_original_indices
+            })
+        current_narration_buffer = []
+        current_narration_byte_count = 0
+        current_narration_original_indices = []
+
     for paragraph in paragraphs_data:
         text = paragraph.get('text', '').strip()
         paragraph_type = paragraph.get('paragraphType', 'narration')
@@ -341,252 +863,795 @@ def process_paragraphs_for_synthesis(paragraphs_data):
         if not text and paragraph_type != 'horizontal_rule': # Don't skip horizontal_rule even if text is empty
             continue
 
-        original_paragraph_meta = {
-            "pageNumber": original_page_number,
-            "paragraphIndexOnPage": original_paragraph_index_on_page,
-            "text": text,
-            "paragraphType": paragraph_type # Include paragraphType in meta
-        }
-
         if paragraph_type == 'horizontal_rule':
-            # If there's an active narration buffer, finalize it before adding horizontal_rule
-            if current_narration_buffer:
-                synthesis_segments.append({
-                    "text": " ".join(current_narration_buffer),
-                    "type": "narration",
-                    "original_paragraphs_meta": current_narration_original_indices
-                })
-                current_narration_buffer = []
-                current_narration_char_count = 0
-                current_narration_original_indices = []
-            
-            # Add horizontal_rule as its own segment
+            # Finalize any active narration before the horizontal rule's own segment
+            flush_narration()
             synthesis_segments.append({
                 "text": "", # No text to synthesize for horizontal rule
                 "type": "horizontal_rule",
-                "original_paragraphs_meta": [original_paragraph_meta]
+                "original_paragraphs_meta": [{
+                    "pageNumber": original_page_number,
+                    "paragraphIndexOnPage": original_paragraph_index_on_page,
+                    "text": text,
+                    "paragraphType": paragraph_type
+                }]
             })
-        elif paragraph_type == 'narration':
-            potential_new_char_count = current_narration_char_count + len(text) + (1 if current_narration_buffer else 0)
-            
-            if current_narration_buffer and potential_new_char_count > MAX_CHAR_COUNT_FOR_NARRATION:
-                synthesis_segments.append({
-                    "text": " ".join(current_narration_buffer),
-                    "type": "narration",
-                    "original_paragraphs_meta": current_narration_original_indices
-                })
-                current_narration_buffer = [text]
-                current_narration_char_count = len(text)
-                current_narration_original_indices = [original_paragraph_meta]
-            else:
-                current_narration_buffer.append(text)
-                current_narration_char_count = potential_new_char_count
-                current_narration_original_indices.append(original_paragraph_meta)
+            continue
 
-        else: # Dialogue or Italicized type
-            if current_narration_buffer:
+        parts = split_text_to_byte_limit(text, max_segment_bytes)
+        for split_index, part in enumerate(parts):
+            original_paragraph_meta = {
+                "pageNumber": original_page_number,
+                "paragraphIndexOnPage": original_paragraph_index_on_page,
+                "text": part,
+                "paragraphType": paragraph_type # Include paragraphType in meta
+            }
+            if len(parts) > 1:
+                original_paragraph_meta["splitIndex"] = split_index
+                original_paragraph_meta["splitCount"] = len(parts)
+
+            if paragraph_type == 'narration':
+                part_bytes = utf8_length(part)
+                potential_new_byte_count = current_narration_byte_count + part_bytes + (1 if current_narration_buffer else 0)
+                if current_narration_buffer and potential_new_byte_count > max_segment_bytes:
+                    flush_narration()
+                    potential_new_byte_count = part_bytes
+                current_narration_buffer.append(part)
+                current_narration_byte_count = potential_new_byte_count
+                current_narration_original_indices.append(original_paragraph_meta)
+            else: # Dialogue or Italicized type
+                flush_narration()
                 synthesis_segments.append({
-                    "text": " ".join(current_narration_buffer),
-                    "type": "narration",
-                    "original_paragraphs_meta": current_narration_original_indices
+                    "text": part,
+                    "type": paragraph_type,
+                    "original_paragraphs_meta": [original_paragraph_meta]
                 })
-                current_narration_buffer = []
-                current_narration_char_count = 0
-                current_narration_original_indices = []
-            
-            synthesis_segments.append({
-                "text": text,
-                "type": paragraph_type,
-                "original_paragraphs_meta": [original_paragraph_meta]
-            })
 
-    if current_narration_buffer:
-        synthesis_segments.append({
-            "text": " ".join(current_narration_buffer),
-            "type": "narration",
-            "original_paragraphs_meta": current_narration_original_indices
-        })
+    flush_narration()
     return synthesis_segments
 
-@app.route('/synthesize-chapter-audio', methods=['POST'])
-def synthesize_chapter_audio_endpoint():
+def segment_paragraph_timestamps(segment, segment_duration_ms, segment_offset_ms):
     """
-    Receives JSON data for a single page, processes it for speech synthesis,
-    synthesizes individual audio segments, merges them,
-    and returns the merged audio with timestamps for that page.
+    Estimates when each original paragraph of a segment starts and ends, by
+    spreading the segment's duration over its paragraphs by character count.
+    Times are in ms and offset by where the segment starts on the page.
+    Parts of a split paragraph get one entry each, with splitIndex and splitCount.
     """
-    # --- AUTHENTICATION CHECK ---
-    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
-    incoming_api_key = request.headers.get('X-API-Key')
-
-    if not expected_api_key or not incoming_api_key or incoming_api_key != expected_api_key:
-        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
-        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
-    # --- END AUTHENTICATION CHECK ---
-
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
-
-    data = request.get_json()
-    page_paragraphs_from_frontend = data.get('chapterParagraphs')
-    voice_name = data.get('voiceName')
-    language_code = data.get('languageCode')
+    timestamps = []
+
+    # Generate timestamps for the original paragraphs within this *segment*
+    total_chars_in_segment = sum(len(p['text']) for p in segment["original_paragraphs_meta"])
+    
+    cumulative_char_in_segment = 0
+    for p_meta in segment["original_paragraphs_meta"]:
+        paragraph_char_count = len(p_meta['text'])
+        
+        # If it's a horizontal rule, it contributes fixed silent duration
+        if p_meta['paragraphType'] == 'horizontal_rule':
+             # The entire 0.8s silence is for this single horizontal rule
+            start_time_relative_to_segment = 0 
+            end_time_relative_to_segment = segment_duration_ms
+        else:
+            start_time_relative_to_segment = (cumulative_char_in_segment / total_chars_in_segment) * segment_duration_ms if total_chars_in_segment > 0 else 0
+            cumulative_char_in_segment += paragraph_char_count
+            if segment['type'] == 'narration' and p_meta != segment["original_paragraphs_meta"][-1]:
+                   cumulative_char_in_segment += 1 # Account for space
+            
+            end_time_relative_to_segment = (cumulative_char_in_segment / total_chars_in_segment) * segment_duration_ms if total_chars_in_segment > 0 else 0
 
-    if not page_paragraphs_from_frontend or not isinstance(page_paragraphs_from_frontend, list):
-        return jsonify({"error": "Invalid or empty 'chapterParagraphs' received."}), 400
-    if not all([voice_name, language_code]):
-        return jsonify({"error": "Missing required parameters: 'voiceName' or 'languageCode'"}), 400
 
-    page_num = page_paragraphs_from_frontend[0].get('pageNumber') if page_paragraphs_from_frontend else None
+        timestamp = {
+            "pageNumber": p_meta['pageNumber'],
+            "paragraphIndexOnPage": p_meta['paragraphIndexOnPage'],
+            "start_time_ms": int(segment_offset_ms + start_time_relative_to_segment),
+            "end_time_ms": int(segment_offset_ms + end_time_relative_to_segment)
+        }
+        if 'splitIndex' in p_meta:
+            timestamp["splitIndex"] = p_meta['splitIndex']
+            timestamp["splitCount"] = p_meta['splitCount']
+        timestamps.append(timestamp)
+
+    return timestamps
+
+# --- Audio pre-warm ---
+# Fills the audio cache for the document ahead of readers; see prewarm.py.
+# Its Text-to-Speech calls run at background priority, behind every reader.
+# PREWARM_AUDIO_ENCODINGS lists the encodings readers ask for; each one has
+# its own cache entries, so each is warmed on its own.
+PREWARM_VOICES = parse_voices(os.environ.get('PREWARM_VOICES', DEFAULT_PREWARM_VOICES))
+PREWARM_AUDIO_CONFIGS = parse_audio_encodings(
+    os.environ.get('PREWARM_AUDIO_ENCODINGS', DEFAULT_PREWARM_AUDIO_ENCODINGS)
+)
+
+def _prewarm_synthesize(text_content, voice_name, language_code, audio_config):
+    with tts_priority(PRIORITY_BACKGROUND):
+        return _synthesize_speech_cached(text_content, voice_name, language_code, audio_config)
+
+prewarm_job = prewarm_job_from_env(audio_cache, tts_cache_key, _prewarm_synthesize, paragraph_part_texts)
+
+# --- Selective audio invalidation ---
+# When the document changes, paragraph audio whose text no longer occurs
+# anywhere in the new revision is dropped for the pre-warmed voices and audio
+# encodings, so the cache follows the edit instead of waiting for LRU
+# eviction. Text that is still somewhere in the book (a repeated line, a
+# scene-break marker) keeps its audio. Audio for other voices or sample
+# rates, or for page-sized narration packs the frontend built, is left to age
+# out through the cache's LRU and TTL.
+#
+# The last revision applied to the cache, with every chapter's keys, is
+# recorded in the shared audio cache. Every load of a document checks it, so
+# the invalidation runs once per revision for the whole node, and a change
+# made while no worker held the document (evicted, or before a restart) is
+# applied on the next load.
+def chapter_segment_keys(chapter_html, voices, audio_configs):
+    """Audio cache keys for each paragraph (or part of a long paragraph) of a chapter, as pre-warm stores them."""
+    texts = paragraph_part_texts(chapter_paragraphs_for_synthesis(chapter_html))
+    return {
+        tts_cache_key(text, voice_name, language_code, audio_config)
+        for text in texts
+        for voice_name, language_code in voices
+        for audio_config in audio_configs
+    }
+
+def invalidate_changed_chapter_audio(document):
+    """Applies document's changes since the revision last recorded for it to the audio cache."""
+    recorded_revision_id, recorded_chapters = audio_cache.document_revision(document.document_id)
+    if recorded_revision_id == document.revision_id:
+        return
+
+    chapter_keys = {
+        chapter_id: [
+            chapter['contentHash'],
+            sorted(chapter_segment_keys(chapter['content'], PREWARM_VOICES, PREWARM_AUDIO_CONFIGS))
+        ]
+        for chapter_id, chapter in document.chapters.items()
+    }
+    added, changed, removed = diff_chapter_hashes(
+        {chapter_id: content_hash for chapter_id, (content_hash, _) in recorded_chapters.items()},
+        document.chapter_hashes
+    )
+    stale_keys = set()
+    for chapter_id in changed + removed:
+        stale_keys.update(recorded_chapters[chapter_id][1])
+    for _, keys in chapter_keys.values():
+        stale_keys.difference_update(keys)
+
+    removed_entries = audio_cache.advance_document_revision(
+        document.document_id, recorded_revision_id, document.revision_id, chapter_keys, stale_keys
+    )
+    if removed_entries is None:
+        app.logger.info(f"Document {document.document_id} revision {document.revision_id} was applied by another worker.")
+    elif recorded_revision_id is None:
+        app.logger.info(f"Recorded document {document.document_id} at revision {document.revision_id} for invalidation.")
+    else:
+        app.logger.info(
+            f"Document {document.document_id} revision {recorded_revision_id} -> {document.revision_id}: "
+            f"{len(added)} added, {len(changed)} changed, {len(removed)} removed chapters; "
+            f"dropped {removed_entries} cached audio segments."
+        )
+
+def on_document_loaded(document):
+    """Checks a freshly parsed document against the recorded revision; new revisions are applied off the request thread."""
+    try:
+        recorded_revision_id, _ = audio_cache.document_revision(document.document_id)
+    except Exception as e:
+        app.logger.warning(f"Reading the recorded revision of document {document.document_id} failed: {e}")
+        return
+    if recorded_revision_id == document.revision_id:
+        return
+
+    def invalidate():
+        try:
+            invalidate_changed_chapter_audio(document)
+        except Exception as e:
+            app.logger.error(f"Audio invalidation for document {document.document_id} failed: {e}", exc_info=True)
+
+    threading.Thread(target=invalidate, name=f'audio-invalidate-{document.document_id[:8]}', daemon=True).start()
+
+document_cache.on_load = on_document_loaded
+
+def _check_admin_api_key():
+    """Returns an error response unless X-Admin-Key matches ADMIN_API_KEY, else None."""
+    expected_admin_key = os.environ.get('ADMIN_API_KEY')
+    incoming_admin_key = request.headers.get('X-Admin-Key')
+
+    if not expected_admin_key:
+        app.logger.critical("ADMIN_API_KEY environment variable is not set; admin routes are disabled.")
+        return jsonify({"error": "Server configuration error: admin API key not set."}), 503
+    if not incoming_admin_key or incoming_admin_key != expected_admin_key:
+        app.logger.warning("Unauthorized admin access attempt.")
+        return jsonify({"error": "Unauthorized access. Invalid admin key."}), 401
+    return None
+
+@app.route('/admin/prewarm', methods=['GET', 'POST'])
+def prewarm_endpoint():
+    """
+    POST starts a background pre-warm of a document's audio for the configured
+    voices and encodings (or {"voices": ["voiceName:languageCode", ...]} and
+    {"audioEncodings": ["OGG_OPUS", ...]} from the body), for the default
+    document or {"documentId": ...}; GET reports the progress of this
+    worker's job.
+    """
+    auth_error = _check_admin_api_key()
+    if auth_error:
+        return auth_error
 
-    app.logger.info(f"Received {len(page_paragraphs_from_frontend)} paragraphs for single page synthesis (Page: {page_num}).")
-    app.logger.info(f"Requested voice: {voice_name}, language: {language_code}")
+    if request.method == 'GET':
+        return jsonify(prewarm_job.status)
 
-    temp_base_dir = None
+    data = request.get_json(silent=True) or {}
+    voices = parse_voices(','.join(data['voices'])) if data.get('voices') else PREWARM_VOICES
+    if not voices:
+        return jsonify({"error": "No voices configured for pre-warm."}), 400
     try:
-        temp_base_dir = tempfile.mkdtemp()
-        app.logger.info(f"Created base temporary directory: {temp_base_dir}")
+        audio_configs = (
+            parse_audio_encodings(','.join(data['audioEncodings'])) if data.get('audioEncodings')
+            else PREWARM_AUDIO_CONFIGS
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not audio_configs:
+        return jsonify({"error": "No audio encodings configured for pre-warm."}), 400
+
+    document_id = requested_document_id(data.get('documentId') or '')
+    if document_id is None:
+        return unknown_document_response(data.get('documentId'))
+
+    # The job thread inherits the document scope, so its audio is filed under this document.
+    with document_scope(document_id):
+        started = prewarm_job.start(lambda: document_cache.get(document_id).parsed, voices, audio_configs)
+    if not started:
+        return jsonify({"error": "A pre-warm job is already running.", "status": prewarm_job.status}), 409
+    return jsonify({"message": "Pre-warm started.", "status": prewarm_job.status}), 202
+
+# --- Whole-chapter (multi-page) synthesis ---
+# Pages of a chapter are merged concurrently; each page fans its segments out
+# to segment_synthesis_executor, so the two pools must stay separate. The first
+# page is synthesized on the request thread at the request's priority (current
+# by default), so it never queues behind other requests' pages; later pages go
+# through this pool at upcoming priority.
+CHAPTER_PAGE_MAX_WORKERS = int(os.environ.get('CHAPTER_PAGE_MAX_WORKERS', 4))
+page_synthesis_executor = ThreadPoolExecutor(
+    max_workers=CHAPTER_PAGE_MAX_WORKERS, thread_name_prefix='tts-page'
+)
+
+def chapter_paragraphs_error(paragraphs_data):
+    """Returns why a chapterParagraphs list cannot be synthesized, or None if every record is usable."""
+    for index, paragraph in enumerate(paragraphs_data):
+        if not isinstance(paragraph, dict):
+            return f"'chapterParagraphs[{index}]' must be an object."
+        if not isinstance(paragraph.get('text', ''), str):
+            return f"'chapterParagraphs[{index}].text' must be a string."
+        page_number = paragraph.get('pageNumber')
+        if page_number is not None and (isinstance(page_number, bool) or not isinstance(page_number, (int, str))):
+            return f"'chapterParagraphs[{index}].pageNumber' must be a number or a string."
+    return None
+
+def group_paragraphs_by_page(paragraphs_data):
+    """
+    Groups the incoming paragraphs by their pageNumber, keeping pages in the
+    order they first appear and paragraphs in their original order.
+    Returns a list of (page_number, paragraphs) tuples.
+    """
+    pages = {}
+    for paragraph in paragraphs_data:
+        pages.setdefault(paragraph.get('pageNumber'), []).append(paragraph)
+    return list(pages.items())
 
-        segments_to_synthesize = process_paragraphs_for_synthesis(page_paragraphs_from_frontend)
+def synthesize_page_audio(page_num, page_paragraphs, voice_name, language_code, inline_audio=False,
+                          priority=PRIORITY_CURRENT, audio_config=TTS_AUDIO_CONFIG):
+    """
+    Synthesizes and merges the audio for one page of paragraphs, stores it in
+    page_audio_store and returns a (response_dict, status_code) tuple whose
+    audioUrl points at it. With inline_audio the base64 audio is included too.
+    Text-to-Speech calls for the page are scheduled at the given priority, and
+    the page is encoded as audio_config asks (MP3 or Ogg Opus).
+    """
+    codec = codec_for(audio_config)
+    try:
+        segments_to_synthesize = process_paragraphs_for_synthesis(page_paragraphs)
         
         if not segments_to_synthesize:
             app.logger.warning(f"No valid text segments found for synthesis on page {page_num}.")
-            return jsonify({
+            return {
                 "pageNumber": page_num,
                 "audioContent": None,
                 "timestamps": [],
                 "error": "No text to synthesize for this page."
-            }), 200
+            }, 200
 
-        individual_audio_segments_pydub = []
         cumulative_segment_timestamps = []
 
-        page_temp_dir = os.path.join(temp_base_dir, f"page_{page_num}")
-        os.makedirs(page_temp_dir, exist_ok=True)
-        app.logger.info(f"Created temporary directory for page {page_num}: {page_temp_dir}")
+        with tts_priority(priority):
+            segment_results = synthesize_segments_concurrently(
+                segments_to_synthesize, voice_name, language_code, audio_config
+            )
+        segment_errors = []
+
+        merge_started = time.perf_counter()
+        # Silence frames (or packets) are built to match the first synthesized
+        # segment so the whole page can be joined without decoding.
+        page_audio = codec.concatenator(next(
+            (result['stream'].format for result in segment_results if result and not result['error']), None
+        ))
+        has_audio = False
 
         current_page_audio_offset_ms = 0
         for i, segment in enumerate(segments_to_synthesize):
             segment_text = segment['text']
             segment_type = segment['type']
             
-            audio_segment_pydub = None
             segment_duration_ms = 0
 
             if segment_type == 'horizontal_rule':
-                silence_duration_ms = 800  # 0.8 seconds
-                audio_segment_pydub = AudioSegment.silent(duration=silence_duration_ms)
-                segment_duration_ms = silence_duration_ms
-                app.logger.info(f"Added {silence_duration_ms}ms silence for horizontal_rule at segment {i} on page {page_num}.")
+                segment_duration_ms = page_audio.append_silence(HORIZONTAL_RULE_SILENCE_MS)
+                app.logger.info(f"Added {segment_duration_ms:.0f}ms silence for horizontal_rule at segment {i} on page {page_num}.")
             elif not segment_text.strip():
                 app.logger.warning(f"Skipping synthesis for empty text segment {i} on page {page_num}.")
                 continue
+            elif segment_results[i]['error']:
+                segment_errors.append({
+                    "segmentIndex": i,
+                    "type": segment_type,
+                    "paragraphs": [
+                        {"pageNumber": p['pageNumber'], "paragraphIndexOnPage": p['paragraphIndexOnPage']}
+                        for p in segment["original_paragraphs_meta"]
+                    ],
+                    "error": segment_results[i]['error']
+                })
+                continue
             else:
-                audio_base64, _ = _synthesize_speech_cached(segment_text, voice_name, language_code) 
-                audio_content_bytes = base64.b64decode(audio_base64)
-                
-                audio_segment_pydub = AudioSegment.from_file(io.BytesIO(audio_content_bytes), format="mp3")
-                segment_duration_ms = audio_segment_pydub.duration_seconds * 1000
+                segment_duration_ms = page_audio.append_stream(segment_results[i]['stream'])
 
-            individual_audio_segments_pydub.append(audio_segment_pydub)
+            has_audio = True
 
-            # Generate timestamps for the original paragraphs within this *segment*
-            total_chars_in_segment = sum(len(p['text']) for p in segment["original_paragraphs_meta"])
-            
-            cumulative_char_in_segment = 0
-            for p_meta in segment["original_paragraphs_meta"]:
-                paragraph_char_count = len(p_meta['text'])
-                
-                # If it's a horizontal rule, it contributes fixed silent duration
-                if p_meta['paragraphType'] == 'horizontal_rule':
-                     # The entire 0.8s silence is for this single horizontal rule
-                    start_time_relative_to_segment = 0 
-                    end_time_relative_to_segment = 800 
-                else:
-                    start_time_relative_to_segment = (cumulative_char_in_segment / total_chars_in_segment) * segment_duration_ms if total_chars_in_segment > 0 else 0
-                    cumulative_char_in_segment += paragraph_char_count
-                    if segment['type'] == 'narration' and p_meta != segment["original_paragraphs_meta"][-1]:
-                           cumulative_char_in_segment += 1 # Account for space
-                    
-                    end_time_relative_to_segment = (cumulative_char_in_segment / total_chars_in_segment) * segment_duration_ms if total_chars_in_segment > 0 else 0
-
-
-                cumulative_segment_timestamps.append({
-                    "pageNumber": p_meta['pageNumber'],
-                    "paragraphIndexOnPage": p_meta['paragraphIndexOnPage'],
-                    "start_time_ms": int(current_page_audio_offset_ms + start_time_relative_to_segment),
-                    "end_time_ms": int(current_page_audio_offset_ms + end_time_relative_to_segment)
-                })
+            cumulative_segment_timestamps.extend(
+                segment_paragraph_timestamps(segment, segment_duration_ms, current_page_audio_offset_ms)
+            )
             
             current_page_audio_offset_ms += segment_duration_ms
 
             # Add 0.5 seconds of silence *after* each segment, unless it's the very last one
             if i < len(segments_to_synthesize) - 1:
-                silence = AudioSegment.silent(duration=500) # 0.5 seconds of silence
-                individual_audio_segments_pydub.append(silence)
-                current_page_audio_offset_ms += 500 # Account for silence in cumulative offset
+                current_page_audio_offset_ms += page_audio.append_silence(SEGMENT_GAP_SILENCE_MS)
+
 
+        if not has_audio and segment_errors:
+            app.logger.error(f"All {len(segment_errors)} segments failed to synthesize for page {page_num}.")
+            return {
+                "pageNumber": page_num,
+                "audioContent": None,
+                "timestamps": [],
+                "segmentErrors": segment_errors,
+                "error": "Audio synthesis failed for every segment on this page."
+            }, 502
 
-        if not individual_audio_segments_pydub:
+        if not has_audio:
             app.logger.warning(f"No audio segments generated for page {page_num}.")
-            return jsonify({
+            return {
                 "pageNumber": page_num,
                 "audioContent": None,
                 "timestamps": [],
                 "error": "No audio generated for this page."
-            }), 200
-
-        merged_audio = AudioSegment.empty()
-        for seg in individual_audio_segments_pydub:
-            merged_audio += seg
-
-        merged_audio_filename = f"merged_page_{page_num}.mp3"
-        merged_audio_path = os.path.join(page_temp_dir, merged_audio_filename)
-        merged_audio.export(merged_audio_path, format="mp3")
-        app.logger.info(f"Merged audio for page {page_num} saved to: {merged_audio_path}")
+            }, 200
 
-        with open(merged_audio_path, 'rb') as f:
-            merged_audio_content = f.read()
+        merged_audio_content = page_audio.getvalue()
+        metrics.record_stage('merge', time.perf_counter() - merge_started)
+        app.logger.info(f"Merged {len(merged_audio_content)} bytes ({page_audio.duration_ms:.0f}ms) of audio for page {page_num}.")
         
-        merged_audio_base64 = base64.b64encode(merged_audio_content).decode('utf-8')
+        with metrics.stage('encode'):
+            audio_hash = store_page_audio(merged_audio_content)
 
-        return jsonify({
+        page_response = {
             "success": True,
             "pageNumber": page_num,
-            "audioContent": merged_audio_base64,
-            "format": "audio/mpeg",
+            "audioUrl": page_audio_url(audio_hash, codec.extension),
+            "audioHash": audio_hash,
+            "format": codec.mimetype,
+            "durationMs": int(page_audio.duration_ms),
             "timestamps": cumulative_segment_timestamps,
+            "segmentErrors": segment_errors,
             "message": f"Audio synthesized and merged for page {page_num}."
-        })
+        }
+        if inline_audio:
+            with metrics.stage('encode'):
+                page_response["audioContent"] = base64.b64encode(merged_audio_content).decode('utf-8')
+        return page_response, 200
+
+    except Exception as e:
+        app.logger.error(f"An error occurred during audio synthesis for page {page_num}: {e}", exc_info=True)
+        return {
+            "pageNumber": page_num,
+            "audioContent": None,
+            "timestamps": [],
+            "error": f"An unexpected server error occurred: {str(e)}"
+        }, 500
+
+
+# --- Streaming (NDJSON) chapter synthesis ---
+# With "stream": true the endpoint answers with one JSON event per line, sent
+# as soon as each segment is ready and in page/segment order, so playback can
+# start after the first segment instead of after the whole page is merged.
+# Silence clips are built from frames (or Opus packets) matching the last
+# streamed segment.
+
+def _audio_event(event_type, page_num, audio_format, audio_bytes, start_ms, duration_ms, **fields):
+    return {
+        "type": event_type,
+        "pageNumber": page_num,
+        "format": audio_format,
+        "audioContent": base64.b64encode(audio_bytes).decode('utf-8'),
+        "startMs": int(start_ms),
+        "durationMs": int(duration_ms),
+        **fields
+    }
+
+def page_priority(request_priority, page_index):
+    """The first page keeps the request's priority; later pages are at most upcoming."""
+    return request_priority if page_index == 0 else max(request_priority, PRIORITY_UPCOMING)
+
+def stream_chapter_audio_events(pages, voice_name, language_code, priority=PRIORITY_CURRENT,
+                                audio_config=TTS_AUDIO_CONFIG):
+    """
+    Yields the NDJSON events for a chapter: page_start, then a segment event per
+    synthesized segment (with its paragraph timestamps) and a silence event for
+    every 500 ms gap, page_end, and a final done event. Horizontal rules are
+    sent as 800 ms silent segments. Segments that fail produce segment_error
+    events and the stream continues.
+    """
+    try:
+        # Submit every page's segments up front so later segments synthesize
+        # while earlier ones are being streamed.
+        planned_pages = []
+        for page_index, (page_num, paragraphs) in enumerate(pages):
+            segments = process_paragraphs_for_synthesis(paragraphs)
+            with tts_priority(page_priority(priority, page_index)):
+                futures = submit_segment_synthesis(segments, voice_name, language_code, audio_config)
+            planned_pages.append((page_num, segments, futures))
+
+        codec = codec_for(audio_config)
+        silence_format = codec.default_format
+        for page_num, segments, futures in planned_pages:
+            yield {"type": "page_start", "pageNumber": page_num, "segmentCount": len(segments)}
+
+            current_page_audio_offset_ms = 0
+            for i, (segment, future) in enumerate(zip(segments, futures)):
+                if segment['type'] == 'horizontal_rule':
+                    audio_bytes, segment_duration_ms = codec.silence(silence_format, HORIZONTAL_RULE_SILENCE_MS)
+                elif future is None:
+                    continue
+                else:
+                    result = future.result()
+                    if result['error']:
+                        yield {
+                            "type": "segment_error",
+                            "pageNumber": page_num,
+                            "segmentIndex": i,
+                            "paragraphs": [
+                                {"pageNumber": p['pageNumber'], "paragraphIndexOnPage": p['paragraphIndexOnPage']}
+                                for p in segment["original_paragraphs_meta"]
+                            ],
+                            "error": result['error']
+                        }
+                        continue
+                    audio_bytes = result['audio']
+                    segment_duration_ms = result['stream'].duration_ms
+                    silence_format = result['stream'].format
+
+                yield _audio_event(
+                    "segment", page_num, codec.mimetype, audio_bytes, current_page_audio_offset_ms, segment_duration_ms,
+                    segmentIndex=i,
+                    segmentType=segment['type'],
+                    timestamps=segment_paragraph_timestamps(segment, segment_duration_ms, current_page_audio_offset_ms)
+                )
+                current_page_audio_offset_ms += segment_duration_ms
+
+                if i < len(segments) - 1:
+                    silence_bytes, silence_duration_ms = codec.silence(silence_format, SEGMENT_GAP_SILENCE_MS)
+                    yield _audio_event(
+                        "silence", page_num, codec.mimetype, silence_bytes, current_page_audio_offset_ms, silence_duration_ms
+                    )
+                    current_page_audio_offset_ms += silence_duration_ms
+
+            yield {"type": "page_end", "pageNumber": page_num, "durationMs": int(current_page_audio_offset_ms)}
+
+        yield {"type": "done"}
+    except Exception as e:
+        app.logger.error(f"An error occurred while streaming chapter audio: {e}", exc_info=True)
+        yield {"type": "error", "error": f"An unexpected server error occurred: {str(e)}"}
+
+# --- Asynchronous chapter synthesis jobs ---
+# With "async": true the endpoint queues the chapter in synthesis_jobs (SQLite,
+# shared by every worker) and answers 202 with a job id straight away. Job
+# threads in each worker synthesize the pages through job_page_executor, first
+# page first, and /synthesis-jobs/<job_id> reports per-page progress with each
+# finished page's result. Jobs survive worker restarts and are deduplicated by
+# chapter content, voice, audio config and document. See synthesis_jobs.py.
+#
+# Job pages have their own pool, SYNTHESIS_JOB_PAGE_MAX_WORKERS pages at a
+# time, so a long queued chapter never holds up the later pages of
+# synchronous requests in page_synthesis_executor.
+SYNTHESIS_JOB_PAGE_MAX_WORKERS = int(os.environ.get('SYNTHESIS_JOB_PAGE_MAX_WORKERS', 2))
+job_page_executor = ThreadPoolExecutor(
+    max_workers=SYNTHESIS_JOB_PAGE_MAX_WORKERS, thread_name_prefix='tts-job-page'
+)
+
+def start_job_page(job, page):
+    with document_scope(job['document_id']):
+        return metrics.submit(
+            job_page_executor, synthesize_page_audio, page['page_number'], page['paragraphs'],
+            job['voice_name'], job['language_code'], False, page_priority(job['priority'], page['page_index']),
+            job['audio_config'] or TTS_AUDIO_CONFIG
+        )
+
+def job_pages_still_stored(page_results):
+    """A finished job is only reused while the page audio it points at is still stored."""
+    return all(
+        page_audio_store.contains(result['audioHash']) for result in page_results if result.get('audioHash')
+    )
+
+synthesis_jobs = synthesis_job_queue_from_env(start_job_page, job_pages_still_stored)
+
+def synthesis_job_url(job_id):
+    return f"/synthesis-jobs/{job_id}"
+
+def stream_chapter_audio_response(pages, voice_name, language_code, priority=PRIORITY_CURRENT, document_id='',
+                                  audio_config=TTS_AUDIO_CONFIG):
+    """Wraps stream_chapter_audio_events in a chunked application/x-ndjson response."""
+    def generate():
+        # The body is produced after the view returns, so the document scope is entered here.
+        with document_scope(document_id):
+            for event in stream_chapter_audio_events(pages, voice_name, language_code, priority, audio_config):
+                yield json.dumps(event) + "\n"
+
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/synthesize-chapter-audio', methods=['POST'])
+def synthesize_chapter_audio_endpoint():
+    """
+    Receives JSON data for one or more pages of a chapter, groups the paragraphs
+    by pageNumber, synthesizes and merges every page concurrently, and returns
+    one entry per page in pageAudioResponses with its own audio and timestamps.
+    Each page's merged audio is returned as an audioUrl served by /audio/<hash>.mp3;
+    "inlineAudio": true also includes it base64-encoded as audioContent.
+    "audioEncoding": "OGG_OPUS" returns Ogg Opus (/audio/<hash>.ogg) instead
+    of MP3, and "sampleRateHertz" sets the synthesis sample rate; each page's
+    "format" is the MIME type of its audio.
+    With "stream": true the audio is streamed segment by segment as NDJSON instead.
+    With "async": true the chapter is queued as a background job and the
+    response is 202 with a jobId to poll at /synthesis-jobs/<jobId>.
+    "priority": "upcoming" (or "background") schedules a prefetch behind pages
+    listeners are waiting on; the default is "current" for the first page and
+    "upcoming" for the rest. "documentId" names the document the audio is
+    cached under (default: the first configured document).
+    """
+    # --- AUTHENTICATION CHECK ---
+    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
+    incoming_api_key = request.headers.get('X-API-Key')
 
+    if not expected_api_key or not incoming_api_key or incoming_api_key != expected_api_key:
+        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
+        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
+    # --- END AUTHENTICATION CHECK ---
+
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    page_paragraphs_from_frontend = data.get('chapterParagraphs')
+    voice_name = data.get('voiceName')
+    language_code = data.get('languageCode')
+
+    if not page_paragraphs_from_frontend or not isinstance(page_paragraphs_from_frontend, list):
+        return jsonify({"error": "Invalid or empty 'chapterParagraphs' received."}), 400
+    paragraphs_error = chapter_paragraphs_error(page_paragraphs_from_frontend)
+    if paragraphs_error:
+        return jsonify({"error": paragraphs_error}), 400
+    if not all([voice_name, language_code]):
+        return jsonify({"error": "Missing required parameters: 'voiceName' or 'languageCode'"}), 400
+    if not isinstance(voice_name, str) or not isinstance(language_code, str):
+        return jsonify({"error": "'voiceName' and 'languageCode' must be strings."}), 400
+    # Each option is looked up in a dict, so anything but a string would raise instead of being rejected.
+    priority_name = data.get('priority', 'current')
+    if not isinstance(priority_name, str) or priority_name not in PRIORITIES_BY_NAME:
+        return jsonify({"error": f"Invalid 'priority'; expected one of {', '.join(PRIORITIES_BY_NAME)}."}), 400
+    priority = PRIORITIES_BY_NAME[priority_name]
+    requested_document = data.get('documentId') or ''
+    if not isinstance(requested_document, str):
+        return jsonify({"error": "'documentId' must be a string."}), 400
+    document_id = requested_document_id(requested_document)
+    if document_id is None:
+        return unknown_document_response(requested_document)
+    audio_encoding = data.get('audioEncoding', DEFAULT_AUDIO_ENCODING)
+    if not isinstance(audio_encoding, str) or audio_encoding not in AUDIO_CODECS:
+        return jsonify({"error": f"Invalid 'audioEncoding'; expected one of {', '.join(AUDIO_CODECS)}."}), 400
+    sample_rate_hertz = data.get('sampleRateHertz')
+    if sample_rate_hertz is not None and (
+        isinstance(sample_rate_hertz, bool) or not isinstance(sample_rate_hertz, int)
+        or sample_rate_hertz not in AUDIO_CODECS[audio_encoding].sample_rates
+    ):
+        return jsonify({
+            "error": f"Invalid 'sampleRateHertz' for {audio_encoding}; expected one of "
+                     f"{', '.join(str(rate) for rate in AUDIO_CODECS[audio_encoding].sample_rates)}."
+        }), 400
+    audio_config = make_audio_config(audio_encoding, sample_rate_hertz)
+
+    pages = group_paragraphs_by_page(page_paragraphs_from_frontend)
+
+    app.logger.info(f"Received {len(page_paragraphs_from_frontend)} paragraphs across {len(pages)} page(s) for synthesis.")
+    app.logger.info(f"Requested voice: {voice_name}, language: {language_code}, audio config: {audio_config}")
+
+    if data.get('stream'):
+        return stream_chapter_audio_response(pages, voice_name, language_code, priority, document_id, audio_config)
+
+    if data.get('async'):
+        try:
+            synthesis_jobs.start_workers()
+            job, created = synthesis_jobs.submit(
+                pages, voice_name, language_code, priority, audio_config, document_id
+            )
+        except Exception as e:
+            app.logger.error(f"Queueing a synthesis job failed: {e}", exc_info=True)
+            return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+        return jsonify({
+            "jobId": job['jobId'],
+            "statusUrl": synthesis_job_url(job['jobId']),
+            "state": job['state'],
+            "pageCount": job['pageCount'],
+            "deduplicated": not created,
+        }), 202
+
+    inline_audio = bool(data.get('inlineAudio'))
+
+    try:
+        with document_scope(document_id):
+            (first_page_num, first_paragraphs), later_pages = pages[0], pages[1:]
+            page_futures = [
+                metrics.submit(
+                    page_synthesis_executor, synthesize_page_audio, page_num, paragraphs, voice_name, language_code,
+                    inline_audio, page_priority(priority, page_index), audio_config
+                )
+                for page_index, (page_num, paragraphs) in enumerate(later_pages, start=1)
+            ]
+            page_results = [
+                synthesize_page_audio(
+                    first_page_num, first_paragraphs, voice_name, language_code, inline_audio, priority, audio_config
+                )
+            ] + [future.result() for future in page_futures]
     except Exception as e:
-        app.logger.error(f"An error occurred during single page audio synthesis: {e}", exc_info=True)
+        app.logger.error(f"An error occurred during chapter audio synthesis: {e}", exc_info=True)
         return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
-    finally:
-        if temp_base_dir and os.path.exists(temp_base_dir):
-            shutil.rmtree(temp_base_dir)
-            app.logger.info(f"Cleaned up base temporary directory: {temp_base_dir}")
+
+    page_audio_responses = [page_response for page_response, _ in page_results]
+
+    if len(page_results) == 1:
+        # Single-page requests keep the flat response shape alongside pageAudioResponses.
+        page_response, status_code = page_results[0]
+        with metrics.stage('serialize'):
+            return jsonify({**page_response, "pageAudioResponses": page_audio_responses}), status_code
+
+    any_page_succeeded = any(status_code == 200 for _, status_code in page_results)
+    with metrics.stage('serialize'):
+        return jsonify({
+            "success": any(page_response.get('success') for page_response in page_audio_responses),
+            "pageAudioResponses": page_audio_responses,
+            "message": f"Audio synthesized for {len(page_audio_responses)} pages."
+        }), 200 if any_page_succeeded else 502
+
+@app.route('/synthesis-jobs/<job_id>', methods=['GET'])
+def synthesis_job_status_endpoint(job_id):
+    """
+    Reports an asynchronous synthesis job: its state (queued, running, done,
+    failed), page counts, and every page with its state and, once finished,
+    the same result a synchronous request returns for that page (audioUrl,
+    timestamps, durationMs). Clients can start playing pages as they finish.
+    """
+    # --- AUTHENTICATION CHECK ---
+    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
+    incoming_api_key = request.headers.get('X-API-Key')
+
+    if not expected_api_key or not incoming_api_key or incoming_api_key != expected_api_key:
+        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
+        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
+    # --- END AUTHENTICATION CHECK ---
+
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return jsonify({"error": "Invalid job id."}), 404
+
+    try:
+        synthesis_jobs.start_workers()
+        job = synthesis_jobs.status(job_id)
+    except Exception as e:
+        app.logger.error(f"Reading synthesis job {job_id} failed: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+    if job is None:
+        return jsonify({"error": "Job not found. It may have expired; submit the chapter again."}), 404
+
+    response = jsonify(job)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# --- Merged page audio ---
+@app.route('/audio/<audio_hash>.<extension>', methods=['GET'])
+def page_audio_endpoint(audio_hash, extension):
+    """
+    Serves merged page audio by content hash as audio/mpeg (.mp3) or Ogg Opus
+    (.ogg), with Range support, a strong ETag and a long-lived immutable
+    Cache-Control. The URL only exists once an authenticated synthesis request
+    has returned it, and its content never changes, so browsers and CDNs can
+    cache it without the API key.
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', audio_hash) or extension not in AUDIO_CODECS_BY_EXTENSION:
+        return jsonify({"error": "Invalid audio id."}), 404
+
+    audio_bytes = page_audio_store.get(audio_hash)
+    # The hash names the bytes, not the encoding, so the extension has to match what is stored.
+    if audio_bytes is None or codec_for_audio(audio_bytes).extension != extension:
+        return jsonify({"error": "Audio not found. It may have expired; synthesize the page again."}), 404
+
+    response = send_file(
+        io.BytesIO(audio_bytes),
+        mimetype=AUDIO_CODECS_BY_EXTENSION[extension].mimetype,
+        etag=audio_hash,
+        conditional=True,
+        max_age=PAGE_AUDIO_MAX_AGE_SECONDS
+    )
+    response.headers['Cache-Control'] = f"public, max-age={PAGE_AUDIO_MAX_AGE_SECONDS}, immutable"
+    return response
 
 # --- Existing /get-google-tts-voices endpoint ---
+# --- Voice catalogue ---
+# One pooled HTTP session per worker for the voice list; the list itself is
+# cached by voice_catalogue and refreshed in the background.
+VOICES_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('VOICES_REQUEST_TIMEOUT_SECONDS', 10))
+VOICES_BROWSER_MAX_AGE_SECONDS = 60 * 60
+TTS_VOICES_URL = os.environ.get('TTS_VOICES_URL', "https://texttospeech.googleapis.com/v1/voices")
+voices_http_session = requests.Session()
+
+class VoiceCatalogueConfigError(RuntimeError):
+    """The Google API key for listing voices is not configured."""
+
+def fetch_google_tts_voices():
+    """Downloads the full Text-to-Speech v1/voices catalogue."""
+    google_api_key = os.environ.get('google_api')
+    if not google_api_key:
+        raise VoiceCatalogueConfigError("The 'google_api' environment variable is not set.")
+
+    response = voices_http_session.get(
+        TTS_VOICES_URL,
+        params={"key": google_api_key},
+        timeout=VOICES_REQUEST_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+    return response.json()
+
+voice_catalogue = voice_catalogue_from_env(fetch_google_tts_voices)
+
 @app.route('/get-google-tts-voices', methods=['GET'])
 def get_google_tts_voices_endpoint():
     """
     API endpoint to fetch available Google TTS voices using a Google API Key from environment variables.
-    This acts as a proxy for the Google Text-to-Speech v1/voices endpoint.
-    """
-    google_api_key = os.environ.get('google_api')
-
-    if not google_api_key:
-        app.logger.error("The 'google_api' environment variable is not set.")
-        return jsonify({"error": "Server configuration error: Google API key not set for voice listing."}), 500
+    This acts as a cached proxy for the Google Text-to-Speech v1/voices endpoint.
 
+    Optional query parameters narrow the list: languageCode ("en" or "en-GB"),
+    voiceType (part of the voice name, e.g. "Chirp") and gender (MALE, FEMALE,
+    NEUTRAL). Responses carry an ETag and are brotli- or gzip-compressed when accepted.
+    """
     try:
-        google_tts_voices_api_url = f"https://texttospeech.googleapis.com/v1/voices?key={google_api_key}"
-        response = requests.get(google_tts_voices_api_url)
-        response.raise_for_status()
-        
-        return jsonify(response.json())
-        
+        voices = voice_catalogue.get(
+            language_code=request.args.get('languageCode'),
+            voice_type=request.args.get('voiceType'),
+            gender=request.args.get('gender'),
+        )
+    except VoiceCatalogueConfigError as e:
+        app.logger.error(str(e))
+        return jsonify({"error": "Server configuration error: Google API key not set for voice listing."}), 500
     except requests.exceptions.RequestException as e:
         app.logger.error(f"Error fetching Google TTS voices: {e}", exc_info=True)
         return jsonify({"error": f"Failed to fetch Google TTS voices: {str(e)}"}), 500
@@ -594,5 +1659,157 @@ def get_google_tts_voices_endpoint():
         app.logger.error(f"An unexpected error occurred while fetching voices: {e}", exc_info=True)
         return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
 
+    return encoded_response(voices, cache_control=f'public, max-age={VOICES_BROWSER_MAX_AGE_SECONDS}')
+
+# --- Dynamic response compression ---
+# Cacheable payloads (document, table of contents, chapters, voices) are
+# compressed once and served through encoded_response(). Other JSON responses
+# above DYNAMIC_COMPRESS_MIN_BYTES, such as revision deltas and synthesis
+# results with inline base64 audio, are compressed here with fast settings.
+# Audio files and streamed NDJSON are sent as they are.
+DYNAMIC_COMPRESS_MIN_BYTES = int(os.environ.get('DYNAMIC_COMPRESS_MIN_BYTES', 4096))
+DYNAMIC_COMPRESS_MIMETYPES = {'application/json', 'text/plain'}
+
+@app.after_request
+def compress_dynamic_response(response):
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or 'ETag' in response.headers
+        or response.mimetype not in DYNAMIC_COMPRESS_MIMETYPES
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < DYNAMIC_COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding == 'identity':
+        return response
+
+    with metrics.stage('compress'):
+        response.set_data(compress_bytes(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# --- Health check ---
+@app.route('/healthz', methods=['GET'])
+def health_endpoint():
+    """Reports whether this worker's Google clients are built and warm."""
+    clients_status = google_clients.status()
+    return jsonify({
+        "status": "ok" if clients_status['warm'] else "cold",
+        "clients": clients_status
+    })
+
+# --- Audio cache statistics ---
+@app.route('/audio-cache-stats', methods=['GET'])
+def audio_cache_stats_endpoint():
+    """Reports hit, miss, eviction and coalescing counts and the current size of the shared audio cache."""
+    # --- AUTHENTICATION CHECK ---
+    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
+    incoming_api_key = request.headers.get('X-API-Key')
+
+    if not expected_api_key or not incoming_api_key or incoming_api_key != expected_api_key:
+        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
+        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
+    # --- END AUTHENTICATION CHECK ---
+
+    try:
+        stats = audio_cache.stats()
+        # In-flight counts are per worker; "coalesced" and "lease_waits" above are shared.
+        stats["single_flight"] = dict(synthesis_flights.stats(), pid=os.getpid())
+        stats["tts_scheduler"] = dict(tts_scheduler.stats(), pid=os.getpid())
+        return jsonify(stats)
+    except Exception as e:
+        app.logger.error(f"An error occurred while reading audio cache stats: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+# --- Per-document memory ---
+@app.route('/document-stats', methods=['GET'])
+def document_stats_endpoint():
+    """
+    Reports, for every configured document, the memory its parsed form holds in
+    this worker (if cached) and the audio stored for it in the shared caches,
+    plus the document cache's limits and evictions.
+    """
+    # --- AUTHENTICATION CHECK ---
+    expected_api_key = os.environ.get('RAILWAY_APP_API_KEY')
+    incoming_api_key = request.headers.get('X-API-Key')
+
+    if not expected_api_key or not incoming_api_key or incoming_api_key != expected_api_key:
+        app.logger.warning(f"Unauthorized access attempt. Incoming key: '{incoming_api_key}'")
+        return jsonify({"error": "Unauthorized access. Invalid API Key."}), 401
+    # --- END AUTHENTICATION CHECK ---
+
+    try:
+        cache_stats = document_cache.stats()
+        cached_documents = cache_stats.pop('documents')
+        audio_partitions = {"segment": audio_cache.partition_stats(), "page": page_audio_store.partition_stats()}
+        empty_partition = {"entries": 0, "bytes": 0}
+        documents = {
+            document_id: {
+                "default": document_id == document_registry.default_document_id,
+                "cached": cached_documents.get(document_id),
+                "audio": {
+                    cache_name: partitions.get(document_id, empty_partition)
+                    for cache_name, partitions in audio_partitions.items()
+                },
+            }
+            for document_id in document_registry
+        }
+        return jsonify({"pid": os.getpid(), "document_cache": cache_stats, "documents": documents})
+    except Exception as e:
+        app.logger.error(f"An error occurred while reading document stats: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+# --- Prometheus metrics ---
+AUDIO_CACHE_COUNTERS = ('hits', 'misses', 'evictions', 'expirations', 'coalesced', 'lease_waits', 'invalidations')
+
+def shared_cache_series():
+    """Counters and sizes of the SQLite audio caches and the job queue, which every worker on the node shares."""
+    series = []
+    for cache_name, cache in (('segment', audio_cache), ('page', page_audio_store)):
+        try:
+            stats = cache.stats()
+        except Exception as e:
+            app.logger.warning(f"Could not read {cache_name} audio cache stats for metrics: {e}")
+            continue
+        for counter in AUDIO_CACHE_COUNTERS:
+            series.append((f'audio_cache_{counter}_total', 'counter', {"cache": cache_name}, stats[counter]))
+        series.append(('audio_cache_entries', 'gauge', {"cache": cache_name}, stats['entries']))
+        series.append(('audio_cache_bytes', 'gauge', {"cache": cache_name}, stats['bytes']))
+        series.append(('audio_cache_max_bytes', 'gauge', {"cache": cache_name}, stats['max_bytes']))
+        try:
+            partitions = cache.partition_stats()
+        except Exception as e:
+            app.logger.warning(f"Could not read {cache_name} audio cache partitions for metrics: {e}")
+            continue
+        for document_id, partition in partitions.items():
+            labels = {"cache": cache_name, "document": document_id}
+            series.append(('audio_cache_document_entries', 'gauge', labels, partition['entries']))
+            series.append(('audio_cache_document_bytes', 'gauge', labels, partition['bytes']))
+    try:
+        for state, jobs in synthesis_jobs.stats().items():
+            series.append(('synthesis_jobs', 'gauge', {"state": state}, jobs))
+    except Exception as e:
+        app.logger.warning(f"Could not read synthesis job stats for metrics: {e}")
+    return series
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus metrics for every worker on this node. If METRICS_BEARER_TOKEN
+    is set, scrapes must send it as "Authorization: Bearer <token>".
+    """
+    expected_token = os.environ.get('METRICS_BEARER_TOKEN')
+    if expected_token and request.headers.get('Authorization') != f"Bearer {expected_token}":
+        return jsonify({"error": "Unauthorized access. Invalid metrics token."}), 401
+
+    return Response(metrics.render(shared_cache_series()), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
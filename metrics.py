@@ -0,0 +1,294 @@
+"""
+In-process metrics with Prometheus text exposition and per-request Server-Timing.
+
+Every gunicorn worker keeps its own counters, gauges and histograms and
+periodically writes them to METRICS_DIR as metrics-<pid>.json. /metrics merges
+the files of all workers, so a scrape that lands on any worker sees the whole
+node: counters and histograms are summed, gauges are reported per live pid.
+
+Stage timings recorded while a request is being served are also collected for
+that request's Server-Timing header, including timings recorded on pool
+threads whose work was handed over with Metrics.submit().
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics Configuration ---
+DEFAULT_METRICS_DIR = os.path.join(tempfile.gettempdir(), 'read_serene_metrics')
+DEFAULT_METRICS_FLUSH_SECONDS = 5
+METRIC_PREFIX = 'read_serene_'
+# Seconds; covers a cache hit (ms) up to a full chapter synthesis (tens of seconds).
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RequestTimings:
+    """Accumulated duration and count per stage for one request; safe to add to from several threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, count = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (total + seconds, count + 1)
+
+    def header_value(self):
+        """Server-Timing value: one entry per stage (summed over parallel calls) plus the total so far."""
+        with self._lock:
+            stages = sorted(self._stages.items())
+        entries = [
+            f'{stage};dur={total * 1000:.1f};desc="{count}x"' if count > 1 else f'{stage};dur={total * 1000:.1f}'
+            for stage, (total, count) in stages
+        ]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(entries)
+
+
+_current_timings = contextvars.ContextVar('read_serene_request_timings', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metrics:
+    """Counters, gauges and latency histograms for one worker process."""
+
+    def __init__(self, directory, flush_interval_seconds, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.directory = directory
+        self.flush_interval_seconds = flush_interval_seconds
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._flusher_pid = None
+
+    def describe(self, name, metric_type, help_text):
+        self._help[name] = (metric_type, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge_add(self, name, amount, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+
+    def gauge_set(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, upper_bound in enumerate(self.buckets):
+                if seconds <= upper_bound:
+                    histogram["buckets"][index] += 1
+                    break
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def record_stage(self, stage, seconds, **labels):
+        """Adds a measured stage duration to the stage histogram and the current request's Server-Timing."""
+        self.observe('stage_seconds', seconds, stage=stage, **labels)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(stage, seconds)
+
+    @contextmanager
+    def stage(self, stage, **labels):
+        """Times a block with record_stage()."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started, **labels)
+
+    # --- Per-request timings ---
+    def start_request(self):
+        timings = RequestTimings()
+        return timings, _current_timings.set(timings)
+
+    def end_request(self, token):
+        try:
+            _current_timings.reset(token)
+        except ValueError:
+            # Torn down in a different context than it was started in.
+            _current_timings.set(None)
+
+    def current_timings(self):
+        return _current_timings.get()
+
+    def submit(self, executor, function, *args, **kwargs):
+        """executor.submit that carries the current request's timings onto the pool thread."""
+        return executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
+
+    # --- Cross-worker exposition ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+                "histograms": [
+                    [name, list(labels), dict(histogram, buckets=list(histogram["buckets"]))]
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+            }
+
+    def flush(self):
+        """Writes this worker's snapshot to the metrics directory."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+            temporary_path = f'{path}.tmp'
+            with open(temporary_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.warning(f"Writing metrics to {self.directory} failed: {e}")
+
+    def start_flusher(self):
+        """Starts the background thread that flushes this worker's metrics; once per process."""
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def flush_periodically():
+            while True:
+                time.sleep(self.flush_interval_seconds)
+                self.flush()
+
+        threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def _worker_snapshots(self):
+        snapshots = {os.getpid(): self.snapshot()}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.setdefault(snapshot["pid"], snapshot)
+        return snapshots.values()
+
+    def render(self, shared_series=()):
+        """
+        Prometheus text format for every worker on the node. shared_series are
+        (name, 'counter' or 'gauge', labels dict, value) tuples read at scrape
+        time from state all workers share, such as the SQLite caches; they are
+        reported once, without a pid label.
+        """
+        counters = {}
+        histograms = {}
+        gauges = {}
+        for snapshot in self._worker_snapshots():
+            pid = snapshot["pid"]
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, histogram in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+                merged["buckets"] = [a + b for a, b in zip(merged["buckets"], histogram["buckets"])]
+                merged["sum"] += histogram["sum"]
+                merged["count"] += histogram["count"]
+            if _process_alive(pid):
+                for name, labels, value in snapshot["gauges"]:
+                    gauges[(name, tuple(map(tuple, labels)) + (('pid', str(pid)),))] = value
+        for name, metric_type, labels, value in shared_series:
+            (counters if metric_type == 'counter' else gauges)[(name, _label_key(labels))] = value
+
+        lines = []
+
+        def header(name, default_type):
+            metric_type, help_text = self._help.get(name, (default_type, name.replace('_', ' ')))
+            lines.append(f'# HELP {METRIC_PREFIX}{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} {metric_type}')
+
+        for kind, series in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in series}):
+                header(name, kind)
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f'{METRIC_PREFIX}{name}{_format_labels(labels)} {value}')
+
+        for name in sorted({name for name, _ in histograms}):
+            header(name, 'histogram')
+            for (series_name, labels), histogram in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for upper_bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f'{METRIC_PREFIX}{name}_bucket{_format_labels(labels, [("le", str(upper_bound))])} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+                lines.append(f'{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+                lines.append(f'{METRIC_PREFIX}{name}_count{_format_labels(labels)} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clear_metrics_dir(directory):
+    """Removes worker files left by a previous run; call once in the gunicorn master before forking."""
+    try:
+        for name in os.listdir(directory):
+            if name.startswith('metrics-'):
+                os.remove(os.path.join(directory, name))
+    except FileNotFoundError:
+        pass
+
+
+def metrics_from_env():
+    """Builds the Metrics configured through METRICS_DIR and METRICS_FLUSH_SECONDS."""
+    return Metrics(
+        directory=os.environ.get('METRICS_DIR', DEFAULT_METRICS_DIR),
+        flush_interval_seconds=float(os.environ.get('METRICS_FLUSH_SECONDS', DEFAULT_METRICS_FLUSH_SECONDS)),
+    )
@@ -0,0 +1,215 @@
+"""
+Frame-level MP3 handling for merging Text-to-Speech output without decoding.
+
+Google returns constant-format MPEG Layer III streams, so a page can be built
+by concatenating each segment's audio frames byte-wise and padding the gaps
+with silent frames of the same version, sample rate and channel mode.
+Durations come from counting frames instead of decoding to PCM.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+
+class Mp3FormatError(ValueError):
+    """Raised when audio is not an MPEG Layer III stream this module can merge."""
+
+
+MPEG_VERSION_2_5, MPEG_VERSION_2, MPEG_VERSION_1 = 0, 2, 3
+LAYER_III = 1
+CHANNEL_MODE_MONO = 3
+
+# Layer III bitrates in kbit/s, indexed by the header's bitrate index.
+LAYER_III_BITRATES_KBPS = {
+    MPEG_VERSION_1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    MPEG_VERSION_2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    MPEG_VERSION_2_5: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES_HZ = {
+    MPEG_VERSION_1: (44100, 48000, 32000),
+    MPEG_VERSION_2: (22050, 24000, 16000),
+    MPEG_VERSION_2_5: (11025, 12000, 8000),
+}
+
+
+class Mp3Format(namedtuple('Mp3Format', 'version bitrate_index sample_rate_index channel_mode')):
+    """The header fields that must agree for frames to be concatenated."""
+
+    @property
+    def sample_rate(self):
+        return SAMPLE_RATES_HZ[self.version][self.sample_rate_index]
+
+    @property
+    def bitrate_kbps(self):
+        return LAYER_III_BITRATES_KBPS[self.version][self.bitrate_index]
+
+    @property
+    def samples_per_frame(self):
+        return 1152 if self.version == MPEG_VERSION_1 else 576
+
+    @property
+    def side_info_length(self):
+        if self.version == MPEG_VERSION_1:
+            return 17 if self.channel_mode == CHANNEL_MODE_MONO else 32
+        return 9 if self.channel_mode == CHANNEL_MODE_MONO else 17
+
+    @property
+    def frame_duration_ms(self):
+        return self.samples_per_frame * 1000 / self.sample_rate
+
+    def frame_length(self, padding=0):
+        coefficient = 144 if self.version == MPEG_VERSION_1 else 72
+        return coefficient * self.bitrate_kbps * 1000 // self.sample_rate + padding
+
+    def is_compatible_with(self, other):
+        """Frames can follow each other if only their bitrates differ."""
+        return (self.version, self.sample_rate_index, self.channel_mode == CHANNEL_MODE_MONO) == \
+            (other.version, other.sample_rate_index, other.channel_mode == CHANNEL_MODE_MONO)
+
+
+# Google Text-to-Speech MP3 output: MPEG-2 Layer III, 24 kHz, mono, 32 kbit/s.
+DEFAULT_TTS_MP3_FORMAT = Mp3Format(MPEG_VERSION_2, 4, 1, CHANNEL_MODE_MONO)
+
+Mp3Stream = namedtuple('Mp3Stream', 'format audio frame_count duration_ms')
+
+
+def _parse_header(data, offset):
+    """Returns (Mp3Format, frame_length, has_crc) for a Layer III header at offset, or None."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3, b4 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b1 != 0xFF or (b2 & 0xE0) != 0xE0:
+        return None
+
+    version = (b2 >> 3) & 0x03
+    layer = (b2 >> 1) & 0x03
+    bitrate_index = b3 >> 4
+    sample_rate_index = (b3 >> 2) & 0x03
+    if version == 1 or layer != LAYER_III or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    frame_format = Mp3Format(version, bitrate_index, sample_rate_index, b4 >> 6)
+    has_crc = (b2 & 0x01) == 0
+    return frame_format, frame_format.frame_length((b3 >> 1) & 0x01), has_crc
+
+
+def _skip_id3v2(data):
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _is_info_frame(data, offset, frame_format, has_crc):
+    """True for the Xing/Info/VBRI metadata frame encoders put first; it holds no audio."""
+    side_info_start = offset + 4 + (2 if has_crc else 0)
+    tag = data[side_info_start + frame_format.side_info_length:side_info_start + frame_format.side_info_length + 4]
+    return tag in (b'Xing', b'Info') or data[offset + 36:offset + 40] == b'VBRI'
+
+
+def parse_mp3(data):
+    """
+    Walks the frame headers of an MP3 stream and returns an Mp3Stream holding
+    only its audio frames (ID3 tags and the Xing/Info frame removed), the
+    stream format, the frame count and the duration in ms.
+    """
+    offset = _skip_id3v2(data)
+    data_length = len(data)
+    audio_start = None
+    frame_count = 0
+    stream_format = None
+    chunks = []
+
+    while offset + 4 <= data_length:
+        header = _parse_header(data, offset)
+        if header is None:
+            if data[offset:offset + 3] == b'TAG':  # ID3v1 trailer
+                break
+            offset += 1  # resynchronize on junk between frames
+            continue
+
+        frame_format, frame_length, has_crc = header
+        if offset + frame_length > data_length:
+            break  # truncated final frame
+
+        if stream_format is None:
+            stream_format = frame_format
+            if _is_info_frame(data, offset, frame_format, has_crc):
+                offset += frame_length
+                continue
+        elif not frame_format.is_compatible_with(stream_format):
+            raise Mp3FormatError("MP3 stream changes sample rate or channel mode mid-stream.")
+
+        if audio_start is None:
+            audio_start = offset
+        chunks.append(data[offset:offset + frame_length])
+        frame_count += 1
+        offset += frame_length
+
+    if stream_format is None or frame_count == 0:
+        raise Mp3FormatError("No MPEG Layer III audio frames found.")
+
+    return Mp3Stream(
+        format=stream_format,
+        audio=b"".join(chunks),
+        frame_count=frame_count,
+        duration_ms=frame_count * stream_format.frame_duration_ms,
+    )
+
+
+def _silent_frame(frame_format):
+    """
+    Builds one silent Layer III frame: a header without CRC or padding followed
+    by all-zero side info (no main data, no bit reservoir use) and zero fill.
+    """
+    header = bytes((
+        0xFF,
+        0xE0 | (frame_format.version << 3) | (LAYER_III << 1) | 0x01,
+        (frame_format.bitrate_index << 4) | (frame_format.sample_rate_index << 2),
+        frame_format.channel_mode << 6,
+    ))
+    return header + bytes(frame_format.frame_length() - len(header))
+
+
+@lru_cache(maxsize=64)
+def silence(frame_format, duration_ms):
+    """
+    Returns (audio_bytes, actual_duration_ms) for silence in frame_format,
+    rounded to a whole number of frames.
+    """
+    frame_count = max(1, round(duration_ms / frame_format.frame_duration_ms))
+    return _silent_frame(frame_format) * frame_count, frame_count * frame_format.frame_duration_ms
+
+
+class Mp3Concatenator:
+    """
+    Builds one MP3 stream from segments and silence gaps in memory, tracking
+    the running duration from frame counts.
+    """
+
+    def __init__(self, frame_format=None):
+        self.format = frame_format
+        self.duration_ms = 0
+        self._chunks = []
+
+    def append_stream(self, stream):
+        """Appends a parsed Mp3Stream and returns its duration in ms."""
+        if self.format is None:
+            self.format = stream.format
+        elif not stream.format.is_compatible_with(self.format):
+            raise Mp3FormatError(
+                f"Cannot join {stream.format.sample_rate} Hz audio onto a {self.format.sample_rate} Hz stream."
+            )
+        self._chunks.append(stream.audio)
+        self.duration_ms += stream.duration_ms
+        return stream.duration_ms
+
+    def append_silence(self, duration_ms):
+        """Appends silence matching the stream format and returns its actual duration in ms."""
+        audio, actual_duration_ms = silence(self.format or DEFAULT_TTS_MP3_FORMAT, duration_ms)
+        self._chunks.append(audio)
+        self.duration_ms += actual_duration_ms
+        return actual_duration_ms
+
+    def getvalue(self):
+        return b"".join(self._chunks)
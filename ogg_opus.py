@@ -0,0 +1,252 @@
+"""
+Packet-level Ogg Opus handling for merging Text-to-Speech output without
+transcoding.
+
+Google's OGG_OPUS output is a single Ogg logical stream: an OpusHead and an
+OpusTags header packet followed by Opus audio packets. A page is built by
+taking every segment's audio packets in order, padding the gaps with silent
+Opus packets, and writing them out again as one stream with the first
+segment's headers and fresh page numbers and granule positions. Durations
+come from the packets' TOC bytes instead of decoding.
+"""
+import zlib
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+
+class OggOpusFormatError(ValueError):
+    """Raised when audio is not a single-stream Ogg Opus file this module can merge."""
+
+
+# Opus always counts time in 48 kHz samples, whatever the input sample rate.
+OPUS_SAMPLES_PER_MS = 48
+# One 20 ms CELT frame that decodes to digital silence, mono.
+SILENT_PACKET = b'\xf8\xff\xfe'
+SILENT_PACKET_SAMPLES = 960
+# Pages are closed at about this many body bytes (and always at 255 lacing values).
+PAGE_TARGET_BYTES = 4096
+# Every page this module writes uses the same serial number, so merging the
+# same segments always produces the same bytes (and the same content hash).
+STREAM_SERIAL = 0x52534552
+VENDOR = b'read_serene'
+
+_BIT_REVERSED_BYTES = bytes(int(f'{value:08b}'[::-1], 2) for value in range(256))
+# Frame sizes in 48 kHz samples for each TOC configuration number (RFC 6716, section 3.1).
+_FRAME_SAMPLES = (
+    (480, 960, 1920, 2880) * 3      # SILK-only, configurations 0-11
+    + (480, 960) * 2                # hybrid, 12-15
+    + (120, 240, 480, 960) * 4      # CELT-only, 16-31
+)
+
+
+class OpusFormat(namedtuple('OpusFormat', 'channel_count pre_skip input_sample_rate output_gain')):
+    """The OpusHead fields carried over into a merged stream."""
+
+    def is_compatible_with(self, other):
+        """Packets can follow each other if the channel counts agree."""
+        return self.channel_count == other.channel_count
+
+    def head_packet(self):
+        return b'OpusHead' + struct.pack(
+            '<BBHIhB', 1, self.channel_count, self.pre_skip, self.input_sample_rate, self.output_gain, 0
+        )
+
+
+# Google Text-to-Speech OGG_OPUS output: mono, 24 kHz input rate, the usual 312-sample encoder delay.
+DEFAULT_TTS_OPUS_FORMAT = OpusFormat(channel_count=1, pre_skip=312, input_sample_rate=24000, output_gain=0)
+
+OpusStream = namedtuple('OpusStream', 'format packets sample_count duration_ms')
+
+
+def ogg_crc(data):
+    """
+    Ogg's CRC-32 (polynomial 0x04C11DB7, not reflected, zero initial value and
+    no final XOR), computed with zlib's reflected CRC on bit-reversed bytes.
+    """
+    reflected = zlib.crc32(data.translate(_BIT_REVERSED_BYTES), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f'{reflected:032b}'[::-1], 2)
+
+
+def opus_packet_samples(packet):
+    """Number of 48 kHz samples an Opus packet decodes to, from its TOC byte."""
+    if not packet:
+        return 0
+    toc = packet[0]
+    frame_count_code = toc & 0x03
+    if frame_count_code == 0:
+        frame_count = 1
+    elif frame_count_code in (1, 2):
+        frame_count = 2
+    else:
+        if len(packet) < 2:
+            raise OggOpusFormatError("Truncated Opus packet.")
+        frame_count = packet[1] & 0x3F
+    return _FRAME_SAMPLES[toc >> 3] * frame_count
+
+
+def _parse_head(packet):
+    if len(packet) < 19 or not packet.startswith(b'OpusHead'):
+        raise OggOpusFormatError("Ogg stream does not start with an OpusHead packet.")
+    version, channel_count, pre_skip, input_sample_rate, output_gain, mapping_family = struct.unpack_from(
+        '<BBHIhB', packet, 8
+    )
+    if version >> 4:
+        raise OggOpusFormatError(f"Unsupported Ogg Opus version {version}.")
+    if mapping_family != 0:
+        raise OggOpusFormatError(f"Unsupported Opus channel mapping family {mapping_family}.")
+    return OpusFormat(channel_count, pre_skip, input_sample_rate, output_gain)
+
+
+def parse_ogg_opus(data):
+    """
+    Walks the pages of an Ogg Opus file and returns an OpusStream holding its
+    header format, its audio packets (header packets removed), the number of
+    samples they decode to and the playable duration in ms.
+    """
+    packets = []
+    partial = []
+    serial = None
+    last_granule = -1
+    offset = 0
+    data_length = len(data)
+
+    while offset + 27 <= data_length:
+        if data[offset:offset + 4] != b'OggS':
+            raise OggOpusFormatError("Not an Ogg stream: missing OggS capture pattern.")
+        granule, page_serial = struct.unpack_from('<qI', data, offset + 6)
+        segment_count = data[offset + 26]
+        lacing = data[offset + 27:offset + 27 + segment_count]
+        body_start = offset + 27 + segment_count
+        if body_start + sum(lacing) > data_length:
+            break  # truncated final page
+
+        if serial is None:
+            serial = page_serial
+        elif page_serial != serial:
+            raise OggOpusFormatError("Chained or multiplexed Ogg streams are not supported.")
+
+        position = body_start
+        for value in lacing:
+            partial.append(data[position:position + value])
+            position += value
+            if value < 255:
+                packets.append(b''.join(partial))
+                partial = []
+        if granule != -1:
+            last_granule = granule
+        offset = position
+
+    if len(packets) < 2:
+        raise OggOpusFormatError("No Ogg Opus header packets found.")
+    stream_format = _parse_head(packets[0])
+    if not packets[1].startswith(b'OpusTags'):
+        raise OggOpusFormatError("Ogg Opus stream has no OpusTags packet.")
+    audio_packets = tuple(packets[2:])
+    if not audio_packets:
+        raise OggOpusFormatError("No Opus audio packets found.")
+
+    sample_count = sum(opus_packet_samples(packet) for packet in audio_packets)
+    # The last granule position trims encoder padding off the end; without one, play every sample.
+    end_sample = last_granule if 0 <= last_granule <= sample_count else sample_count
+    return OpusStream(
+        format=stream_format,
+        packets=audio_packets,
+        sample_count=sample_count,
+        duration_ms=max(0, end_sample - stream_format.pre_skip) / OPUS_SAMPLES_PER_MS,
+    )
+
+
+def _page(header_type, granule, sequence, lacing, body):
+    header = struct.pack(
+        '<4sBBqIIIB', b'OggS', 0, header_type, granule, STREAM_SERIAL, sequence, 0, len(lacing)
+    ) + bytes(lacing)
+    page = header + body
+    return page[:22] + struct.pack('<I', ogg_crc(page)) + page[26:]
+
+
+def _lacing(packet):
+    return [255] * (len(packet) // 255) + [len(packet) % 255]
+
+
+def write_ogg_opus(stream_format, packets):
+    """Writes packets as one Ogg Opus stream with stream_format's OpusHead; the last page ends the stream."""
+    tags = b'OpusTags' + struct.pack('<I', len(VENDOR)) + VENDOR + struct.pack('<I', 0)
+    pages = [
+        _page(0x02, 0, 0, _lacing(stream_format.head_packet()), stream_format.head_packet()),
+        _page(0x00, 0, 1, _lacing(tags), tags),
+    ]
+
+    granule = 0
+    lacing, body = [], []
+    body_length = 0
+    for packet in packets:
+        packet_lacing = _lacing(packet)
+        if lacing and (len(lacing) + len(packet_lacing) > 255 or body_length >= PAGE_TARGET_BYTES):
+            pages.append(_page(0x00, granule, len(pages), lacing, b''.join(body)))
+            lacing, body, body_length = [], [], 0
+        lacing.extend(packet_lacing)
+        body.append(packet)
+        body_length += len(packet)
+        granule += opus_packet_samples(packet)
+    pages.append(_page(0x04, granule, len(pages), lacing, b''.join(body)))
+    return b''.join(pages)
+
+
+def _silent_packets(duration_ms):
+    packet_count = max(1, round(duration_ms * OPUS_SAMPLES_PER_MS / SILENT_PACKET_SAMPLES))
+    return [SILENT_PACKET] * packet_count, packet_count * SILENT_PACKET_SAMPLES / OPUS_SAMPLES_PER_MS
+
+
+@lru_cache(maxsize=64)
+def silence(stream_format, duration_ms):
+    """
+    Returns (audio_bytes, actual_duration_ms) for a standalone Ogg Opus file of
+    silence with stream_format's channel count, rounded to whole 20 ms packets.
+    """
+    packets, actual_duration_ms = _silent_packets(duration_ms)
+    return write_ogg_opus(stream_format._replace(pre_skip=0), packets), actual_duration_ms
+
+
+class OggOpusConcatenator:
+    """
+    Builds one Ogg Opus stream from segments and silence gaps in memory,
+    tracking the running duration from packet sample counts. The first
+    segment's pre-skip applies to the merged stream; later segments' encoder
+    delay (about 6.5 ms each) stays in and is counted in their durations.
+    """
+
+    def __init__(self, stream_format=None):
+        self.format = stream_format
+        self.duration_ms = 0
+        self._packets = []
+        self._sample_count = 0
+
+    def _append(self, packets, sample_count):
+        pre_skip = self.format.pre_skip if self.format else 0
+        before_ms = self.duration_ms
+        self._packets.extend(packets)
+        self._sample_count += sample_count
+        self.duration_ms = max(0, self._sample_count - pre_skip) / OPUS_SAMPLES_PER_MS
+        return self.duration_ms - before_ms
+
+    def append_stream(self, stream):
+        """Appends a parsed OpusStream and returns the duration it added in ms."""
+        if self.format is None:
+            self.format = stream.format
+        elif not stream.format.is_compatible_with(self.format):
+            raise OggOpusFormatError(
+                f"Cannot join {stream.format.channel_count}-channel Opus onto a "
+                f"{self.format.channel_count}-channel stream."
+            )
+        return self._append(stream.packets, stream.sample_count)
+
+    def append_silence(self, duration_ms):
+        """Appends silent packets and returns the duration they added in ms."""
+        if self.format is None:
+            self.format = DEFAULT_TTS_OPUS_FORMAT
+        packets, _ = _silent_packets(duration_ms)
+        return self._append(packets, len(packets) * SILENT_PACKET_SAMPLES)
+
+    def getvalue(self):
+        return write_ogg_opus(self.format or DEFAULT_TTS_OPUS_FORMAT, self._packets)
@@ -0,0 +1,317 @@
+"""
+Pre-synthesis of chapter audio ahead of readers.
+
+Walks the parsed books/chapters of a document, turns each chapter's HTML into
+the same paragraph records frontend.php sends, runs them through the normal
+segmentation and fills the shared audio cache for every configured voice and audio encoding.
+
+The frontend packs narration per page, and its page breaks depend on the
+reader's screen, so packed segment texts cannot be known here. Pre-warm
+instead synthesizes each paragraph (or each part of a paragraph too long for
+one request) on its own: those texts are the same for every page layout, and
+the request path joins a packed segment from them when all are cached.
+
+Run it from the command line:
+    python prewarm.py [--document <id>] [--voice en-US-Wavenet-E:en-US ...] [--encoding OGG_OPUS ...] [--rate 2]
+or through the authenticated POST /admin/prewarm route.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import argparse
+import tempfile
+import threading
+import contextvars
+
+from bs4 import BeautifulSoup
+
+from audio_codecs import AUDIO_CODECS, make_audio_config
+
+logger = logging.getLogger(__name__)
+
+# The frontend's default narrators, as "voiceName:languageCode" pairs.
+DEFAULT_PREWARM_VOICES = "en-US-Wavenet-E:en-US,en-US-Wavenet-D:en-US"
+# What frontend.php asks for: Ogg Opus where the browser plays it, MP3 elsewhere.
+DEFAULT_PREWARM_AUDIO_ENCODINGS = "OGG_OPUS,MP3"
+DEFAULT_PREWARM_MAX_REQUESTS_PER_SECOND = 2.0
+DEFAULT_PREWARM_STATE_PATH = os.path.join(tempfile.gettempdir(), 'read_serene_prewarm.sqlite3')
+
+# Same test frontend.php uses to tell dialogue from narration.
+DIALOGUE_PATTERN = re.compile(r'["“”][^"“”]+["“”]')
+
+
+def parse_voices(voices_spec):
+    """Parses "voiceName:languageCode,..." into a list of (voice_name, language_code) tuples."""
+    voices = []
+    for item in voices_spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        voice_name, _, language_code = item.partition(':')
+        if not language_code:
+            # Voice names start with their language code, e.g. en-US-Wavenet-E.
+            language_code = '-'.join(voice_name.split('-')[:2])
+        voices.append((voice_name, language_code))
+    return voices
+
+
+def parse_audio_encodings(encodings_spec):
+    """Parses "OGG_OPUS,MP3" into a list of audio configs; raises ValueError for an unknown encoding."""
+    audio_configs = []
+    for encoding in encodings_spec.split(','):
+        encoding = encoding.strip().upper()
+        if not encoding:
+            continue
+        if encoding not in AUDIO_CODECS:
+            raise ValueError(f"Unknown audio encoding {encoding!r}; expected one of {', '.join(AUDIO_CODECS)}.")
+        audio_configs.append(make_audio_config(encoding))
+    return audio_configs
+
+
+def chapter_paragraphs_for_synthesis(chapter_html):
+    """
+    Converts chapter HTML into the paragraph records frontend.php builds:
+    every <p> with text, classified as italicised, dialogue or narration.
+    Page numbers depend on the reader's screen, so they are left unset.
+    """
+    paragraphs = []
+    soup = BeautifulSoup(chapter_html, 'html.parser')
+    for index, p in enumerate(soup.find_all('p')):
+        text = p.get_text().strip()
+        if not text:
+            continue
+
+        paragraph_type = 'narration'
+        italic_node = p.find(['em', 'i'])
+        if italic_node is not None and italic_node.get_text().strip() == text:
+            paragraph_type = 'italicised'
+        elif DIALOGUE_PATTERN.search(text):
+            paragraph_type = 'dialogue'
+
+        paragraphs.append({
+            "pageNumber": None,
+            "paragraphIndexOnPage": index,
+            "paragraphType": paragraph_type,
+            "text": text
+        })
+    return paragraphs
+
+
+class PrewarmJob:
+    """
+    Fills the audio cache for a parsed document, one chapter, voice and audio
+    config at a time. The first audio config is warmed for the whole document
+    before the next one is started.
+
+    part_texts(paragraphs) returns the texts to synthesize for a chapter's
+    paragraph records: each paragraph, or part of an over-long paragraph, on
+    its own. cache_key_for and synthesize take (text, voice_name,
+    language_code, audio_config). Finished (voice, audio config, chapter
+    content hash) entries are recorded in a
+    small SQLite state file, so a restarted job resumes where it left off and a
+    new document revision only revisits chapters whose text changed. Within a
+    chapter, texts already in the cache are skipped, so only changed text is
+    sent to Text-to-Speech. Upstream calls are spaced to max_requests_per_second.
+    """
+
+    def __init__(self, audio_cache, cache_key_for, synthesize, part_texts,
+                 state_path, max_requests_per_second):
+        self.audio_cache = audio_cache
+        self.cache_key_for = cache_key_for
+        self.synthesize = synthesize
+        self.part_texts = part_texts
+        self.state_path = state_path
+        self.min_interval_seconds = 1.0 / max_requests_per_second if max_requests_per_second > 0 else 0
+        self._next_call_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {"state": "idle"}
+
+    def _state_connection(self):
+        conn = sqlite3.connect(self.state_path, timeout=30, isolation_level=None)
+        # prewarm_progress recorded chapters warmed as whole-chapter packed
+        # segments, which readers never request; those chapters are warmed again.
+        # prewarm_chapters did not record the audio config; its chapters are
+        # revisited, and their MP3 parts found in the audio cache.
+        conn.execute("DROP TABLE IF EXISTS prewarm_progress")
+        conn.execute("DROP TABLE IF EXISTS prewarm_chapters")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS prewarm_chapter_audio ("
+            " voice_name TEXT NOT NULL,"
+            " language_code TEXT NOT NULL,"
+            " audio_config TEXT NOT NULL,"
+            " chapter_hash TEXT NOT NULL,"
+            " chapter_id TEXT NOT NULL,"
+            " completed_at REAL NOT NULL,"
+            " PRIMARY KEY (voice_name, language_code, audio_config, chapter_hash))"
+        )
+        return conn
+
+    def _throttle(self):
+        now = time.monotonic()
+        if now < self._next_call_at:
+            time.sleep(self._next_call_at - now)
+        self._next_call_at = max(now, self._next_call_at) + self.min_interval_seconds
+
+    def run(self, parsed_document, voices, audio_configs):
+        """Pre-synthesizes every chapter of parsed_document for every voice and audio config. Blocks until done."""
+        chapters = []
+        seen_chapter_ids = set()
+        for book in parsed_document.get('books', []):
+            for chapter in book['chapters']:
+                # The parser lists the introduction chapter twice.
+                if chapter['id'] not in seen_chapter_ids:
+                    seen_chapter_ids.add(chapter['id'])
+                    chapters.append(chapter)
+
+        self.status = {
+            "state": "running",
+            "document_id": parsed_document.get('document_id'),
+            "voices": [f"{voice_name}:{language_code}" for voice_name, language_code in voices],
+            "audio_encodings": [audio_config['audio_encoding'] for audio_config in audio_configs],
+            "chapters_total": len(chapters) * len(voices) * len(audio_configs),
+            "chapters_done": 0,
+            "chapters_skipped": 0,
+            "segments_synthesized": 0,
+            "segments_cached": 0,
+            "errors": 0,
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        conn = self._state_connection()
+        try:
+            for audio_config in audio_configs:
+                for voice_name, language_code in voices:
+                    for chapter in chapters:
+                        self._prewarm_chapter(conn, chapter, voice_name, language_code, audio_config)
+            self.status["state"] = "done"
+        except Exception as e:
+            logger.error(f"Pre-warm job failed: {e}", exc_info=True)
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["finished_at"] = time.time()
+            conn.close()
+        logger.info(f"Pre-warm job finished: {self.status}")
+        return self.status
+
+    def _prewarm_chapter(self, conn, chapter, voice_name, language_code, audio_config):
+        chapter_hash = hashlib.sha256(chapter['content'].encode('utf-8')).hexdigest()
+        config_label = json.dumps(audio_config, sort_keys=True)
+        already_done = conn.execute(
+            "SELECT 1 FROM prewarm_chapter_audio"
+            " WHERE voice_name = ? AND language_code = ? AND audio_config = ? AND chapter_hash = ?",
+            (voice_name, language_code, config_label, chapter_hash)
+        ).fetchone()
+        if already_done:
+            self.status["chapters_skipped"] += 1
+            self.status["chapters_done"] += 1
+            return
+
+        chapter_errors = 0
+        for text in self.part_texts(chapter_paragraphs_for_synthesis(chapter['content'])):
+            if self.audio_cache.contains(self.cache_key_for(text, voice_name, language_code, audio_config)):
+                self.status["segments_cached"] += 1
+                continue
+
+            self._throttle()
+            try:
+                self.synthesize(text, voice_name, language_code, audio_config)
+                self.status["segments_synthesized"] += 1
+            except Exception as e:
+                chapter_errors += 1
+                self.status["errors"] += 1
+                logger.warning(
+                    f"Pre-warm synthesis failed in chapter {chapter['id']} "
+                    f"({voice_name}, {audio_config['audio_encoding']}): {e}"
+                )
+
+        if not chapter_errors:
+            conn.execute(
+                "INSERT OR REPLACE INTO prewarm_chapter_audio "
+                "(voice_name, language_code, audio_config, chapter_hash, chapter_id, completed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (voice_name, language_code, config_label, chapter_hash, chapter['id'], time.time())
+            )
+        self.status["chapters_done"] += 1
+
+    def start(self, load_parsed_document, voices, audio_configs):
+        """
+        Runs the job on a background thread. load_parsed_document is called on
+        that thread, which runs in a copy of the caller's context (document
+        scope, metrics). Returns False if a job is already running in this process.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+
+            def target():
+                try:
+                    self.run(load_parsed_document(), voices, audio_configs)
+                except Exception as e:
+                    logger.error(f"Pre-warm job could not start: {e}", exc_info=True)
+                    self.status = {"state": "failed", "error": str(e), "finished_at": time.time()}
+
+            self.status = {"state": "starting"}
+            context = contextvars.copy_context()
+            self._thread = threading.Thread(target=context.run, args=(target,), name='audio-prewarm', daemon=True)
+            self._thread.start()
+            return True
+
+
+def prewarm_job_from_env(audio_cache, cache_key_for, synthesize, part_texts):
+    """Builds the PrewarmJob configured through PREWARM_* environment variables."""
+    return PrewarmJob(
+        audio_cache=audio_cache,
+        cache_key_for=cache_key_for,
+        synthesize=synthesize,
+        part_texts=part_texts,
+        state_path=os.environ.get('PREWARM_STATE_PATH', DEFAULT_PREWARM_STATE_PATH),
+        max_requests_per_second=float(
+            os.environ.get('PREWARM_MAX_REQUESTS_PER_SECOND', DEFAULT_PREWARM_MAX_REQUESTS_PER_SECOND)
+        ),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-synthesize chapter audio into the shared audio cache.")
+    parser.add_argument('--voice', action='append', dest='voices',
+                        help="voiceName:languageCode to pre-warm; repeatable (default: PREWARM_VOICES)")
+    parser.add_argument('--encoding', action='append', dest='encodings',
+                        help="audio encoding to pre-warm (MP3, OGG_OPUS); repeatable (default: PREWARM_AUDIO_ENCODINGS)")
+    parser.add_argument('--rate', type=float, help="maximum Text-to-Speech requests per second")
+    parser.add_argument('--document', help="document id to pre-warm (default: the first of DOCUMENT_IDS)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    import main as app_module
+
+    voices = parse_voices(','.join(args.voices)) if args.voices else app_module.PREWARM_VOICES
+    try:
+        audio_configs = (
+            parse_audio_encodings(','.join(args.encodings)) if args.encodings else app_module.PREWARM_AUDIO_CONFIGS
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    job = app_module.prewarm_job
+    if args.rate is not None:
+        job.min_interval_seconds = 1.0 / args.rate if args.rate > 0 else 0
+
+    document_id = app_module.document_registry.resolve(args.document)
+    if document_id is None:
+        parser.error(f"document {args.document} is not in DOCUMENT_IDS")
+
+    with app_module.document_scope(document_id):
+        parsed_document = app_module.document_cache.get(document_id).parsed
+        status = job.run(parsed_document, voices, audio_configs)
+    print(status)
+    return 0 if status["state"] == "done" and not status["errors"] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
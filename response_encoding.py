@@ -0,0 +1,150 @@
+"""
+Response bodies serialized once and compressed once.
+
+json_bytes() serializes with orjson when it is installed (several times faster
+than the standard library on large documents) and falls back to json.
+EncodedBody keeps a cacheable payload as bytes together with its gzip and, when
+the brotli package is installed, brotli variants, so serving it is a dict
+lookup on the negotiated encoding. compress_bytes() is the on-the-fly path
+for large dynamic responses; it uses faster settings.
+"""
+import os
+import gzip
+import json
+import hashlib
+import functools
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional; gzip is always available
+    brotli = None
+
+# --- Response Encoding Configuration ---
+# Bodies smaller than this are sent as they are: compression would barely shrink
+# them and the Content-Encoding header costs about as much as it saves.
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+# Stored variants are compressed once per payload, so they use strong settings;
+# dynamic responses are compressed per request with cheaper ones.
+STORED_GZIP_LEVEL = 9
+STORED_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 9))
+DYNAMIC_GZIP_LEVEL = 5
+DYNAMIC_BROTLI_QUALITY = 4
+# Preferred order when the client accepts several encodings equally.
+ENCODING_PREFERENCE = ('br', 'gzip', 'identity') if brotli is not None else ('gzip', 'identity')
+
+
+def json_bytes(value):
+    """Compact UTF-8 JSON for value."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # Types orjson does not handle (e.g. integers beyond 64 bits) go through json.
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compress_bytes(body, encoding, dynamic=True):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=DYNAMIC_GZIP_LEVEL if dynamic else STORED_GZIP_LEVEL, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=DYNAMIC_BROTLI_QUALITY if dynamic else STORED_BROTLI_QUALITY)
+    return body
+
+
+@functools.lru_cache(maxsize=256)
+def negotiate_encoding(accept_encoding, available=ENCODING_PREFERENCE):
+    """
+    Picks the encoding to send for an Accept-Encoding header value among
+    available (in preference order): the one with the highest q-value, ties
+    going to the earlier entry. Cached per header value, since browsers send
+    only a handful of distinct ones.
+    """
+    q_values = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        q_values[coding] = q
+
+    best, best_q = 'identity', 0.0
+    for encoding in available:
+        if encoding in q_values:
+            q = q_values[encoding]
+        elif encoding == 'identity':
+            # Unlisted identity is always acceptable (unless "*;q=0"), but loses to any listed coding.
+            q = q_values['*'] if '*' in q_values else 0.001
+        else:
+            q = q_values.get('*', 0.0)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class EncodedBody:
+    """
+    One response payload as bytes plus precompressed variants, with an ETag per
+    variant ("<hash>" for identity, "<hash>-gzip", "<hash>-br"), since each
+    encoding is a different representation.
+    """
+
+    def __init__(self, body, etag=None, mimetype='application/json', min_compress_bytes=DEFAULT_COMPRESS_MIN_BYTES):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag or hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {'identity': body}
+        if len(body) >= min_compress_bytes:
+            for encoding in ENCODING_PREFERENCE:
+                if encoding != 'identity':
+                    self.variants[encoding] = compress_bytes(body, encoding, dynamic=False)
+        self.available = tuple(encoding for encoding in ENCODING_PREFERENCE if encoding in self.variants)
+
+    @classmethod
+    def from_json(cls, value, etag=None):
+        return cls(json_bytes(value), etag=etag)
+
+    def variant(self, accept_encoding):
+        """Returns (encoding, bytes, etag) for an Accept-Encoding header value."""
+        encoding = negotiate_encoding(accept_encoding, self.available)
+        etag = self.etag if encoding == 'identity' else f"{self.etag}-{encoding}"
+        return encoding, self.variants[encoding], etag
+
+    @property
+    def size(self):
+        return sum(len(variant) for variant in self.variants.values())
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes jsonify() responses with json_bytes()."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            try:
+                body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+                return self._app.response_class(body, mimetype=self.mimetype)
+            except TypeError:
+                pass
+        return super().response(obj)
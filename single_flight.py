@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process: the first
+    caller runs the function, later callers wait for and share its result
+    (or its exception). Nothing is cached once the call finishes.
+
+    do() returns (result, shared), where shared is True for callers that
+    waited on someone else's call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        with self._lock:
+            entry = self._in_flight.get(key)
+            if entry is not None:
+                entry['waiters'] += 1
+                self.coalesced += 1
+                is_leader = False
+            else:
+                entry = {"future": Future(), "waiters": 0}
+                self._in_flight[key] = entry
+                self.calls += 1
+                is_leader = True
+
+        if not is_leader:
+            return entry['future'].result(), True
+
+        try:
+            result = function()
+        except BaseException as e:
+            entry['future'].set_exception(e)
+            raise
+        else:
+            entry['future'].set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        """Counts for this process: calls made, callers coalesced onto them, and what is in flight now."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "waiting": sum(entry['waiters'] for entry in self._in_flight.values()),
+            }
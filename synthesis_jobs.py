@@ -0,0 +1,431 @@
+"""
+Persistent queue for asynchronous chapter synthesis.
+
+A job is one chapter's pages for one voice. Jobs and their pages live in a
+SQLite file shared by every gunicorn worker on the node, so a job survives the
+worker that accepted it. Each worker runs a few job threads that claim the
+oldest queued job (highest priority first) under a lease, synthesize its pages
+and record every finished page as soon as it completes. The lease is renewed
+while the job makes progress; if the worker dies, the lease runs out and
+another worker picks the job up, skipping pages that are already done.
+
+Jobs are deduplicated by their dedupe key: the hash of the chapter's page
+paragraphs, the voice, the audio config and the document. Submitting the same
+chapter and voice for the same document again returns the queued, running or
+finished job instead of starting another one; another document with the same
+text gets its own job, so its audio is filed under that document. A finished
+job with pages that failed is queued again for those pages only, so a
+transient Text-to-Speech error can be retried by submitting again.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+# --- Synthesis Job Configuration ---
+DEFAULT_SYNTHESIS_JOBS_PATH = os.path.join(tempfile.gettempdir(), 'read_serene_synthesis_jobs.sqlite3')
+DEFAULT_SYNTHESIS_JOB_WORKERS = 2
+DEFAULT_SYNTHESIS_JOB_LEASE_SECONDS = 60
+DEFAULT_SYNTHESIS_JOB_MAX_ATTEMPTS = 3
+DEFAULT_SYNTHESIS_JOB_RETENTION_SECONDS = 24 * 60 * 60
+# How often idle job threads look for work queued by other workers.
+JOB_POLL_SECONDS = 1.0
+CLEANUP_INTERVAL_SECONDS = 60
+
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+
+def chapter_content_hash(pages):
+    """Hash of a chapter's [(page_number, paragraphs)] as submitted: page layout, paragraph types and text."""
+    material = [
+        [page_number, [[p.get('paragraphType'), p.get('text')] for p in paragraphs]]
+        for page_number, paragraphs in pages
+    ]
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def job_dedupe_key(content_hash, voice_name, language_code, audio_config, document_id=''):
+    key_material = json.dumps(
+        [content_hash, voice_name, language_code, audio_config, document_id], sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+
+class SynthesisJobQueue:
+    """
+    SQLite-backed chapter synthesis jobs; see the module docstring.
+
+    start_page(job, page) must start synthesizing one page and return a Future
+    of (page_response, status_code), as synthesize_page_audio() returns. job
+    has voice_name, language_code, priority, document_id and audio_config;
+    page has page_index, page_number and paragraphs. result_is_valid(pages),
+    if set, is asked whether a finished job's page results can still be served
+    (e.g. their audio has not been evicted) before it is reused for a
+    duplicate submission; its failed or unfinished pages are queued again.
+    """
+
+    def __init__(self, path, start_page, workers, lease_seconds, max_attempts, retention_seconds,
+                 result_is_valid=None):
+        self.path = path
+        self.start_page = start_page
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.result_is_valid = result_is_valid
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._cleaned_at = 0.0
+
+    def _connect(self):
+        # One connection per thread, re-opened after a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._create_schema(conn)
+                    self._schema_ready = True
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS synthesis_jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " dedupe_key TEXT NOT NULL UNIQUE,"
+            " content_hash TEXT NOT NULL,"
+            " voice_name TEXT NOT NULL,"
+            " language_code TEXT NOT NULL,"
+            " priority INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " page_count INTEGER NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_owner TEXT,"
+            " lease_expires_at REAL,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " document_id TEXT NOT NULL DEFAULT '',"
+            " audio_config TEXT NOT NULL DEFAULT '')"
+        )
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(synthesis_jobs)")}
+        if 'document_id' not in columns:
+            conn.execute("ALTER TABLE synthesis_jobs ADD COLUMN document_id TEXT NOT NULL DEFAULT ''")
+        if 'audio_config' not in columns:
+            conn.execute("ALTER TABLE synthesis_jobs ADD COLUMN audio_config TEXT NOT NULL DEFAULT ''")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_synthesis_jobs_state ON synthesis_jobs (state, priority, created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS synthesis_job_pages ("
+            " job_id TEXT NOT NULL,"
+            " page_index INTEGER NOT NULL,"
+            " page_number TEXT NOT NULL,"
+            " paragraphs TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " status_code INTEGER,"
+            " result TEXT,"
+            " finished_at REAL,"
+            " PRIMARY KEY (job_id, page_index))"
+        )
+
+    # --- Submitting and polling ---
+    def submit(self, pages, voice_name, language_code, priority, audio_config, document_id=''):
+        """
+        Queues a job for pages ([(page_number, paragraphs)]) of document_id unless
+        an equivalent one is queued, running or finished and still valid.
+        Returns (status, created).
+        """
+        content_hash = chapter_content_hash(pages)
+        dedupe_key = job_dedupe_key(content_hash, voice_name, language_code, audio_config, document_id)
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = conn.execute(
+                "SELECT job_id, state FROM synthesis_jobs WHERE dedupe_key = ?", (dedupe_key,)
+            ).fetchone()
+            if existing is not None and self._reuse(conn, existing['job_id'], existing['state']):
+                conn.execute("COMMIT")
+                self._wake.set()
+                return self.status(existing['job_id']), False
+            if existing is not None:
+                self._delete_jobs(conn, [existing['job_id']])
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO synthesis_jobs (job_id, dedupe_key, content_hash, voice_name, language_code, priority,"
+                " state, page_count, created_at, document_id, audio_config)"
+                " VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, dedupe_key, content_hash, voice_name, language_code, priority, len(pages), now, document_id,
+                 json.dumps(audio_config, sort_keys=True))
+            )
+            conn.executemany(
+                "INSERT INTO synthesis_job_pages (job_id, page_index, page_number, paragraphs, state)"
+                " VALUES (?, ?, ?, ?, 'pending')",
+                [
+                    (job_id, page_index, json.dumps(page_number), json.dumps(paragraphs, ensure_ascii=False))
+                    for page_index, (page_number, paragraphs) in enumerate(pages)
+                ]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        logger.info(f"Queued synthesis job {job_id}: {len(pages)} pages, voice {voice_name}.")
+        self._wake.set()
+        return self.status(job_id), True
+
+    def _reuse(self, conn, job_id, state):
+        """
+        True if the existing job can serve a duplicate submission. A finished
+        job whose pages did not all succeed is queued again for those pages.
+        """
+        if state in ('queued', 'running'):
+            return True
+        pages = conn.execute("SELECT state, result FROM synthesis_job_pages WHERE job_id = ?", (job_id,)).fetchall()
+        results = [json.loads(page['result']) for page in pages if page['state'] == 'done']
+        if self.result_is_valid is not None and results and not self.result_is_valid(results):
+            return False
+        if len(results) == len(pages):
+            return True
+
+        conn.execute(
+            "UPDATE synthesis_job_pages SET state = 'pending', status_code = NULL, result = NULL, finished_at = NULL"
+            " WHERE job_id = ? AND state != 'done'", (job_id,)
+        )
+        conn.execute(
+            "UPDATE synthesis_jobs SET state = 'queued', attempts = 0, error = NULL, finished_at = NULL,"
+            " lease_owner = NULL, lease_expires_at = NULL WHERE job_id = ?", (job_id,)
+        )
+        logger.info(f"Re-queued {len(pages) - len(results)} unfinished pages of synthesis job {job_id}.")
+        return True
+
+    def status(self, job_id):
+        """The job with per-page progress and the results of finished pages, or None if unknown."""
+        conn = self._connect()
+        job = conn.execute("SELECT * FROM synthesis_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        pages = []
+        counts = {'pending': 0, 'done': 0, 'failed': 0}
+        for row in conn.execute(
+            "SELECT page_index, page_number, state, status_code, result FROM synthesis_job_pages"
+            " WHERE job_id = ? ORDER BY page_index", (job_id,)
+        ):
+            counts[row['state']] += 1
+            page = {"pageIndex": row['page_index'], "pageNumber": json.loads(row['page_number']), "state": row['state']}
+            if row['result'] is not None:
+                page["statusCode"] = row['status_code']
+                page["result"] = json.loads(row['result'])
+            pages.append(page)
+        return {
+            "jobId": job['job_id'],
+            "state": job['state'],
+            "documentId": job['document_id'] or None,
+            "contentHash": job['content_hash'],
+            "voiceName": job['voice_name'],
+            "languageCode": job['language_code'],
+            "audioConfig": json.loads(job['audio_config']) if job['audio_config'] else None,
+            "pageCount": job['page_count'],
+            "pagesDone": counts['done'],
+            "pagesFailed": counts['failed'],
+            "pagesPending": counts['pending'],
+            "attempts": job['attempts'],
+            "error": job['error'],
+            "createdAt": job['created_at'],
+            "startedAt": job['started_at'],
+            "finishedAt": job['finished_at'],
+            "pages": pages,
+        }
+
+    def stats(self):
+        """Number of jobs in each state, for every worker on the node."""
+        counts = dict.fromkeys(JOB_STATES, 0)
+        for row in self._connect().execute("SELECT state, COUNT(*) AS jobs FROM synthesis_jobs GROUP BY state"):
+            counts[row['state']] = row['jobs']
+        return counts
+
+    # --- Job threads ---
+    def start_workers(self):
+        """Starts this process's job threads; once per process, so it is safe to call on every submit."""
+        if self.workers <= 0 or self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._wake = threading.Event()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'synthesis-job-{i}', daemon=True).start()
+        logger.info(f"Started {self.workers} synthesis job threads (pid {os.getpid()}).")
+
+    def _work(self):
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        while True:
+            try:
+                job = self._claim(owner)
+                if job is None:
+                    self._cleanup()
+                    self._wake.wait(JOB_POLL_SECONDS)
+                    self._wake.clear()
+                    continue
+                self._run(job, owner)
+            except Exception as e:
+                logger.error(f"Synthesis job thread error: {e}", exc_info=True)
+                time.sleep(JOB_POLL_SECONDS)
+
+    def _claim(self, owner):
+        """Takes the lease on the next runnable job: queued, or running under an expired lease."""
+        conn = self._connect()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = conn.execute(
+                    "SELECT * FROM synthesis_jobs WHERE state = 'queued'"
+                    " OR (state = 'running' AND lease_expires_at < ?)"
+                    " ORDER BY priority, created_at LIMIT 1", (now,)
+                ).fetchone()
+                if job is None:
+                    conn.execute("COMMIT")
+                    return None
+                if job['attempts'] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE synthesis_jobs SET state = 'failed', error = ?, finished_at = ?, lease_owner = NULL"
+                        " WHERE job_id = ?",
+                        (f"Gave up after {job['attempts']} attempts.", now, job['job_id'])
+                    )
+                    conn.execute("COMMIT")
+                    logger.warning(f"Synthesis job {job['job_id']} failed after {job['attempts']} attempts.")
+                    continue
+                conn.execute(
+                    "UPDATE synthesis_jobs SET state = 'running', attempts = attempts + 1, lease_owner = ?,"
+                    " lease_expires_at = ?, started_at = COALESCE(started_at, ?) WHERE job_id = ?",
+                    (owner, now + self.lease_seconds, now, job['job_id'])
+                )
+                conn.execute("COMMIT")
+                if job['state'] == 'running':
+                    logger.info(f"Resuming synthesis job {job['job_id']} after its lease expired.")
+                # Jobs queued before audio configs were stored have none; start_page falls back to the default.
+                return {**dict(job), "audio_config": json.loads(job['audio_config']) if job['audio_config'] else None}
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _renew_lease(self, conn, job_id, owner):
+        return conn.execute(
+            "UPDATE synthesis_jobs SET lease_expires_at = ? WHERE job_id = ? AND lease_owner = ?",
+            (time.time() + self.lease_seconds, job_id, owner)
+        ).rowcount == 1
+
+    def _run(self, job, owner):
+        conn = self._connect()
+        job_id = job['job_id']
+        pending = [
+            {"page_index": row['page_index'], "page_number": json.loads(row['page_number']),
+             "paragraphs": json.loads(row['paragraphs'])}
+            for row in conn.execute(
+                "SELECT page_index, page_number, paragraphs FROM synthesis_job_pages"
+                " WHERE job_id = ? AND state != 'done' ORDER BY page_index", (job_id,)
+            )
+        ]
+        futures = {self.start_page(job, page): page for page in pending}
+
+        while futures:
+            finished, _ = wait(futures, timeout=self.lease_seconds / 3, return_when=FIRST_COMPLETED)
+            for future in finished:
+                page = futures.pop(future)
+                try:
+                    page_response, status_code = future.result()
+                except Exception as e:
+                    logger.error(f"Synthesis job {job_id} page {page['page_index']} failed: {e}", exc_info=True)
+                    page_response, status_code = {"pageNumber": page['page_number'], "error": str(e)}, 500
+                conn.execute(
+                    "UPDATE synthesis_job_pages SET state = ?, status_code = ?, result = ?, finished_at = ?"
+                    " WHERE job_id = ? AND page_index = ?",
+                    ('done' if status_code == 200 else 'failed', status_code,
+                     json.dumps(page_response, ensure_ascii=False), time.time(), job_id, page['page_index'])
+                )
+            if not self._renew_lease(conn, job_id, owner):
+                # Another worker took over after our lease ran out; it will finish the job.
+                # Pages not started yet are dropped, and the thread waits for the rest so it
+                # does not claim more work while they still hold the page pool.
+                logger.warning(f"Lost the lease on synthesis job {job_id}; leaving it to its new owner.")
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+                return
+
+        done, failed = conn.execute(
+            "SELECT SUM(state = 'done'), SUM(state = 'failed') FROM synthesis_job_pages WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        state = 'failed' if failed and not done else 'done'
+        conn.execute(
+            "UPDATE synthesis_jobs SET state = ?, error = ?, finished_at = ?, lease_owner = NULL, lease_expires_at = NULL"
+            " WHERE job_id = ? AND lease_owner = ?",
+            (state, "Every page failed to synthesize." if state == 'failed' else None, time.time(), job_id, owner)
+        )
+        logger.info(f"Synthesis job {job_id} {state}: {done or 0} pages done, {failed or 0} failed.")
+
+    def _delete_jobs(self, conn, job_ids):
+        for job_id in job_ids:
+            conn.execute("DELETE FROM synthesis_job_pages WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM synthesis_jobs WHERE job_id = ?", (job_id,))
+
+    def _cleanup(self):
+        """Drops jobs that finished more than retention_seconds ago; at most once a minute per process."""
+        if time.monotonic() - self._cleaned_at < CLEANUP_INTERVAL_SECONDS:
+            return
+        self._cleaned_at = time.monotonic()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [
+                row['job_id'] for row in conn.execute(
+                    "SELECT job_id FROM synthesis_jobs WHERE finished_at < ?", (time.time() - self.retention_seconds,)
+                )
+            ]
+            self._delete_jobs(conn, expired)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if expired:
+            logger.info(f"Removed {len(expired)} finished synthesis jobs.")
+
+
+def synthesis_job_queue_from_env(start_page, result_is_valid=None):
+    """Builds the SynthesisJobQueue configured through SYNTHESIS_JOB* environment variables."""
+    return SynthesisJobQueue(
+        path=os.environ.get('SYNTHESIS_JOBS_PATH', DEFAULT_SYNTHESIS_JOBS_PATH),
+        start_page=start_page,
+        workers=int(os.environ.get('SYNTHESIS_JOB_WORKERS', DEFAULT_SYNTHESIS_JOB_WORKERS)),
+        lease_seconds=float(os.environ.get('SYNTHESIS_JOB_LEASE_SECONDS', DEFAULT_SYNTHESIS_JOB_LEASE_SECONDS)),
+        max_attempts=int(os.environ.get('SYNTHESIS_JOB_MAX_ATTEMPTS', DEFAULT_SYNTHESIS_JOB_MAX_ATTEMPTS)),
+        retention_seconds=float(
+            os.environ.get('SYNTHESIS_JOB_RETENTION_SECONDS', DEFAULT_SYNTHESIS_JOB_RETENTION_SECONDS)
+        ),
+        result_is_valid=result_is_valid,
+    )
@@ -0,0 +1,17 @@
+"""
+main.py builds its caches at import time, so their state files are pointed at
+a temporary directory before any test imports it.
+"""
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+STATE_DIR = tempfile.mkdtemp(prefix='read_serene_test_')
+os.environ.setdefault('AUDIO_CACHE_PATH', os.path.join(STATE_DIR, 'audio.sqlite3'))
+os.environ.setdefault('PAGE_AUDIO_CACHE_PATH', os.path.join(STATE_DIR, 'page_audio.sqlite3'))
+os.environ.setdefault('PREWARM_STATE_PATH', os.path.join(STATE_DIR, 'prewarm.sqlite3'))
+os.environ.setdefault('SYNTHESIS_JOBS_PATH', os.path.join(STATE_DIR, 'synthesis_jobs.sqlite3'))
+os.environ.setdefault('METRICS_DIR', os.path.join(STATE_DIR, 'metrics'))
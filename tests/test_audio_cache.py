@@ -0,0 +1,111 @@
+"""
+The audio cache keeps running byte totals instead of summing the table on
+every put; they must stay equal to what is stored, through every way entries
+are replaced, evicted, expired and discarded.
+"""
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+import audio_cache as audio_cache_module
+from audio_cache import AudioCache
+from conftest import STATE_DIR
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(audio_cache_module.time, 'time', clock.time)
+    return clock
+
+
+def new_cache(**limits):
+    path = os.path.join(tempfile.mkdtemp(dir=STATE_DIR), 'audio.sqlite3')
+    return AudioCache(path, **dict(dict(max_bytes=10_000, ttl_seconds=3600), **limits))
+
+
+def stored(cache):
+    conn = cache._connect()
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio_entries").fetchone()[0]
+    partitions = dict(conn.execute(
+        "SELECT partition, SUM(size) FROM audio_entries GROUP BY partition"
+    ).fetchall())
+    recorded = {
+        partition: size
+        for partition, size in conn.execute("SELECT partition, bytes FROM audio_partitions").fetchall() if size
+    }
+    assert cache.stats()["bytes"] == total
+    assert recorded == partitions
+    return total
+
+
+def test_running_totals_follow_every_change(clock):
+    cache = new_cache(partition_max_bytes=4_000)
+    for index in range(6):
+        cache.put(f'a{index}', b'x' * 1_000, partition='doc-a')
+        cache.put(f'b{index}', b'x' * 1_500, partition='doc-b')
+        clock.now += 1
+    cache.put('a5', b'x' * 500, partition='doc-a')  # replaced in place
+    assert stored(cache) <= 10_000
+    assert cache.partition_stats()['doc-a']['bytes'] <= 4_000
+
+    cache.discard(['a5', 'b5', 'missing'])
+    stored(cache)
+
+    clock.now += 3600 + 1
+    cache.put('fresh', b'x' * 100, partition='doc-a')
+    assert stored(cache) == 100
+    assert cache.stats()["expirations"] > 0
+
+
+def test_eviction_keeps_recently_read_entries(clock):
+    cache = new_cache(max_bytes=3_000)
+    for key in ('old', 'read', 'new'):
+        cache.put(key, b'x' * 1_000)
+        clock.now += audio_cache_module.LAST_ACCESS_RESOLUTION_SECONDS + 1
+    assert cache.get('old') is not None
+
+    cache.put('newest', b'x' * 1_000)
+    assert cache.contains('old')
+    assert not cache.contains('read')
+    assert stored(cache) == 3_000
+
+
+def test_reads_are_counted_without_a_write_per_read(clock):
+    cache = new_cache()
+    cache.put('key', b'audio')
+    for _ in range(10):
+        assert cache.get('key') == b'audio'
+    assert cache.get('missing') is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (10, 1)
+
+
+def test_existing_cache_is_counted_once():
+    path = os.path.join(tempfile.mkdtemp(dir=STATE_DIR), 'audio.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE audio_entries (key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL,"
+        " created_at REAL NOT NULL, last_access REAL NOT NULL, partition TEXT NOT NULL DEFAULT '')"
+    )
+    conn.executemany(
+        "INSERT INTO audio_entries VALUES (?, ?, ?, ?, ?, ?)",
+        [(f'k{index}', b'x' * 700, 700, 1.0, 1.0, 'doc') for index in range(3)]
+    )
+    conn.commit()
+    conn.close()
+
+    cache = AudioCache(path, max_bytes=10_000, ttl_seconds=0)
+    assert stored(cache) == 2_100
+    assert AudioCache(path, max_bytes=10_000, ttl_seconds=0).stats()["bytes"] == 2_100
@@ -0,0 +1,37 @@
+"""
+Malformed /synthesize-chapter-audio requests are rejected with 400 before
+anything is synthesized, whatever JSON types they carry.
+"""
+import pytest
+
+import main
+
+API_KEY = 'test-api-key'
+PARAGRAPHS = [{"pageNumber": 1, "paragraphIndexOnPage": 0, "paragraphType": "narration", "text": "Hello."}]
+VALID = {"chapterParagraphs": PARAGRAPHS, "voiceName": "en-US-Wavenet-E", "languageCode": "en-US"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('RAILWAY_APP_API_KEY', API_KEY)
+    return main.app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    ["not", "an", "object"],
+    dict(VALID, priority=["current"]),
+    dict(VALID, audioEncoding=["OGG_OPUS"]),
+    dict(VALID, audioEncoding={"name": "MP3"}),
+    dict(VALID, sampleRateHertz=[24000]),
+    dict(VALID, sampleRateHertz="24000"),
+    dict(VALID, documentId=["doc"]),
+    dict(VALID, voiceName=["en-US-Wavenet-E"]),
+    dict(VALID, chapterParagraphs=["Hello."]),
+    dict(VALID, chapterParagraphs=[None]),
+    dict(VALID, chapterParagraphs=[dict(PARAGRAPHS[0], pageNumber=[1])]),
+    dict(VALID, chapterParagraphs=[dict(PARAGRAPHS[0], text={"value": "Hello."})]),
+])
+def test_malformed_request_is_rejected(client, body):
+    response = client.post('/synthesize-chapter-audio', json=body, headers={'X-API-Key': API_KEY})
+    assert response.status_code == 400, response.get_data(as_text=True)
+    assert response.get_json()["error"]
@@ -0,0 +1,99 @@
+"""
+Edits to a document must drop the audio of paragraphs that no longer appear
+anywhere in it, once per revision, however the worker came to load it.
+"""
+import os
+import tempfile
+
+import pytest
+
+import main
+from audio_cache import AudioCache
+from conftest import STATE_DIR
+from document_cache import CachedDocument, DocumentCache
+
+VOICE = ("en-US-Wavenet-E", "en-US")
+REPEATED = "<p>The rain had not stopped for three days.</p>"
+CUT = "<p>Mara counted the bells from the harbour and lost track at nine.</p>"
+ADDED = "<p>Downstairs, the kettle began to sing.</p>"
+
+
+def make_document(revision_id, first_chapter, second_chapter):
+    parsed = {"books": [{"id": "book-1", "title": "Book", "chapters": [
+        {"id": "chapter-1", "number": 1, "title": "One", "content": first_chapter},
+        {"id": "chapter-2", "number": 2, "title": "Two", "content": second_chapter},
+    ]}]}
+    return CachedDocument("doc-1", revision_id, parsed)
+
+
+def keys(html):
+    return main.chapter_segment_keys(html, [VOICE], main.PREWARM_AUDIO_CONFIGS)
+
+
+def cached(cache, html):
+    """True if every pre-warmed encoding of html is cached, False if none is."""
+    found = {cache.contains(key) for key in keys(html)}
+    assert len(found) == 1, "encodings of one paragraph were invalidated differently"
+    return found.pop()
+
+
+@pytest.fixture
+def audio_cache(monkeypatch):
+    cache = AudioCache(os.path.join(tempfile.mkdtemp(dir=STATE_DIR), 'audio.sqlite3'), max_bytes=10**8, ttl_seconds=3600)
+    monkeypatch.setattr(main, 'audio_cache', cache)
+    monkeypatch.setattr(main, 'PREWARM_VOICES', [VOICE])
+    for html in (REPEATED, CUT, ADDED):
+        for key in keys(html):
+            cache.put(key, b'audio')
+    return cache
+
+
+def test_edit_drops_only_audio_no_chapter_still_uses(audio_cache):
+    main.invalidate_changed_chapter_audio(make_document("r1", REPEATED + CUT, REPEATED))
+    main.invalidate_changed_chapter_audio(make_document("r2", ADDED, REPEATED))
+
+    assert not cached(audio_cache, CUT)
+    assert cached(audio_cache, REPEATED)
+    assert audio_cache.document_revision("doc-1")[0] == "r2"
+
+
+def test_revision_is_applied_once(audio_cache):
+    main.invalidate_changed_chapter_audio(make_document("r1", CUT, REPEATED))
+    main.invalidate_changed_chapter_audio(make_document("r2", ADDED, REPEATED))
+    for key in keys(CUT):
+        audio_cache.put(key, b'audio')
+
+    # A second worker loading r2, or a stale worker still holding r1, changes nothing.
+    main.invalidate_changed_chapter_audio(make_document("r2", ADDED, REPEATED))
+    assert audio_cache.advance_document_revision("doc-1", "r1", "r2", {}, keys(CUT)) is None
+    assert cached(audio_cache, CUT)
+
+
+def test_reload_after_eviction_is_checked(audio_cache):
+    revisions = {"doc-1": "r1", "doc-2": "r1"}
+    loaded = []
+
+    def fetch_document(document_id):
+        return {"revisionId": revisions[document_id]}
+
+    def parse(document, document_id):
+        first_chapter = CUT if document["revisionId"] == "r1" else ADDED
+        return make_document(document["revisionId"], first_chapter, REPEATED).parsed, {}
+
+    def on_load(document):
+        loaded.append((document.document_id, document.revision_id))
+        if document.document_id == "doc-1":
+            main.invalidate_changed_chapter_audio(document)
+
+    cache = DocumentCache(
+        fetch_revision=lambda document_id: revisions[document_id], fetch_document=fetch_document, parse=parse,
+        revalidate_after_seconds=60, max_stale_seconds=60, on_load=on_load, max_documents=1,
+    )
+    cache.get("doc-1")
+    cache.get("doc-2")  # evicts doc-1 while it still reads r1
+    revisions["doc-1"] = "r2"
+    cache.get("doc-1")
+
+    assert loaded == [("doc-1", "r1"), ("doc-2", "r1"), ("doc-1", "r2")]
+    assert not cached(audio_cache, CUT)
+    assert cached(audio_cache, REPEATED)
@@ -0,0 +1,111 @@
+"""
+Pre-warm must fill the audio cache with exactly the texts a reader's request
+looks up, whatever page breaks the reader's screen produces.
+"""
+import os
+import random
+import tempfile
+
+import pytest
+
+import main
+from audio_codecs import codec_for, make_audio_config
+from conftest import STATE_DIR
+from prewarm import PrewarmJob, chapter_paragraphs_for_synthesis
+
+VOICE = ("en-US-Wavenet-E", "en-US")
+# What frontend.php sends: Ogg Opus where the browser plays it, otherwise the MP3 default.
+FRONTEND_AUDIO_CONFIGS = [make_audio_config('OGG_OPUS'), make_audio_config()]
+LONG_PARAGRAPH = " ".join(f"Sentence {i} runs on for a while so the paragraph outgrows one request." for i in range(120))
+
+CHAPTER_HTML = "".join([
+    "<p>The rain had not stopped for three days.</p>",
+    "<p>Mara counted the bells from the harbour and lost track at nine.</p>",
+    '<p>"Are you coming?" her brother called from the stairs.</p>',
+    "<p><em>Not yet,</em></p>",
+    f"<p>{LONG_PARAGRAPH}</p>",
+    "<p>The rain had not stopped for three days.</p>",
+    "<p>She closed the shutters, one by one, and listened.</p>",
+    '<p>"Mara!"</p>',
+    "<p>Downstairs, the kettle began to sing.</p>",
+    "<p>It was the last quiet evening of the year.</p>",
+])
+
+
+class RecordingCache:
+    """Stands in for the audio cache: nothing is cached, every lookup is recorded."""
+
+    def __init__(self):
+        self.looked_up = []
+
+    def contains(self, key):
+        self.looked_up.append(key)
+        return False
+
+
+def prewarm_keys(chapter_html, audio_configs=main.PREWARM_AUDIO_CONFIGS):
+    synthesized = []
+    job = PrewarmJob(
+        audio_cache=RecordingCache(),
+        cache_key_for=main.tts_cache_key,
+        synthesize=lambda text, voice_name, language_code, audio_config: synthesized.append(
+            main.tts_cache_key(text, voice_name, language_code, audio_config)
+        ),
+        part_texts=main.paragraph_part_texts,
+        state_path=os.path.join(tempfile.mkdtemp(dir=STATE_DIR), 'prewarm.sqlite3'),
+        max_requests_per_second=0,
+    )
+    status = job.run({"books": [{"chapters": [{"id": "chapter-1", "content": chapter_html}]}]}, [VOICE], audio_configs)
+    assert status["state"] == "done"
+    return set(synthesized)
+
+
+def paginate(paragraphs, rng):
+    """Splits the chapter into pages at random paragraph boundaries, as the frontend's layout would."""
+    page_number, index_on_page, records = 1, 0, []
+    for paragraph in paragraphs:
+        if records and rng.random() < 0.35:
+            page_number, index_on_page = page_number + 1, 0
+        records.append(dict(paragraph, pageNumber=page_number, paragraphIndexOnPage=index_on_page))
+        index_on_page += 1
+    return records
+
+
+def request_part_keys(records, audio_config):
+    """The per-paragraph keys a synthesis request for records looks up, segment by segment."""
+    keys = set()
+    for _, page_paragraphs in main.group_paragraphs_by_page(records):
+        for segment in main.process_paragraphs_for_synthesis(page_paragraphs):
+            keys.update(
+                main.tts_cache_key(text, *VOICE, audio_config) for text in main.segment_part_texts(segment)
+            )
+    return keys
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_prewarm_keys_match_request_keys_for_any_page_layout(seed):
+    paragraphs = chapter_paragraphs_for_synthesis(CHAPTER_HTML)
+    request_keys = set()
+    for audio_config in FRONTEND_AUDIO_CONFIGS:
+        request_keys |= request_part_keys(paginate(paragraphs, random.Random(seed)), audio_config)
+    assert request_keys == prewarm_keys(CHAPTER_HTML)
+
+
+@pytest.mark.parametrize("audio_config", FRONTEND_AUDIO_CONFIGS, ids=lambda config: config['audio_encoding'])
+def test_prewarmed_page_is_served_without_synthesis(monkeypatch, audio_config):
+    codec = codec_for(audio_config)
+    silence, _ = codec.silence(codec.default_format, 400)
+    for key in prewarm_keys(CHAPTER_HTML, [audio_config]):
+        main.audio_cache.put(key, silence)
+
+    def no_synthesis(*args, **kwargs):
+        raise AssertionError("Text-to-Speech was called for a pre-warmed page")
+
+    monkeypatch.setattr(main, '_synthesize_speech', no_synthesis)
+    records = paginate(chapter_paragraphs_for_synthesis(CHAPTER_HTML), random.Random(99))
+    for page_number, page_paragraphs in main.group_paragraphs_by_page(records):
+        page_response, status_code = main.synthesize_page_audio(
+            page_number, page_paragraphs, *VOICE, audio_config=audio_config
+        )
+        assert status_code == 200 and page_response["success"], page_response
+        assert not page_response["segmentErrors"]
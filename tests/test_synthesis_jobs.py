@@ -0,0 +1,96 @@
+"""
+Background chapter jobs: a page that failed is synthesized again when the
+chapter is submitted again, and a job thread that loses its lease stops
+starting pages for a job that now belongs to another worker.
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from conftest import STATE_DIR
+from synthesis_jobs import SynthesisJobQueue
+
+PAGES = [(1, [{"paragraphType": "narration", "text": "One."}]), (2, [{"paragraphType": "narration", "text": "Two."}])]
+AUDIO_CONFIG = {"audio_encoding": "MP3"}
+
+
+def new_queue(start_page, workers=1):
+    return SynthesisJobQueue(
+        path=os.path.join(tempfile.mkdtemp(dir=STATE_DIR), 'jobs.sqlite3'), start_page=start_page, workers=workers,
+        lease_seconds=30, max_attempts=3, retention_seconds=3600, result_is_valid=lambda results: True,
+    )
+
+
+def finished(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.status(job_id)
+        if status['state'] in ('done', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {queue.status(job_id)}")
+
+
+def test_resubmitting_retries_failed_pages():
+    calls, failing = [], {2}
+
+    def start_page(job, page):
+        calls.append(page['page_number'])
+        future = Future()
+        if page['page_number'] in failing:
+            future.set_exception(RuntimeError("503 Service Unavailable"))
+        else:
+            future.set_result(({"pageNumber": page['page_number'], "success": True}, 200))
+        return future
+
+    queue = new_queue(start_page)
+    queue.start_workers()
+    job, _ = queue.submit(PAGES, "en-US-Wavenet-E", "en-US", 0, AUDIO_CONFIG, 'doc')
+    status = finished(queue, job['jobId'])
+    assert (status['state'], status['pagesDone'], status['pagesFailed']) == ('done', 1, 1)
+
+    failing.clear()
+    retried, created = queue.submit(PAGES, "en-US-Wavenet-E", "en-US", 0, AUDIO_CONFIG, 'doc')
+    assert not created and retried['jobId'] == job['jobId']
+    assert retried['pagesFailed'] == 0
+    status = finished(queue, job['jobId'])
+    assert (status['state'], status['pagesDone'], status['pagesFailed']) == ('done', 2, 0)
+    assert calls == [1, 2, 2]
+
+    again, created = queue.submit(PAGES, "en-US-Wavenet-E", "en-US", 0, AUDIO_CONFIG, 'doc')
+    assert not created and again['state'] == 'done' and calls == [1, 2, 2]
+
+
+def test_lost_lease_cancels_pages_not_started():
+    executor = ThreadPoolExecutor(max_workers=1)
+    release, started = threading.Event(), []
+
+    def synthesize(page):
+        started.append(page['page_number'])
+        release.wait(10)
+        return {"pageNumber": page['page_number']}, 200
+
+    def start_page(job, page):
+        if page['page_index'] == 0:
+            # The first page finishes at once, after another worker has taken the lease.
+            queue._connect().execute("UPDATE synthesis_jobs SET lease_owner = 'other-worker'")
+            future = Future()
+            future.set_result(({"pageNumber": page['page_number']}, 200))
+            return future
+        return executor.submit(synthesize, page)
+
+    pages = PAGES + [(3, [{"paragraphType": "narration", "text": "Three."}])]
+    queue = new_queue(start_page, workers=0)
+    queue.submit(pages, "en-US-Wavenet-E", "en-US", 0, AUDIO_CONFIG, 'doc')
+    job = queue._claim('this-worker')
+    runner = threading.Thread(target=queue._run, args=(job, 'this-worker'))
+    runner.start()
+
+    runner.join(0.5)
+    assert runner.is_alive(), "returned while a page it started was still running"
+    release.set()
+    runner.join(10)
+    executor.shutdown()
+    assert started == [2]
@@ -0,0 +1,252 @@
+"""
+Admission control for Text-to-Speech calls: a token bucket matched to the
+project quota, an adaptive concurrency limit, priority classes, and jittered
+retries of throttling errors.
+
+Calls wait in one queue per worker ordered by priority and then arrival:
+
+    current     the page a listener is waiting on
+    upcoming    later pages of the same chapter, or a client's prefetch
+    background  the pre-warm job
+
+A call starts when it is first in the queue, a concurrency slot is free and the
+bucket has a token. The concurrency limit grows by about one per limit's worth
+of successful calls and halves (at most once per backoff period) when Google
+answers 429 or 503, so a worker settles just under what the quota allows. A
+throttled call gives its slot back, sleeps for a random time up to
+backoff_base * 2^attempt (full jitter) and queues again in its original place.
+"""
+import os
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- Scheduler Configuration ---
+PRIORITY_CURRENT = 0
+PRIORITY_UPCOMING = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_CURRENT: 'current', PRIORITY_UPCOMING: 'upcoming', PRIORITY_BACKGROUND: 'background'}
+PRIORITIES_BY_NAME = {name: priority for priority, name in PRIORITY_NAMES.items()}
+
+# Google's default Text-to-Speech quota is 1000 requests per minute per project.
+DEFAULT_TTS_QUOTA_PER_MINUTE = 1000
+DEFAULT_TTS_MAX_CONCURRENCY = 8
+DEFAULT_TTS_MIN_CONCURRENCY = 1
+DEFAULT_TTS_MAX_ATTEMPTS = 4
+DEFAULT_TTS_BACKOFF_BASE_SECONDS = 0.5
+DEFAULT_TTS_BACKOFF_MAX_SECONDS = 8.0
+
+_current_priority = contextvars.ContextVar('read_serene_tts_priority', default=PRIORITY_CURRENT)
+
+
+@contextmanager
+def tts_priority(priority):
+    """Runs a block, and any work it hands to a pool with Metrics.submit(), at the given priority."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_tts_priority():
+    return _current_priority.get()
+
+
+class TokenBucket:
+    """Refills rate_per_second tokens per second up to burst. Not thread-safe; the scheduler locks it."""
+
+    def __init__(self, rate_per_second, burst):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def seconds_until_available(self):
+        """0 if a token can be taken now, else how long until one can."""
+        if self.rate_per_second <= 0:
+            return 0.0
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_second
+
+    def take(self):
+        if self.rate_per_second > 0:
+            self._tokens -= 1
+
+
+class TtsScheduler:
+    """
+    Per-worker admission control for Text-to-Speech calls; see the module docstring.
+
+    is_throttling_error(exception) decides which failures are retried and shrink
+    the concurrency limit. metrics (a metrics.Metrics, optional) receives queue
+    depth, wait time, retry and limit metrics.
+    """
+
+    def __init__(self, rate_per_second, burst, max_concurrency, min_concurrency, max_attempts,
+                 backoff_base_seconds, backoff_max_seconds, is_throttling_error, metrics=None):
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.is_throttling_error = is_throttling_error
+        self.metrics = metrics
+        self._limit = float(max_concurrency)
+        self._last_decrease_at = 0.0
+        self._in_flight = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._counts = {"calls": 0, "throttled": 0, "retries": 0, "failed": 0}
+        self._gauge_set('tts_concurrency_limit', max_concurrency)
+
+    def call(self, function, priority=None):
+        """
+        Runs function() once admitted and returns its result, retrying throttling
+        errors up to max_attempts. priority defaults to the tts_priority() in effect.
+        """
+        if priority is None:
+            priority = current_tts_priority()
+        priority_name = PRIORITY_NAMES[priority]
+        sequence = next(self._sequence)
+        self._count('calls')
+
+        for attempt in range(self.max_attempts):
+            self._acquire(priority, sequence)
+            try:
+                result = function()
+            except Exception as e:
+                throttled = self.is_throttling_error(e)
+                self._release(throttled)
+                if not throttled:
+                    raise
+                self._count('throttled')
+                self._inc('tts_throttled_total', priority=priority_name)
+                if attempt + 1 == self.max_attempts:
+                    self._count('failed')
+                    raise
+                delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+                logger.warning(
+                    f"Text-to-Speech throttled ({e.__class__.__name__}); retry {attempt + 1} of "
+                    f"{self.max_attempts - 1} in {delay:.2f}s at {priority_name} priority."
+                )
+                self._count('retries')
+                self._inc('tts_retries_total', priority=priority_name)
+                time.sleep(delay)
+                continue
+            self._release(False)
+            return result
+
+    def _acquire(self, priority, sequence):
+        priority_name = PRIORITY_NAMES[priority]
+        entry = (priority, sequence)
+        started = time.perf_counter()
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            self._gauge_add('tts_queue_depth', 1, priority=priority_name)
+            try:
+                while True:
+                    timeout = None
+                    if self._queue[0] == entry and self._in_flight < int(self._limit):
+                        timeout = self.bucket.seconds_until_available()
+                        if timeout == 0:
+                            break
+                    self._condition.wait(timeout)
+                heapq.heappop(self._queue)
+                self.bucket.take()
+                self._in_flight += 1
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                raise
+            finally:
+                self._gauge_add('tts_queue_depth', -1, priority=priority_name)
+                # The next caller in line may be able to start too.
+                self._condition.notify_all()
+
+        waited = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.observe('tts_queue_wait_seconds', waited, priority=priority_name)
+            self.metrics.record_stage('tts_queue', waited)
+
+    def _release(self, throttled):
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease_at >= self.backoff_base_seconds:
+                    self._limit = max(self.min_concurrency, self._limit / 2)
+                    self._last_decrease_at = now
+                    logger.info(f"Text-to-Speech concurrency limit lowered to {int(self._limit)}.")
+            else:
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            self._gauge_set('tts_concurrency_limit', int(self._limit))
+            self._condition.notify_all()
+
+    def _count(self, name):
+        with self._condition:
+            self._counts[name] += 1
+
+    def _inc(self, name, **labels):
+        if self.metrics is not None:
+            self.metrics.inc(name, **labels)
+
+    def _gauge_add(self, name, amount, **labels):
+        if self.metrics is not None:
+            self.metrics.gauge_add(name, amount, **labels)
+
+    def _gauge_set(self, name, value, **labels):
+        if self.metrics is not None:
+            self.metrics.gauge_set(name, value, **labels)
+
+    def stats(self):
+        with self._condition:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._queue:
+                queued[PRIORITY_NAMES[priority]] += 1
+            return {
+                **self._counts,
+                "queued": queued,
+                "in_flight": self._in_flight,
+                "concurrency_limit": int(self._limit),
+                "max_concurrency": self.max_concurrency,
+                "rate_per_second": self.bucket.rate_per_second,
+            }
+
+
+def tts_scheduler_from_env(is_throttling_error, metrics=None):
+    """
+    Builds the TtsScheduler configured through TTS_* environment variables.
+    TTS_QUOTA_PER_MINUTE is the project-wide quota; each of the WEB_CONCURRENCY
+    workers (same default as gunicorn.conf.py) takes an equal share of it.
+    """
+    workers = max(1, int(os.environ.get('WEB_CONCURRENCY', 2)))
+    quota_per_minute = float(os.environ.get('TTS_QUOTA_PER_MINUTE', DEFAULT_TTS_QUOTA_PER_MINUTE))
+    rate_per_second = quota_per_minute / 60 / workers
+    return TtsScheduler(
+        rate_per_second=rate_per_second,
+        burst=float(os.environ.get('TTS_RATE_BURST', max(1.0, rate_per_second))),
+        max_concurrency=int(os.environ.get('TTS_MAX_CONCURRENCY', DEFAULT_TTS_MAX_CONCURRENCY)),
+        min_concurrency=int(os.environ.get('TTS_MIN_CONCURRENCY', DEFAULT_TTS_MIN_CONCURRENCY)),
+        max_attempts=max(1, int(os.environ.get('TTS_MAX_ATTEMPTS', DEFAULT_TTS_MAX_ATTEMPTS))),
+        backoff_base_seconds=float(os.environ.get('TTS_BACKOFF_BASE_SECONDS', DEFAULT_TTS_BACKOFF_BASE_SECONDS)),
+        backoff_max_seconds=float(os.environ.get('TTS_BACKOFF_MAX_SECONDS', DEFAULT_TTS_BACKOFF_MAX_SECONDS)),
+        is_throttling_error=is_throttling_error,
+        metrics=metrics,
+    )
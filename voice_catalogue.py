@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import threading
+
+from response_encoding import EncodedBody, json_bytes
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# --- Voice Catalogue Configuration ---
+# The Text-to-Speech voice list changes a few times a year, so it is fetched
+# once per worker and served from memory. After VOICE_CATALOGUE_TTL_SECONDS
+# the cached list is still served while a background refresh runs; a failed
+# refresh keeps the old list.
+DEFAULT_VOICE_CATALOGUE_TTL_SECONDS = 6 * 60 * 60
+# Distinct filter combinations kept pre-serialized between refreshes.
+MAX_SERIALIZED_FILTERS = 256
+
+
+def voice_matches(voice, language_code=None, voice_type=None, gender=None):
+    """
+    Filters one entry of the v1/voices response. language_code matches a whole
+    code or its prefix ("en" matches "en-US"); voice_type is a case-insensitive
+    part of the voice name ("Chirp", "Wavenet", "Neural2"); gender is the
+    ssmlGender (MALE, FEMALE or NEUTRAL).
+    """
+    if language_code:
+        language_code = language_code.rstrip('-').lower()
+        if not any(
+            code.lower() == language_code or code.lower().startswith(language_code + '-')
+            for code in voice.get('languageCodes', [])
+        ):
+            return False
+    if voice_type and voice_type.lower() not in voice.get('name', '').lower():
+        return False
+    if gender and voice.get('ssmlGender', '').upper() != gender.upper():
+        return False
+    return True
+
+
+class SerializedVoices(EncodedBody):
+    """One filtered voice list as ready-to-send JSON with its compressed variants."""
+
+    def __init__(self, voices):
+        super().__init__(json_bytes({"voices": voices}))
+        self.voice_count = len(voices)
+
+
+class VoiceCatalogue:
+    """
+    Per-worker cache of the Text-to-Speech voice list.
+
+    fetch_voices() must return the v1/voices response JSON. Filtered views are
+    serialized and compressed once per catalogue version and reused until the
+    next refresh. Concurrent first requests share one upstream fetch.
+    """
+
+    def __init__(self, fetch_voices, ttl_seconds):
+        self.fetch_voices = fetch_voices
+        self.ttl_seconds = ttl_seconds
+        self._voices = None
+        self._fetched_at = None
+        self._serialized = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._fetches = SingleFlight()
+
+    def get(self, language_code=None, voice_type=None, gender=None):
+        """Returns the SerializedVoices for the given filters, fetching the catalogue on first use."""
+        if self._voices is None:
+            self._fetches.do('voices', self._load)
+        elif time.monotonic() - self._fetched_at > self.ttl_seconds:
+            self._refresh_in_background()
+
+        filter_key = (
+            (language_code or '').rstrip('-').lower(),
+            (voice_type or '').lower(),
+            (gender or '').upper(),
+        )
+        # Take the list and its views together so a refresh cannot mix versions.
+        with self._lock:
+            all_voices, serialized_views = self._voices, self._serialized
+        serialized = serialized_views.get(filter_key)
+        if serialized is None:
+            serialized = SerializedVoices([v for v in all_voices if voice_matches(v, *filter_key)])
+            with self._lock:
+                if len(serialized_views) >= MAX_SERIALIZED_FILTERS:
+                    serialized_views.clear()
+                serialized_views[filter_key] = serialized
+        return serialized
+
+    def _load(self):
+        # A caller that missed just as another fetch finished finds the list already there.
+        if self._voices is None:
+            self._refresh()
+
+    def _refresh(self):
+        voices = self.fetch_voices().get('voices', [])
+        with self._lock:
+            self._voices = voices
+            self._fetched_at = time.monotonic()
+            self._serialized = {}
+        logger.info(f"Cached {len(voices)} Text-to-Speech voices.")
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._refresh()
+            except Exception as e:
+                # Keep serving the old list and retry once the TTL passes again.
+                logger.error(f"Background refresh of the voice catalogue failed: {e}", exc_info=True)
+                self._fetched_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, name='voice-catalogue-refresh', daemon=True).start()
+
+
+def voice_catalogue_from_env(fetch_voices):
+    """Builds the VoiceCatalogue configured through VOICE_CATALOGUE_TTL_SECONDS."""
+    return VoiceCatalogue(
+        fetch_voices=fetch_voices,
+        ttl_seconds=int(os.environ.get('VOICE_CATALOGUE_TTL_SECONDS', DEFAULT_VOICE_CATALOGUE_TTL_SECONDS)),
+    )